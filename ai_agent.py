@@ -2,10 +2,99 @@
 
 import requests
 import logging
-from openai import OpenAI, AzureOpenAI
+import json
+import time
+import httpx
+from abc import ABC, abstractmethod
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from openai import OpenAI, AzureOpenAI, Timeout, DefaultHttpxClient, RateLimitError
+from response_cache import ResponseCache, create_response_cache
+from provider_router import create_router
+from provider_governor import RateLimited, create_governor, report
+from metrics import AI_REQUEST_SECONDS, AI_REQUESTS
+from chunker import estimate_tokens
+from logging_setup import describe_payload
+
+# Výchozí nastavení HTTP spojení k poskytovatelům, lze přepsat v sekci 'http'
+# konfigurace nebo v podsekci 'http' konkrétního poskytovatele
+DEFAULT_HTTP_SETTINGS = {
+    'connect_timeout': 10,   # s, navázání spojení
+    'read_timeout': 120,     # s, čekání na odpověď
+    'pool_maxsize': 10,      # max. počet udržovaných spojení na poskytovatele
+    'max_retries': 2,        # opakování jen při selhání spojení
+}
+
+# Teplota, se kterou jednotlivá API volají model (je součástí klíče cache)
+PROVIDER_TEMPERATURES = {
+    'openrouter': 0.8,
+    'openai': 1,
+    'azure': 1,
+    'ollama': None,  # výchozí teplota modelu
+}
+
+class StreamInterrupted(Exception):
+    """Streamovaná odpověď se přerušila po první přijaté části - neúplná odpověď se nesmí použít"""
+
+def get_http_settings(config, provider_config):
+    """Sloučí výchozí, globální a poskytovatelské nastavení HTTP"""
+    settings = dict(DEFAULT_HTTP_SETTINGS)
+    settings.update(config.get('http', {}) or {})
+    settings.update(provider_config.get('http', {}) or {})
+    return settings
+
+def create_http_session(settings):
+    """
+    Vytvoří sdílenou requests.Session s poolem keep-alive spojení.
+
+    Opakuje se jen navázání spojení, ne samotný požadavek - opakovaný POST
+    by u poskytovatele mohl vygenerovat (a zaúčtovat) odpověď dvakrát.
+    """
+    retry = Retry(
+        total=settings['max_retries'],
+        connect=settings['max_retries'],
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=0.5
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings['pool_maxsize'],
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def openai_client_options(settings):
+    """Parametry timeoutu, opakování a poolu pro klienty OpenAI/AzureOpenAI"""
+    return {
+        'timeout': Timeout(settings['read_timeout'], connect=settings['connect_timeout']),
+        'max_retries': settings['max_retries'],
+        'http_client': DefaultHttpxClient(
+            limits=httpx.Limits(
+                max_connections=settings['pool_maxsize'],
+                max_keepalive_connections=settings['pool_maxsize']
+            )
+        ),
+    }
+
+class BaseAIAgent(ABC):
+    def __init__(self, config, use_cache=True):
+        """
+        Společný základ AIAgent a AsyncAIAgent bez I/O - konfigurace
+        poskytovatelů, cache odpovědí, router a governor. Klienty
+        poskytovatelů vytváří potomek v _create_clients.
+
+        Args:
+            config (dict): Konfigurace aplikace
+            use_cache (bool): Vytvořit cache odpovědí podle sekce response_cache
+                konfigurace (False např. pro agenta dávkové fronty)
+        """
+        self.cache = create_response_cache(config) if use_cache else None
 
-class AIAgent:
-    def __init__(self, config):
         # Initialize OpenRouter if enabled
         openrouter_config = config.get('openrouter', {})
         self.openrouter_enabled = openrouter_config.get('enabled', False)
@@ -17,29 +106,298 @@ class AIAgent:
         self.openai_enabled = openai_config.get('enabled', False)
         self.openai_api_key = openai_config.get('api_key', '')
         self.openai_default_model = openai_config.get('default_model', 'gpt-4o-mini')
-        if self.openai_enabled and self.openai_api_key:
-            self.openai_client = OpenAI(api_key=self.openai_api_key)
-        else:
-            self.openai_client = None
-        
+
         # Initialize Ollama if enabled
         ollama_config = config.get('ollama', {})
         self.ollama_enabled = ollama_config.get('enabled', False)
         self.ollama_host = ollama_config.get('host', 'http://localhost:11434')
         self.ollama_default_model = ollama_config.get('default_model', 'deepseek-coder:8b')
-        
+
         # Initialize Azure OpenAI if enabled
         azure_config = config.get('azure_openai', {})
         self.azure_enabled = azure_config.get('enabled', False)
+        self.azure_deployment = azure_config.get('default_model', 'gpt-4o-mini')
+
+        self._create_clients(config)
+
+        # Volitelný router s failoverem mezi poskytovateli
+        self.router = create_router(config, self.available_apis())
+        # Limity souběžnosti a požadavků/tokenů za minutu, opakování po 429
+        self.governor = create_governor(config)
+
+    @abstractmethod
+    def _create_clients(self, config):
+        """Vytvoří HTTP spojení a klienty poskytovatelů (openai_client, azure_client, ...)"""
+
+    def available_apis(self):
+        """API, která jsou zapnutá a nakonfigurovaná"""
+        apis = []
+        if self.openrouter_enabled:
+            apis.append('openrouter')
+        if self.openai_enabled and self.openai_client:
+            apis.append('openai')
+        if self.azure_enabled and self.azure_client:
+            apis.append('azure')
+        if self.ollama_enabled:
+            apis.append('ollama')
+        return apis
+
+    def route(self, api, model):
+        """Seznam (api, model) ke zkoušení - s routerem včetně ekvivalentů a záložních API"""
+        if not self.router:
+            return [(api, model)]
+        return self.router.candidates(api, model, self.default_model)
+
+    def default_model(self, api):
+        """Výchozí model daného API"""
+        return {
+            'openrouter': self.openrouter_default_model,
+            'openai': self.openai_default_model,
+            'azure': self.azure_deployment,
+            'ollama': self.ollama_default_model,
+        }.get(api)
+
+    def _resolve(self, api, model):
+        """API a model dotazu - neznámé API = openai, bez modelu výchozí model API"""
+        if api not in PROVIDER_TEMPERATURES:
+            # Default to OpenAI API if no API specified
+            api = 'openai'
+        return api, model or self.default_model(api)
+
+    def _cache_key(self, api, model, prompt, use_cache):
+        if not use_cache or not self.cache:
+            return None
+        return ResponseCache.make_key(api, model, PROVIDER_TEMPERATURES[api], prompt)
+
+    def _cached(self, key, api, model):
+        """Odpověď z cache, nebo None"""
+        if key is None:
+            return None
+        ai_reply = self.cache.get(key)
+        if ai_reply is not None:
+            logging.info(f"Odpověď pro {api}:{model} nalezena v cache")
+        return ai_reply
+
+    def _store(self, key, ai_reply):
+        if ai_reply and key:
+            self.cache.set(key, ai_reply)
+
+    def _record(self, api, model, start, ok):
+        """Výsledek pokusu pro router - volá se i při výjimce, jinak by zkušební průchod jističe zůstal obsazený"""
+        if self.router:
+            self.router.record(api, model, time.monotonic() - start, ok)
+
+    def _release_rest(self, targets, index):
+        """Uvolní kandidáty routeru za indexem, na které nedošlo"""
+        if self.router:
+            for remaining in targets[index + 1:]:
+                self.router.release(*remaining)
+
+    def _log_failover(self, targets, index):
+        if index + 1 < len(targets):
+            api, model = targets[index]
+            logging.warning(f"Volání {api}:{model} selhalo, zkouším {targets[index + 1][0]}")
+
+class AIAgent(BaseAIAgent):
+    def _create_clients(self, config):
+        openrouter_config = config.get('openrouter', {})
+        self.openrouter_http = get_http_settings(config, openrouter_config)
+        self.openrouter_session = create_http_session(self.openrouter_http)
+
+        openai_config = config.get('openai', {})
+        if self.openai_enabled and self.openai_api_key:
+            self.openai_client = OpenAI(
+                api_key=self.openai_api_key,
+                **openai_client_options(get_http_settings(config, openai_config))
+            )
+        else:
+            self.openai_client = None
+
+        ollama_config = config.get('ollama', {})
+        self.ollama_http = get_http_settings(config, ollama_config)
+        self.ollama_session = create_http_session(self.ollama_http)
+
+        azure_config = config.get('azure_openai', {})
         if self.azure_enabled and azure_config.get('api_key') and azure_config.get('endpoint'):
             self.azure_client = AzureOpenAI(
                 api_key=azure_config['api_key'],
                 api_version=azure_config['api_version'],
-                azure_endpoint=azure_config['endpoint']
+                azure_endpoint=azure_config['endpoint'],
+                **openai_client_options(get_http_settings(config, azure_config))
             )
-            self.azure_deployment = azure_config.get('default_model', 'gpt-4o-mini')
         else:
             self.azure_client = None
+
+    def complete(self, api, model, prompt, use_cache=True):
+        """
+        Jednotný vstupní bod - zavolá poskytovatele podle názvu API.
+
+        Shodný dotaz (API, model, teplota a prompt po normalizaci bílých znaků)
+        se při zapnuté cache vrátí z cache bez volání poskytovatele.
+
+        Args:
+            api (str): openai, openrouter, azure nebo ollama (jinak se použije openai)
+            model (str): Model, None pro výchozí model poskytovatele
+            prompt (str): Text dotazu
+            use_cache (bool): Zda použít cache odpovědí (lze vypnout pro úkol)
+
+        Returns:
+            str: Odpověď modelu, nebo None při chybě
+        """
+        api, model = self._resolve(api, model)
+        key = self._cache_key(api, model, prompt, use_cache)
+        ai_reply = self._cached(key, api, model)
+        if ai_reply is not None:
+            return ai_reply
+
+        targets = self.route(api, model)
+        index = 0
+        try:
+            for index, (target_api, target_model) in enumerate(targets):
+                start = time.monotonic()
+                ai_reply = None
+                try:
+                    ai_reply = self.call_api(target_api, target_model, prompt)
+                finally:
+                    self._record(target_api, target_model, start, bool(ai_reply))
+                if ai_reply:
+                    break
+                self._log_failover(targets, index)
+        finally:
+            self._release_rest(targets, index)
+
+        self._store(key, ai_reply)
+        return ai_reply
+
+    def call_api(self, api, model, prompt):
+        """Zavolá konkrétní API bez cache a routeru, v rámci limitů governoru"""
+        if self.governor:
+            return self.governor.call(api, model, estimate_tokens(prompt),
+                                      lambda: self._call_provider(api, model, prompt))
+        try:
+            return self._call_provider(api, model, prompt)
+        except RateLimited as e:
+            logging.error(f"Limit poskytovatele {api} překročen: {str(e)}")
+            return None
+
+    def _call_provider(self, api, model, prompt):
+        outcome = 'error'
+        start = time.monotonic()
+        try:
+            if api == 'openrouter':
+                ai_reply = self.call_openrouter_api(prompt, model=model)
+            elif api == 'azure':
+                ai_reply = self.call_azure_openai_api(prompt, model=model)
+            elif api == 'ollama':
+                ai_reply = self.call_ollama_api(prompt, model=model)
+            else:
+                ai_reply = self.call_openai_api(prompt, model=model)
+            if ai_reply:
+                outcome = 'ok'
+            return ai_reply
+        except RateLimited:
+            outcome = 'rate_limited'
+            raise
+        finally:
+            AI_REQUEST_SECONDS.observe(time.monotonic() - start, provider=api)
+            AI_REQUESTS.inc(provider=api, outcome=outcome)
+
+    def stream(self, api, model, prompt, use_cache=True):
+        """
+        Stejné jako complete(), ale vrací generátor částí odpovědi tak, jak přicházejí.
+
+        Odpověď z cache se vrátí jako jediná část. Celá odpověď se po dokončení
+        uloží do cache. Při chybě před první částí generátor skončí bez jediné
+        části (zkusí se další poskytovatel routeru).
+
+        Yields:
+            str: Další část textu odpovědi
+
+        Raises:
+            StreamInterrupted: Odpověď se přerušila uprostřed - volající musí
+                zahodit už přijaté části, do cache se nic neuloží
+        """
+        api, model = self._resolve(api, model)
+        key = self._cache_key(api, model, prompt, use_cache)
+        ai_reply = self._cached(key, api, model)
+        if ai_reply is not None:
+            yield ai_reply
+            return
+
+        # Na jiného poskytovatele lze přejít jen před první přijatou částí
+        received = []
+        targets = self.route(api, model)
+        index = 0
+        try:
+            for index, (target_api, target_model) in enumerate(targets):
+                start = time.monotonic()
+                ok = False
+                try:
+                    for chunk in self.stream_api(target_api, target_model, prompt):
+                        received.append(chunk)
+                        yield chunk
+                    ok = bool(received)
+                except StreamInterrupted as e:
+                    logging.error(f"Odpověď od {target_api}:{target_model} se přerušila: {e}")
+                    raise
+                except GeneratorExit:
+                    # Volající přestal číst, poskytovatel za to nemůže
+                    ok = bool(received)
+                    raise
+                finally:
+                    self._record(target_api, target_model, start, ok)
+                if received:
+                    api, model = target_api, target_model
+                    break
+                self._log_failover(targets, index)
+        finally:
+            self._release_rest(targets, index)
+
+        ai_reply = "".join(received)
+        logging.warning(f"Odpověď od {api} API ({model}): {describe_payload(ai_reply)}")
+        self._store(key, ai_reply)
+
+    def stream_api(self, api, model, prompt):
+        """Streamované volání konkrétního API bez cache a routeru, v rámci limitů governoru"""
+        if self.governor:
+            return self.governor.stream(api, model, estimate_tokens(prompt),
+                                        lambda: self._stream_provider(api, model, prompt))
+        return self._stream_without_governor(api, model, prompt)
+
+    def _stream_without_governor(self, api, model, prompt):
+        try:
+            yield from self._stream_provider(api, model, prompt)
+        except RateLimited as e:
+            logging.error(f"Limit poskytovatele {api} překročen: {str(e)}")
+
+    def _stream_provider(self, api, model, prompt):
+        if api == 'openrouter':
+            chunks = self.stream_openrouter_api(prompt, model=model)
+        elif api == 'azure':
+            chunks = self.stream_azure_openai_api(prompt, model=model)
+        elif api == 'ollama':
+            chunks = self.stream_ollama_api(prompt, model=model)
+        else:
+            chunks = self.stream_openai_api(prompt, model=model)
+        return self._measure_stream(api, chunks)
+
+    def _measure_stream(self, api, chunks):
+        """Metriky streamovaného volání - doba do poslední části odpovědi"""
+        outcome = 'error'
+        start = time.monotonic()
+        try:
+            for chunk in chunks:
+                outcome = 'ok'
+                yield chunk
+        except RateLimited:
+            outcome = 'rate_limited'
+            raise
+        except StreamInterrupted:
+            outcome = 'error'
+            raise
+        finally:
+            AI_REQUEST_SECONDS.observe(time.monotonic() - start, provider=api)
+            AI_REQUESTS.inc(provider=api, outcome=outcome)
     
     def call_openrouter_api(self, prompt, model):
         if not self.openrouter_enabled:
@@ -66,16 +424,28 @@ class AIAgent:
             'temperature': 0.8
         }
 
-        logging.warning(f"Posilam dotaz do Openrouter API ({model}): {data}")
-        response = requests.post(url, headers=headers, json=data)
+        logging.warning(f"Posilam dotaz do Openrouter API ({model}): {describe_payload(prompt)}")
+        try:
+            response = self.openrouter_session.post(
+                url,
+                headers=headers,
+                json=data,
+                timeout=(self.openrouter_http['connect_timeout'], self.openrouter_http['read_timeout'])
+            )
+        except requests.RequestException as e:
+            logging.error(f"Chyba při volání OpenRouter API: {str(e)}")
+            return None
                                 
         if response.status_code == 200:
             json_response = response.json()
             ai_reply = json_response['choices'][0]['message']['content']
-            logging.warning(f"Odpoved od API: {ai_reply}")
+            report(response.headers, (json_response.get('usage') or {}).get('total_tokens'))
+            logging.warning(f"Odpoved od API: {describe_payload(ai_reply)}")
             return ai_reply
+        elif response.status_code == 429:
+            raise RateLimited(f"OpenRouter API: {response.text}", response.headers)
         else:
-            logging.error("Chyba při volání OpenRouter API:", response.status_code, response.text)
+            logging.error(f"Chyba při volání OpenRouter API: {response.status_code} - {response.text}")
             return None
             
     def call_ollama_api(self, prompt, model=None):
@@ -97,13 +467,21 @@ class AIAgent:
             'stream': False
         }
         
-        logging.warning(f"Sending request to Ollama API ({model}): {prompt}")
+        logging.warning(f"Sending request to Ollama API ({model}): {describe_payload(prompt)}")
         
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = self.ollama_session.post(
+                url,
+                headers=headers,
+                json=data,
+                timeout=(self.ollama_http['connect_timeout'], self.ollama_http['read_timeout'])
+            )
             if response.status_code == 200:
-                ai_reply = response.json()['response']
-                logging.warning(f"Response from Ollama API: {ai_reply}")
+                json_response = response.json()
+                ai_reply = json_response['response']
+                report(response.headers,
+                       json_response.get('prompt_eval_count', 0) + json_response.get('eval_count', 0))
+                logging.warning(f"Response from Ollama API: {describe_payload(ai_reply)}")
                 return ai_reply
             else:
                 logging.error(f"Error calling Ollama API: {response.status_code} - {response.text}")
@@ -122,21 +500,25 @@ class AIAgent:
             
         if not model:
             model = self.openai_default_model
-        logging.warning(f"Posílám dotaz do OpenAI API ({model}): {prompt}")
+        logging.warning(f"Posílám dotaz do OpenAI API ({model}): {describe_payload(prompt)}")
         
         try:
-            response = self.openai_client.chat.completions.create(
+            raw_response = self.openai_client.chat.completions.with_raw_response.create(
                 model=model,
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
                 temperature=1
             )
+            response = raw_response.parse()
+            report(raw_response.headers, response.usage.total_tokens if response.usage else None)
             
             ai_reply = response.choices[0].message.content
-            logging.warning(f"Odpověď od OpenAI API: {ai_reply}")
+            logging.warning(f"Odpověď od OpenAI API: {describe_payload(ai_reply)}")
             return ai_reply
             
+        except RateLimitError as e:
+            raise RateLimited(f"OpenAI API: {str(e)}", e.response.headers) from e
         except Exception as e:
             logging.error(f"Chyba při volání OpenAI API: {str(e)}")
             return None
@@ -155,21 +537,205 @@ class AIAgent:
         if not model:
             model = self.azure_deployment  # Use deployment name as default model
 
-        logging.warning(f"Posílám dotaz do Azure OpenAI API ({model}): {prompt}")
+        logging.warning(f"Posílám dotaz do Azure OpenAI API ({model}): {describe_payload(prompt)}")
         
         try:
-            response = self.azure_client.chat.completions.create(
+            raw_response = self.azure_client.chat.completions.with_raw_response.create(
                 model=model,
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
                 temperature=1
 )
+            response = raw_response.parse()
+            report(raw_response.headers, response.usage.total_tokens if response.usage else None)
             
             ai_reply = response.choices[0].message.content
-            logging.warning(f"Odpověď od Azure OpenAI API: {ai_reply}")
+            logging.warning(f"Odpověď od Azure OpenAI API: {describe_payload(ai_reply)}")
             return ai_reply
             
+        except RateLimitError as e:
+            raise RateLimited(f"Azure OpenAI API: {str(e)}", e.response.headers) from e
         except Exception as e:
             logging.error(f"Chyba při volání Azure OpenAI API: {str(e)}")
             return None
+
+    def stream_openrouter_api(self, prompt, model=None):
+        """
+        Streamovaná odpověď z OpenRouter API (server-sent events)
+        """
+        if not self.openrouter_enabled:
+            logging.error("OpenRouter interface is disabled")
+            return
+
+        url = 'https://openrouter.ai/api/v1/chat/completions'
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.openrouter_api_key}',
+            'HTTP-Referer': 'your-email@example.com',
+            'X-Title': 'My Application',
+            'X-Subtitle': 'Email AI Assistant',
+        }
+        if not model:
+            model = self.openrouter_default_model
+        data = {
+            'model': model,
+            'messages': [
+                {'role': 'user', 'content': prompt}
+            ],
+            'temperature': 0.8,
+            'stream': True
+        }
+
+        logging.warning(f"Posilam streamovany dotaz do Openrouter API ({model}): {describe_payload(prompt)}")
+        received = False
+        try:
+            with self.openrouter_session.post(
+                url,
+                headers=headers,
+                json=data,
+                stream=True,
+                timeout=(self.openrouter_http['connect_timeout'], self.openrouter_http['read_timeout'])
+            ) as response:
+                if response.status_code == 429:
+                    raise RateLimited(f"OpenRouter API: {response.text}", response.headers)
+                if response.status_code != 200:
+                    logging.error(f"Chyba při volání OpenRouter API: {response.status_code} - {response.text}")
+                    return
+                for line in response.iter_lines(decode_unicode=True):
+                    # Řádky bez "data:" jsou komentáře (keep-alive) serveru
+                    if not line or not line.startswith('data:'):
+                        continue
+                    payload = line[len('data:'):].strip()
+                    if payload == '[DONE]':
+                        break
+                    choices = json.loads(payload).get('choices') or [{}]
+                    content = choices[0].get('delta', {}).get('content')
+                    if content:
+                        received = True
+                        yield content
+                else:
+                    if received:
+                        raise ValueError("odpověď skončila bez [DONE]")
+        except (requests.RequestException, ValueError) as e:
+            if received:
+                raise StreamInterrupted(f"OpenRouter API: {str(e)}") from e
+            logging.error(f"Chyba při volání OpenRouter API: {str(e)}")
+
+    def stream_ollama_api(self, prompt, model=None):
+        """
+        Streamed response from local Ollama API (one JSON object per line)
+        """
+        if not self.ollama_enabled:
+            logging.error("Ollama interface is disabled")
+            return
+
+        if not model:
+            model = self.ollama_default_model
+
+        url = f"{self.ollama_host}/api/generate"
+        headers = {'Content-Type': 'application/json'}
+        data = {
+            'model': model,
+            'prompt': prompt,
+            'stream': True
+        }
+
+        logging.warning(f"Sending streamed request to Ollama API ({model}): {describe_payload(prompt)}")
+
+        received = False
+        try:
+            with self.ollama_session.post(
+                url,
+                headers=headers,
+                json=data,
+                stream=True,
+                timeout=(self.ollama_http['connect_timeout'], self.ollama_http['read_timeout'])
+            ) as response:
+                if response.status_code != 200:
+                    logging.error(f"Error calling Ollama API: {response.status_code} - {response.text}")
+                    return
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    part = json.loads(line)
+                    if part.get('error'):
+                        raise ValueError(part['error'])
+                    if part.get('response'):
+                        received = True
+                        yield part['response']
+                    if part.get('done'):
+                        break
+                else:
+                    if received:
+                        # Spojení skončilo bez závěrečného objektu s done
+                        raise ValueError("odpověď skončila před dokončením")
+        except Exception as e:
+            if received:
+                raise StreamInterrupted(f"Ollama API: {str(e)}") from e
+            logging.error(f"Error calling Ollama API: {str(e)}")
+
+    def stream_openai_api(self, prompt, model=None):
+        """
+        Streamovaná odpověď z OpenAI API
+        """
+        if not self.openai_enabled or not self.openai_client:
+            logging.error("OpenAI interface is disabled or not configured")
+            return
+
+        if not model:
+            model = self.openai_default_model
+        logging.warning(f"Posílám streamovaný dotaz do OpenAI API ({model}): {describe_payload(prompt)}")
+
+        received = False
+        try:
+            for chunk in self._stream_chat_completion(self.openai_client, model, prompt):
+                received = True
+                yield chunk
+        except Exception as e:
+            if received:
+                raise StreamInterrupted(f"OpenAI API: {str(e)}") from e
+            if isinstance(e, RateLimitError):
+                raise RateLimited(f"OpenAI API: {str(e)}", e.response.headers) from e
+            logging.error(f"Chyba při volání OpenAI API: {str(e)}")
+
+    def stream_azure_openai_api(self, prompt, model=None):
+        """
+        Streamovaná odpověď z Azure OpenAI API
+        """
+        if not self.azure_enabled:
+            logging.error("Azure OpenAI interface is disabled")
+            return
+        if not self.azure_client:
+            logging.error("Azure OpenAI není nakonfigurován")
+            return
+
+        if not model:
+            model = self.azure_deployment  # Use deployment name as default model
+        logging.warning(f"Posílám streamovaný dotaz do Azure OpenAI API ({model}): {describe_payload(prompt)}")
+
+        received = False
+        try:
+            for chunk in self._stream_chat_completion(self.azure_client, model, prompt):
+                received = True
+                yield chunk
+        except Exception as e:
+            if received:
+                raise StreamInterrupted(f"Azure OpenAI API: {str(e)}") from e
+            if isinstance(e, RateLimitError):
+                raise RateLimited(f"Azure OpenAI API: {str(e)}", e.response.headers) from e
+            logging.error(f"Chyba při volání Azure OpenAI API: {str(e)}")
+
+    def _stream_chat_completion(self, client, model, prompt):
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            temperature=1,
+            stream=True
+        )
+        for chunk in stream:
+            # Azure posílá i části bez choices (výsledky filtrů obsahu)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
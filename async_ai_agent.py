@@ -0,0 +1,299 @@
+# async_ai_agent.py
+
+import asyncio
+import logging
+import time
+import httpx
+from openai import AsyncOpenAI, AsyncAzureOpenAI, Timeout, RateLimitError
+from ai_agent import BaseAIAgent, get_http_settings
+from provider_governor import RateLimited, report
+from chunker import estimate_tokens
+from metrics import AI_REQUEST_SECONDS, AI_REQUESTS
+from logging_setup import describe_payload
+
+def create_async_http_client(settings):
+    """Vytvoří sdíleného httpx.AsyncClient s poolem keep-alive spojení"""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings['read_timeout'], connect=settings['connect_timeout']),
+        limits=httpx.Limits(
+            max_connections=settings['pool_maxsize'],
+            max_keepalive_connections=settings['pool_maxsize']
+        ),
+        transport=httpx.AsyncHTTPTransport(retries=settings['max_retries'])
+    )
+
+def async_openai_client_options(settings):
+    """Parametry timeoutu, opakování a poolu pro klienty AsyncOpenAI/AsyncAzureOpenAI"""
+    return {
+        'timeout': Timeout(settings['read_timeout'], connect=settings['connect_timeout']),
+        'max_retries': settings['max_retries'],
+        'http_client': httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings['pool_maxsize'],
+                max_keepalive_connections=settings['pool_maxsize']
+            )
+        ),
+    }
+
+class AsyncAIAgent(BaseAIAgent):
+    """
+    Asynchronní obdoba AIAgent - stejná konfigurace, metody jsou korutiny.
+
+    Volání čekající na odpověď poskytovatele nedrží vlákno, takže jeden proces
+    může mít rozpracované desítky požadavků najednou.
+    """
+    def _create_clients(self, config):
+        self.openrouter_http = create_async_http_client(get_http_settings(config, config.get('openrouter', {})))
+
+        openai_config = config.get('openai', {})
+        if self.openai_enabled and self.openai_api_key:
+            self.openai_client = AsyncOpenAI(
+                api_key=self.openai_api_key,
+                **async_openai_client_options(get_http_settings(config, openai_config))
+            )
+        else:
+            self.openai_client = None
+
+        self.ollama_http = create_async_http_client(get_http_settings(config, config.get('ollama', {})))
+
+        azure_config = config.get('azure_openai', {})
+        if self.azure_enabled and azure_config.get('api_key') and azure_config.get('endpoint'):
+            self.azure_client = AsyncAzureOpenAI(
+                api_key=azure_config['api_key'],
+                api_version=azure_config['api_version'],
+                azure_endpoint=azure_config['endpoint'],
+                **async_openai_client_options(get_http_settings(config, azure_config))
+            )
+        else:
+            self.azure_client = None
+
+    async def acomplete(self, api, model, prompt, use_cache=True):
+        """
+        Jednotný vstupní bod - zavolá poskytovatele podle názvu API.
+
+        Args:
+            api (str): openai, openrouter, azure nebo ollama (jinak se použije openai)
+            model (str): Model, None pro výchozí model poskytovatele
+            prompt (str): Text dotazu
+            use_cache (bool): Zda použít cache odpovědí (viz AIAgent.complete)
+
+        Returns:
+            str: Odpověď modelu, nebo None při chybě
+        """
+        api, model = self._resolve(api, model)
+        key = self._cache_key(api, model, prompt, use_cache)
+        # Cache je synchronní (SQLite), neblokuje smyčku událostí
+        ai_reply = await asyncio.to_thread(self._cached, key, api, model) if key else None
+        if ai_reply is not None:
+            return ai_reply
+
+        targets = self.route(api, model)
+        index = 0
+        try:
+            for index, (target_api, target_model) in enumerate(targets):
+                start = time.monotonic()
+                ai_reply = None
+                try:
+                    ai_reply = await self.call_api(target_api, target_model, prompt)
+                finally:
+                    self._record(target_api, target_model, start, bool(ai_reply))
+                if ai_reply:
+                    break
+                self._log_failover(targets, index)
+        finally:
+            self._release_rest(targets, index)
+
+        if ai_reply and key:
+            await asyncio.to_thread(self._store, key, ai_reply)
+        return ai_reply
+
+    async def call_api(self, api, model, prompt):
+        """Zavolá konkrétní API bez cache a routeru, v rámci limitů governoru"""
+        if self.governor:
+            return await self.governor.acall(api, model, estimate_tokens(prompt),
+                                             lambda: self._call_provider(api, model, prompt))
+        try:
+            return await self._call_provider(api, model, prompt)
+        except RateLimited as e:
+            logging.error(f"Limit poskytovatele {api} překročen: {str(e)}")
+            return None
+
+    async def _call_provider(self, api, model, prompt):
+        outcome = 'error'
+        start = time.monotonic()
+        try:
+            if api == 'openrouter':
+                ai_reply = await self.call_openrouter_api(prompt, model=model)
+            elif api == 'azure':
+                ai_reply = await self.call_azure_openai_api(prompt, model=model)
+            elif api == 'ollama':
+                ai_reply = await self.call_ollama_api(prompt, model=model)
+            else:
+                ai_reply = await self.call_openai_api(prompt, model=model)
+            if ai_reply:
+                outcome = 'ok'
+            return ai_reply
+        except RateLimited:
+            outcome = 'rate_limited'
+            raise
+        finally:
+            AI_REQUEST_SECONDS.observe(time.monotonic() - start, provider=api)
+            AI_REQUESTS.inc(provider=api, outcome=outcome)
+
+    async def aclose(self):
+        """Uzavře HTTP spojení všech poskytovatelů"""
+        await self.openrouter_http.aclose()
+        await self.ollama_http.aclose()
+        if self.openai_client:
+            await self.openai_client.close()
+        if self.azure_client:
+            await self.azure_client.close()
+
+    async def call_openrouter_api(self, prompt, model=None):
+        if not self.openrouter_enabled:
+            logging.error("OpenRouter interface is disabled")
+            return None
+
+        url = 'https://openrouter.ai/api/v1/chat/completions'
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.openrouter_api_key}',
+            'HTTP-Referer': 'your-email@example.com',
+            'X-Title': 'My Application',
+            'X-Subtitle': 'Email AI Assistant',
+        }
+        if not model:
+            model = self.openrouter_default_model
+        data = {
+            'model': model,
+            'messages': [
+                {'role': 'user', 'content': prompt}
+            ],
+            'temperature': 0.8
+        }
+
+        logging.warning(f"Posilam dotaz do Openrouter API ({model}): {describe_payload(prompt)}")
+        try:
+            response = await self.openrouter_http.post(url, headers=headers, json=data)
+        except httpx.HTTPError as e:
+            logging.error(f"Chyba při volání OpenRouter API: {str(e)}")
+            return None
+
+        if response.status_code == 200:
+            json_response = response.json()
+            ai_reply = json_response['choices'][0]['message']['content']
+            report(response.headers, (json_response.get('usage') or {}).get('total_tokens'))
+            logging.warning(f"Odpoved od API: {describe_payload(ai_reply)}")
+            return ai_reply
+        elif response.status_code == 429:
+            raise RateLimited(f"OpenRouter API: {response.text}", response.headers)
+        else:
+            logging.error(f"Chyba při volání OpenRouter API: {response.status_code} - {response.text}")
+            return None
+
+    async def call_ollama_api(self, prompt, model=None):
+        """
+        Method for communicating with local Ollama API
+        """
+        if not self.ollama_enabled:
+            logging.error("Ollama interface is disabled")
+            return None
+
+        if not model:
+            model = self.ollama_default_model
+
+        url = f"{self.ollama_host}/api/generate"
+        headers = {'Content-Type': 'application/json'}
+        data = {
+            'model': model,
+            'prompt': prompt,
+            'stream': False
+        }
+
+        logging.warning(f"Sending request to Ollama API ({model}): {describe_payload(prompt)}")
+
+        try:
+            response = await self.ollama_http.post(url, headers=headers, json=data)
+            if response.status_code == 200:
+                json_response = response.json()
+                ai_reply = json_response['response']
+                report(response.headers,
+                       json_response.get('prompt_eval_count', 0) + json_response.get('eval_count', 0))
+                logging.warning(f"Response from Ollama API: {describe_payload(ai_reply)}")
+                return ai_reply
+            else:
+                logging.error(f"Error calling Ollama API: {response.status_code} - {response.text}")
+                return None
+        except Exception as e:
+            logging.error(f"Error calling Ollama API: {str(e)}")
+            return None
+
+    async def call_openai_api(self, prompt, model=None):
+        """
+        Metoda pro komunikaci s OpenAI API využívající oficiální knihovnu
+        """
+        if not self.openai_enabled or not self.openai_client:
+            logging.error("OpenAI interface is disabled or not configured")
+            return None
+
+        if not model:
+            model = self.openai_default_model
+        logging.warning(f"Posílám dotaz do OpenAI API ({model}): {describe_payload(prompt)}")
+
+        try:
+            raw_response = await self.openai_client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=1
+            )
+            response = raw_response.parse()
+            report(raw_response.headers, response.usage.total_tokens if response.usage else None)
+
+            ai_reply = response.choices[0].message.content
+            logging.warning(f"Odpověď od OpenAI API: {describe_payload(ai_reply)}")
+            return ai_reply
+
+        except RateLimitError as e:
+            raise RateLimited(f"OpenAI API: {str(e)}", e.response.headers) from e
+        except Exception as e:
+            logging.error(f"Chyba při volání OpenAI API: {str(e)}")
+            return None
+
+    async def call_azure_openai_api(self, prompt, model=None):
+        """
+        Metoda pro komunikaci s Azure OpenAI API
+        """
+        if not self.azure_enabled:
+            logging.error("Azure OpenAI interface is disabled")
+            return None
+        if not self.azure_client:
+            logging.error("Azure OpenAI není nakonfigurován")
+            return None
+
+        if not model:
+            model = self.azure_deployment  # Use deployment name as default model
+
+        logging.warning(f"Posílám dotaz do Azure OpenAI API ({model}): {describe_payload(prompt)}")
+
+        try:
+            raw_response = await self.azure_client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=1
+            )
+            response = raw_response.parse()
+            report(raw_response.headers, response.usage.total_tokens if response.usage else None)
+
+            ai_reply = response.choices[0].message.content
+            logging.warning(f"Odpověď od Azure OpenAI API: {describe_payload(ai_reply)}")
+            return ai_reply
+
+        except RateLimitError as e:
+            raise RateLimited(f"Azure OpenAI API: {str(e)}", e.response.headers) from e
+        except Exception as e:
+            logging.error(f"Chyba při volání Azure OpenAI API: {str(e)}")
+            return None
@@ -1,9 +1,173 @@
 # attachment_processor.py
 
+import io
 import os
+import time
+import queue
 import tempfile
+import signal
+import logging
+import itertools
+import threading
+import multiprocessing
 from PyPDF2 import PdfReader
 from docx import Document
+from extraction_cache import create_extraction_cache
+from metrics import STAGE_SECONDS, ATTACHMENTS
+
+TEXT_EXTENSIONS = ['.txt', '.md', '.csv', '.json']
+
+# Verze extrakce - součást klíče cache, zvýšit při změně výstupu extrakce
+EXTRACTOR_VERSION = 1
+
+# Obsah přílohy větší než tento limit se drží v dočasném souboru místo v paměti
+SPOOL_MAX_SIZE = 1024 * 1024
+
+# Kolik sekund navíc čeká hlavní proces na výsledek nad časový limit přílohy
+# (limit hlídá primárně proces poolu sám), počítá se od začátku extrakce v procesu
+RESULT_GRACE_PERIOD = 5
+
+# Jak často čekající vlákno kontroluje stav procesu, který přílohu zpracovává
+WAIT_STEP = 0.5
+
+# Fronta, kterou proces poolu hlásí začátek extrakce (nastaví _init_worker)
+_started_queue = None
+
+class ExtractionTimeout(Exception):
+    pass
+
+def _on_alarm(signum, frame):
+    raise ExtractionTimeout()
+
+def spool_content(chunks):
+    """
+    Uloží obsah přílohy po částech do SpooledTemporaryFile.
+
+    Do SPOOL_MAX_SIZE zůstává obsah v paměti, větší se přesune do dočasného
+    souboru, takže čekající emaily nedrží celé přílohy v paměti.
+
+    Returns:
+        tuple: (soubor nastavený na začátek, velikost v bytes)
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    for chunk in chunks:
+        spooled.write(chunk)
+    size = spooled.tell()
+    spooled.seek(0)
+    return spooled, size
+
+def _init_worker(started_queue):
+    global _started_queue
+    _started_queue = started_queue
+
+def _run_in_worker(task_id, func, *args):
+    """Spustí func v procesu poolu a ohlásí (id, pid, čas) začátku - limit se měří až od něj"""
+    _started_queue.put((task_id, os.getpid(), time.time()))
+    return func(*args)
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def read_content(attachment):
+    """Obsah přílohy v bytes - z 'content', nebo ze spooled souboru 'file'"""
+    if 'content' in attachment:
+        return attachment['content']
+    attachment['file'].seek(0)
+    return attachment['file'].read()
+
+def close_content(attachment):
+    """Uvolní dočasný soubor s obsahem přílohy"""
+    if 'file' in attachment:
+        attachment['file'].close()
+
+def _iter_pdf(pdf_content):
+    reader = PdfReader(io.BytesIO(pdf_content))
+    for page in reader.pages:
+        page_text = page.extract_text()
+        if page_text:
+            yield page_text
+
+def _iter_docx(docx_content):
+    doc = Document(io.BytesIO(docx_content))
+    for para in doc.paragraphs:
+        yield para.text
+
+def _pieces(filename, content):
+    """Vrátí (oddělovač, iterátor částí textu) podle typu souboru"""
+    _, file_extension = os.path.splitext(filename)
+    file_extension = file_extension.lower()
+
+    if file_extension in TEXT_EXTENSIONS:
+        # Předpokládáme textový obsah, dekódujeme do řetězce
+        return "", iter([content.decode('utf-8', errors='ignore')])
+    elif file_extension == '.pdf':
+        # Stránky oddělené znakem konce stránky, podle kterého se dlouhý text dělí (chunker)
+        return "\f", _iter_pdf(content)
+    elif file_extension == '.docx':
+        return "\n", _iter_docx(content)
+    # Nepodporovaný typ souboru
+    return "", iter([])
+
+def extract_attachment(attachment, max_chars=None, timeout=None):
+    """
+    Extrahuje text z přílohy s omezením délky výstupu a doby zpracování.
+
+    Text se čte po částech (stránky PDF, odstavce DOCX), po překročení limitu
+    se vrátí to, co se stihlo. V hlavním vlákně procesu (procesy poolu) hlídá
+    časový limit i signál, takže se přeruší i zpracování jediné stránky.
+
+    Parametry:
+        attachment (dict): Příloha s 'filename' a 'content' (bytes) nebo 'file'
+        max_chars (int, optional): Max. počet znaků textu
+        timeout (float, optional): Max. doba zpracování v sekundách
+
+    Návratová hodnota:
+        dict: 'filename', 'text' a 'truncated' - None, 'size' (text zkrácen),
+            'time' (vypršel čas) nebo 'error' (příloha nejde zpracovat)
+    """
+    filename = attachment['filename']
+    deadline = time.monotonic() + timeout if timeout else None
+    use_alarm = (
+        timeout and hasattr(signal, 'setitimer')
+        and threading.current_thread() is threading.main_thread()
+    )
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    pieces = []
+    length = 0
+    truncated = None
+    separator = ""
+    try:
+        separator, iterator = _pieces(filename, read_content(attachment))
+        for piece in iterator:
+            if max_chars and length + len(piece) > max_chars:
+                pieces.append(piece[:max_chars - length])
+                truncated = 'size'
+                break
+            pieces.append(piece)
+            length += len(piece) + len(separator)
+            if deadline and time.monotonic() > deadline:
+                truncated = 'time'
+                break
+    except ExtractionTimeout:
+        truncated = 'time'
+    except Exception as e:
+        logging.error(f"Chyba při extrakci textu z přílohy {filename}: {e}")
+        truncated = 'error'
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+    return {'filename': filename, 'text': separator.join(pieces), 'truncated': truncated}
 
 def extract_text_from_attachment(attachment):
     """
@@ -18,23 +182,7 @@ def extract_text_from_attachment(attachment):
     Návratová hodnota:
         str: Extrahovaný text z přílohy nebo prázdný řetězec, pokud typ není podporován.
     """
-    filename = attachment['filename']
-    content = attachment['content']
-    content_type = attachment['content_type']
-    _, file_extension = os.path.splitext(filename)
-    file_extension = file_extension.lower()
-    
-    if file_extension in ['.txt', '.md', '.csv', '.json']:
-        # Předpokládáme textový obsah, dekódujeme do řetězce
-        text = content.decode('utf-8', errors='ignore')
-    elif file_extension == '.pdf':
-        text = extract_text_from_pdf(content)
-    elif file_extension == '.docx':
-        text = extract_text_from_docx(content)
-    else:
-        # Nepodporovaný typ souboru
-        text = ""
-    return text
+    return extract_attachment(attachment)['text']
 
 def extract_text_from_pdf(pdf_content):
     """
@@ -44,18 +192,9 @@ def extract_text_from_pdf(pdf_content):
         pdf_content (bytes): Obsah PDF souboru v bytes.
 
     Návratová hodnota:
-        str: Extrahovaný text z PDF.
+        str: Extrahovaný text z PDF, stránky jsou oddělené znakem '\\f'.
     """
-    text = ""
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
-        tmp_file.write(pdf_content)
-        tmp_file.flush()
-        reader = PdfReader(tmp_file.name)
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text
-    return text
+    return "\f".join(_iter_pdf(pdf_content))
 
 def extract_text_from_docx(docx_content):
     """
@@ -67,10 +206,197 @@ def extract_text_from_docx(docx_content):
     Návratová hodnota:
         str: Extrahovaný text z DOCX.
     """
-    text = ""
-    with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as tmp_file:
-        tmp_file.write(docx_content)
-        tmp_file.flush()
-        doc = Document(tmp_file.name)
-        text = "\n".join([para.text for para in doc.paragraphs])
-    return text
\ No newline at end of file
+    return "\n".join(_iter_docx(docx_content))
+
+class AttachmentExtractor:
+    def __init__(self, workers=0, timeout=30, max_chars=200000, cache=None):
+        """
+        Paralelní extrakce textu z příloh v poolu procesů.
+
+        Args:
+            workers (int): Počet procesů, 0 = extrakce v aktuálním vlákně
+                (časový limit se pak kontroluje jen mezi stránkami)
+            timeout (float): Časový limit jedné přílohy v sekundách
+            max_chars (int): Max. počet znaků textu jedné přílohy
+            cache (ExtractionCache, optional): Cache extrahovaného textu podle obsahu
+        """
+        self.cache = cache
+        self.workers = workers
+        self.timeout = timeout
+        self.max_chars = max_chars
+        self.pool = None
+        self.started_queue = None
+        # id úlohy -> (pid, začátek) podle hlášení procesů poolu
+        self.started = {}
+        self.task_ids = itertools.count()
+        self.lock = threading.Lock()
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                # spawn - fork vícevláknového procesu (IMAP, pipeline) není bezpečný.
+                # multiprocessing.Pool nahradí ukončený proces novým a ostatní
+                # rozpracované úlohy nechá doběhnout
+                context = multiprocessing.get_context('spawn')
+                self.started_queue = context.Queue()
+                self.pool = context.Pool(self.workers, initializer=_init_worker, initargs=(self.started_queue,))
+            return self.pool
+
+    def _started(self, task_id):
+        """(pid, začátek) úlohy, nebo None, pokud ještě čeká ve frontě poolu"""
+        with self.lock:
+            while True:
+                try:
+                    started_id, pid, start = self.started_queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.started[started_id] = (pid, start)
+            # Hlášení úloh, jejichž výsledek přišel dřív než hlášení, jinak by zůstala navždy
+            limit = time.time() - 2 * (self.timeout + RESULT_GRACE_PERIOD)
+            for stale in [key for key, (_, start) in self.started.items() if start < limit]:
+                del self.started[stale]
+            return self.started.get(task_id)
+
+    def _wait(self, task_id, result, filename):
+        """
+        Počká na výsledek úlohy v poolu.
+
+        Časový limit běží od začátku extrakce v procesu, ne od zařazení do
+        fronty poolu. Zaseknutý proces (nereaguje ani na SIGALRM) se ukončí,
+        pool místo něj spustí nový a ostatní úlohy běží dál.
+        """
+        try:
+            while True:
+                try:
+                    return result.get(timeout=WAIT_STEP)
+                except multiprocessing.TimeoutError:
+                    pass
+                started = self._started(task_id)
+                if started is None:
+                    continue
+                pid, start = started
+                if not _alive(pid):
+                    logging.error(f"Proces pro extrakci přílohy {filename} byl ukončen")
+                    return {'filename': filename, 'text': '', 'truncated': 'error'}
+                if time.time() - start > self.timeout + RESULT_GRACE_PERIOD:
+                    logging.error(f"Extrakce přílohy {filename} nedoběhla v časovém limitu, ukončuji proces {pid}")
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                    return {'filename': filename, 'text': '', 'truncated': 'time'}
+        except Exception as e:
+            logging.error(f"Chyba při extrakci přílohy {filename} v procesu: {e}")
+            return {'filename': filename, 'text': '', 'truncated': 'error'}
+        finally:
+            with self.lock:
+                self.started.pop(task_id, None)
+
+    def _cache_key(self, attachment):
+        _, file_extension = os.path.splitext(attachment['filename'])
+        return self.cache.make_key(read_content(attachment), EXTRACTOR_VERSION, file_extension.lower(), self.max_chars)
+
+    def extract_all(self, attachments):
+        """
+        Extrahuje text ze všech příloh najednou.
+
+        Přílohy nalezené v cache se neparsují. Do cache se ukládají jen
+        úplné výsledky a výsledky zkrácené kvůli délce (ty jsou pro stejný
+        obsah vždy stejné), ne přerušené časovým limitem nebo chybou.
+
+        Returns:
+            list: Výsledky extract_attachment ve stejném pořadí jako přílohy
+        """
+        with STAGE_SECONDS.time(stage='extract'):
+            results = self._extract_all(attachments)
+        for result in results:
+            ATTACHMENTS.inc(outcome=result['truncated'] or 'ok')
+        return results
+
+    def _extract_all(self, attachments):
+        if not self.cache:
+            return self._extract(attachments)
+
+        results = [None] * len(attachments)
+        keys = [self._cache_key(attachment) for attachment in attachments]
+        missing = []
+        for index, (attachment, key) in enumerate(zip(attachments, keys)):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.append(index)
+            else:
+                text, truncated = cached
+                results[index] = {'filename': attachment['filename'], 'text': text, 'truncated': truncated}
+
+        extracted = self._extract([attachments[index] for index in missing])
+        for index, result in zip(missing, extracted):
+            results[index] = result
+            if result['truncated'] in (None, 'size'):
+                self.cache.set(keys[index], result['text'], result['truncated'])
+        return results
+
+    def _extract(self, attachments):
+        if not attachments:
+            return []
+        if not self.workers:
+            return [extract_attachment(attachment, self.max_chars, self.timeout) for attachment in attachments]
+
+        pool = self._get_pool()
+        submitted = []
+        for a in attachments:
+            task_id = next(self.task_ids)
+            submitted.append((task_id, pool.apply_async(
+                _run_in_worker,
+                (task_id, extract_attachment, {'filename': a['filename'], 'content': read_content(a)},
+                 self.max_chars, self.timeout)
+            )))
+        return [self._wait(task_id, result, attachment['filename'])
+                for attachment, (task_id, result) in zip(attachments, submitted)]
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                # Úloha ukončeného procesu nikdy nedoběhne, close()+join() by na ni čekal
+                self.pool.terminate()
+                self.pool.join()
+                self.pool = None
+                self.started_queue.close()
+                self.started_queue = None
+            if self.cache:
+                self.cache.close()
+                self.cache = None
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+def configure_extractor(config, workers=None):
+    """
+    Nastaví výchozí extraktor podle sekce extraction konfigurace.
+
+    Args:
+        workers (int, optional): Přepíše počet procesů z konfigurace
+
+    Returns:
+        AttachmentExtractor: Nový výchozí extraktor
+    """
+    global _extractor
+    extraction_config = config.get('extraction', {}) or {}
+    extractor = AttachmentExtractor(
+        workers=extraction_config.get('workers', 2) if workers is None else workers,
+        timeout=extraction_config.get('timeout', 30),
+        max_chars=extraction_config.get('max_chars', 200000),
+        cache=create_extraction_cache(config)
+    )
+    with _extractor_lock:
+        previous, _extractor = _extractor, extractor
+    if previous:
+        previous.close()
+    return extractor
+
+def get_extractor():
+    """Výchozí extraktor, bez configure_extractor extrahuje v aktuálním vlákně"""
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = AttachmentExtractor()
+        return _extractor
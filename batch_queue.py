@@ -0,0 +1,417 @@
+# batch_queue.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from ai_agent import PROVIDER_TEMPERATURES, create_http_session, get_http_settings
+from metrics import EMAILS
+
+# Pole jobu, která se do dávkové fronty neukládají (prompt je zvlášť)
+TRANSIENT_FIELDS = ('msg', 'parts', 'attachments', 'attachment', 'html', 'body', 'content', 'prompt')
+
+# Stavy dávky v Batch API, po kterých se už nic nezmění
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+class OpenAIBatchClient:
+    # Cesta požadavků v souboru dávky a zároveň endpoint dávky
+    REQUEST_URL = '/v1/chat/completions'
+
+    def __init__(self, base_url, api_key, temperature=None, completion_window='24h', http_settings=None):
+        """
+        Klient OpenAI Batch API: požadavky se nahrají jako JSONL soubor,
+        založí se z něj dávka a po dokončení se stáhne soubor s výsledky.
+
+        Args:
+            base_url (str): Adresa API (lze nasměrovat na lokální náhradu pro testy)
+            api_key (str): API klíč
+            temperature (float, optional): Teplota modelu jako při okamžitém volání
+            completion_window (str): Lhůta zpracování dávky
+        """
+        self.base_url = base_url.rstrip('/')
+        self.temperature = temperature
+        self.completion_window = completion_window
+        self.http = http_settings or get_http_settings({}, {})
+        self.session = create_http_session(self.http)
+        self.headers = {'Authorization': f"Bearer {api_key}"}
+        self.params = {}
+
+    def _request(self, method, path, **kwargs):
+        response = self.session.request(
+            method, f"{self.base_url}{path}", headers=self.headers, params=self.params,
+            timeout=(self.http['connect_timeout'], self.http['read_timeout']), **kwargs
+        )
+        response.raise_for_status()
+        return response
+
+    def _line(self, custom_id, model, prompt):
+        body = {'model': model, 'messages': [{'role': 'user', 'content': prompt}]}
+        if self.temperature is not None:
+            body['temperature'] = self.temperature
+        return json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': self.REQUEST_URL, 'body': body})
+
+    def submit(self, requests):
+        """
+        Odešle dávku.
+
+        Args:
+            requests (list): Trojice (custom_id, model, prompt)
+
+        Returns:
+            str: Id dávky
+        """
+        content = "\n".join(self._line(*request) for request in requests).encode('utf-8')
+        uploaded = self._request(
+            'POST', '/files', data={'purpose': 'batch'},
+            files={'file': ('batch.jsonl', content, 'application/jsonl')}
+        ).json()
+        batch = self._request('POST', '/batches', json={
+            'input_file_id': uploaded['id'],
+            'endpoint': self.REQUEST_URL,
+            'completion_window': self.completion_window,
+        }).json()
+        return batch['id']
+
+    def poll(self, batch_id):
+        """
+        Zjistí stav dávky.
+
+        Returns:
+            dict: custom_id -> odpověď, nebo None pokud dávka ještě běží.
+                Neúspěšné požadavky ve výsledku chybí.
+        """
+        batch = self._request('GET', f"/batches/{batch_id}").json()
+        status = batch.get('status')
+        if status not in FINAL_STATUSES:
+            return None
+        if status != 'completed':
+            logging.warning(f"Dávka {batch_id} skončila ve stavu {status}")
+        results = {}
+        if batch.get('output_file_id'):
+            output = self._request('GET', f"/files/{batch['output_file_id']}/content").text
+            for line in output.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get('response') or {}
+                if response.get('status_code') != 200:
+                    logging.warning(f"Požadavek {item.get('custom_id')} v dávce {batch_id} selhal: {item.get('error')}")
+                    continue
+                try:
+                    results[item['custom_id']] = response['body']['choices'][0]['message']['content']
+                except (KeyError, IndexError, TypeError):
+                    logging.warning(f"Neočekávaný výsledek požadavku {item.get('custom_id')} v dávce {batch_id}")
+        return results
+
+class AzureBatchClient(OpenAIBatchClient):
+    REQUEST_URL = '/chat/completions'
+
+    def __init__(self, endpoint, api_key, api_version, **kwargs):
+        """Klient Azure OpenAI Batch API - model je název nasazení typu batch"""
+        super().__init__(f"{endpoint.rstrip('/')}/openai", api_key, **kwargs)
+        self.headers = {'api-key': api_key}
+        self.params = {'api-version': api_version}
+
+class GroupedBatchClient:
+    def __init__(self, call, workers=1):
+        """
+        Dávka pro poskytovatele bez Batch API (Ollama) - požadavky skupiny
+        se zpracují na pozadí postupnými voláními, mimo pipeline emailů.
+
+        Args:
+            call (callable): call(model, prompt) -> odpověď nebo None
+            workers (int): Počet souběžných volání
+        """
+        self.call = call
+        self.workers = workers
+        self.lock = Lock()
+        self.results = {}
+
+    def submit(self, requests):
+        batch_id = f"group-{uuid.uuid4().hex}"
+        with self.lock:
+            self.results[batch_id] = None
+        threading.Thread(target=self._run, args=(batch_id, requests), name='batch-group', daemon=True).start()
+        return batch_id
+
+    def _run(self, batch_id, requests):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            replies = list(executor.map(lambda request: self.call(request[1], request[2]), requests))
+        with self.lock:
+            self.results[batch_id] = {
+                custom_id: reply for (custom_id, _, _), reply in zip(requests, replies) if reply
+            }
+
+    def poll(self, batch_id):
+        with self.lock:
+            if batch_id not in self.results:
+                # Skupina odeslaná před restartem - požadavky se zopakují
+                return {}
+            results = self.results[batch_id]
+            if results is not None:
+                del self.results[batch_id]
+            return results
+
+class BatchQueue:
+    def __init__(self, clients, default_model, path='batch_queue.sqlite', max_batch_size=100,
+                 max_wait=3600, poll_interval=60, max_attempts=3):
+        """
+        Dávkové zpracování úkolů s delivery: batch.
+
+        Požadavky se ukládají do SQLite a seskupují podle API a modelu.
+        Skupina se odešle jako dávka, jakmile má max_batch_size požadavků,
+        nebo nejstarší z nich čeká déle než max_wait. Vlákno fronty pak
+        každých poll_interval sekund zjišťuje stav odeslaných dávek
+        a hotové odpovědi předává funkci deliver (převod do PDF a odeslání).
+        Odpověď se před předáním uloží, takže při chybě předání se nezahodí
+        a předání se zkusí znovu v dalším cyklu. Fronta, odeslané dávky
+        i nepředané odpovědi přežijí restart.
+
+        Args:
+            clients (dict): API -> klient s metodami submit a poll
+            default_model (callable): default_model(api) pro úkoly bez modelu
+            max_attempts (int): Kolikrát se požadavek bez odpovědi pošle v nové dávce
+        """
+        self.clients = clients
+        self.default_model = default_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lock = Lock()
+        self.logger = logging.getLogger(__name__)
+        self.deliver = None
+        self.fail = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS batch_items ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, job_key TEXT UNIQUE, api TEXT, model TEXT, prompt TEXT, '
+            'job TEXT, batch_id TEXT, attempts INTEGER DEFAULT 0, created REAL, reply TEXT)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS batch_items_batch ON batch_items (batch_id)')
+        self.db.commit()
+
+    def supports(self, api):
+        return (api or 'openai') in self.clients
+
+    def add(self, job):
+        """
+        Zařadí job s připraveným promptem do dávky.
+
+        Job z trvalé fronty (job_id) se zařadí jen jednou, i když se
+        po pádu zpracuje znovu.
+        """
+        task = job['task']
+        api = task['api'] or 'openai'
+        model = task['model'] or self.default_model(api)
+        job['batched_at'] = time.time()
+        data = json.dumps({key: value for key, value in job.items() if key not in TRANSIENT_FIELDS})
+        job_key = str(job['job_id']) if 'job_id' in job else None
+        with self.lock:
+            self.db.execute(
+                'INSERT OR IGNORE INTO batch_items (job_key, api, model, prompt, job, created) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_key, api, model, job['prompt'], data, time.time())
+            )
+            self.db.commit()
+        self.logger.info(f"Požadavek {api}:{model} zařazen do dávky")
+
+    def start(self, deliver, fail=None):
+        """
+        Spustí vlákno odesílání dávek a kontroly jejich stavu.
+
+        Args:
+            deliver (callable): deliver(job) pro job s odpovědí v 'ai_response'
+            fail (callable, optional): fail(job, chyba) pro job, který se nepodařilo zpracovat
+        """
+        self.deliver = deliver
+        self.fail = fail
+        self.thread = threading.Thread(target=self._run, name='batch-queue', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.redeliver()
+                self.flush()
+                self.poll()
+            except Exception as e:
+                self.logger.error(f"Chyba při zpracování dávek: {e}")
+            if self.stop_event.wait(self.poll_interval):
+                break
+
+    def flush(self, force=False):
+        """Odešle skupiny, které jsou plné nebo čekají déle než max_wait (force = všechny)"""
+        with self.lock:
+            groups = self.db.execute(
+                'SELECT api, model, COUNT(*), MIN(created) FROM batch_items WHERE batch_id IS NULL GROUP BY api, model'
+            ).fetchall()
+        for api, model, count, oldest in groups:
+            if not force and count < self.max_batch_size and time.time() - oldest < self.max_wait:
+                continue
+            client = self.clients.get(api)
+            if client is None:
+                self.logger.error(f"Pro {api} není nastavené dávkové zpracování")
+                continue
+            with self.lock:
+                rows = self.db.execute(
+                    'SELECT id, prompt FROM batch_items WHERE batch_id IS NULL AND api = ? AND model = ? '
+                    'ORDER BY id LIMIT ?', (api, model, self.max_batch_size)
+                ).fetchall()
+            try:
+                batch_id = client.submit([(str(item_id), model, prompt) for item_id, prompt in rows])
+            except Exception as e:
+                self.logger.error(f"Nepodařilo se odeslat dávku {api}:{model}: {e}")
+                continue
+            with self.lock:
+                self.db.executemany(
+                    'UPDATE batch_items SET batch_id = ? WHERE id = ?', [(batch_id, item_id) for item_id, _ in rows]
+                )
+                self.db.commit()
+            self.logger.warning(f"Odeslána dávka {batch_id} ({api}:{model}, {len(rows)} požadavků)")
+
+    def poll(self):
+        """Zjistí stav odeslaných dávek a předá hotové odpovědi"""
+        with self.lock:
+            batches = self.db.execute(
+                'SELECT DISTINCT api, batch_id FROM batch_items WHERE batch_id IS NOT NULL AND reply IS NULL'
+            ).fetchall()
+        for api, batch_id in batches:
+            client = self.clients.get(api)
+            if client is None:
+                continue
+            try:
+                results = client.poll(batch_id)
+            except Exception as e:
+                self.logger.warning(f"Nelze zjistit stav dávky {batch_id}: {e}")
+                continue
+            if results is not None:
+                self._complete(batch_id, results)
+
+    def _complete(self, batch_id, results):
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT id, job, attempts FROM batch_items WHERE batch_id = ? AND reply IS NULL', (batch_id,)
+            ).fetchall()
+        self.logger.warning(f"Dávka {batch_id} dokončena, odpovědí: {len(results)} z {len(rows)}")
+        for item_id, data, attempts in rows:
+            job = json.loads(data)
+            reply = results.get(str(item_id))
+            if reply:
+                job['ai_response'] = reply
+                trace = job.get('trace')
+                if trace is not None:
+                    trace.setdefault('stages', {})['batch'] = round(time.time() - job['batched_at'], 3)
+                    trace['response_chars'] = len(reply)
+                # Zaplacená odpověď se uloží dřív, než se předá
+                with self.lock:
+                    self.db.execute(
+                        'UPDATE batch_items SET job = ?, reply = ? WHERE id = ?', (json.dumps(job), reply, item_id)
+                    )
+                    self.db.commit()
+                self._deliver(item_id, job)
+            elif attempts + 1 < self.max_attempts:
+                # Zařadí se do další dávky
+                with self.lock:
+                    self.db.execute(
+                        'UPDATE batch_items SET batch_id = NULL, attempts = attempts + 1 WHERE id = ?', (item_id,)
+                    )
+                    self.db.commit()
+            else:
+                self.logger.error(f"Požadavek {item_id} se nepodařilo zpracovat ani v {attempts + 1}. dávce")
+                EMAILS.inc(outcome='failed')
+                if self.fail:
+                    self.fail(job, f"dávka {batch_id} bez odpovědi")
+                self._delete(item_id)
+
+    def _deliver(self, item_id, job):
+        """Předá job s odpovědí, záznam se smaže až po úspěšném předání"""
+        try:
+            self.deliver(job)
+        except Exception as e:
+            self.logger.error(f"Nepodařilo se předat výsledek dávky, zkusí se znovu: {e}")
+            return
+        self._delete(item_id)
+
+    def redeliver(self):
+        """Znovu předá odpovědi, jejichž předání dřív selhalo (i před restartem)"""
+        with self.lock:
+            rows = self.db.execute('SELECT id, job FROM batch_items WHERE reply IS NOT NULL').fetchall()
+        for item_id, data in rows:
+            self._deliver(item_id, json.loads(data))
+
+    def _delete(self, item_id):
+        with self.lock:
+            self.db.execute('DELETE FROM batch_items WHERE id = ?', (item_id,))
+            self.db.commit()
+
+    def stats(self):
+        """Počet požadavků čekajících na odeslání, v odeslaných dávkách a s nepředanou odpovědí"""
+        with self.lock:
+            waiting, submitted, undelivered = self.db.execute(
+                'SELECT COUNT(*) - COUNT(batch_id), COUNT(batch_id) - COUNT(reply), COUNT(reply) FROM batch_items'
+            ).fetchone()
+        return {'waiting': waiting, 'submitted': submitted, 'undelivered': undelivered}
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        with self.lock:
+            self.db.close()
+
+def create_batch_queue(config, ai_agent):
+    """
+    Vytvoří dávkovou frontu podle sekce batch konfigurace, nebo None pokud je vypnutá.
+
+    Dávkové API mají OpenAI a Azure OpenAI (adresu lze v batch.endpoints
+    přesměrovat), Ollama dostane skupinové zpracování přes ai_agent.
+    """
+    batch_config = config.get('batch', {}) or {}
+    if not batch_config.get('enabled', False):
+        return None
+    endpoints = batch_config.get('endpoints', {}) or {}
+    window = batch_config.get('completion_window', '24h')
+    clients = {}
+
+    openai_config = config.get('openai', {}) or {}
+    if openai_config.get('enabled') and openai_config.get('api_key'):
+        clients['openai'] = OpenAIBatchClient(
+            endpoints.get('openai', 'https://api.openai.com/v1'), openai_config['api_key'],
+            temperature=PROVIDER_TEMPERATURES['openai'], completion_window=window,
+            http_settings=get_http_settings(config, openai_config)
+        )
+    azure_config = config.get('azure_openai', {}) or {}
+    if azure_config.get('enabled') and azure_config.get('api_key') and azure_config.get('endpoint'):
+        clients['azure'] = AzureBatchClient(
+            endpoints.get('azure', azure_config['endpoint']), azure_config['api_key'],
+            azure_config.get('api_version', '2024-10-21'),
+            temperature=PROVIDER_TEMPERATURES['azure'], completion_window=window,
+            http_settings=get_http_settings(config, azure_config)
+        )
+    if (config.get('ollama', {}) or {}).get('enabled'):
+        clients['ollama'] = GroupedBatchClient(
+            lambda model, prompt: ai_agent.call_api('ollama', model, prompt),
+            workers=batch_config.get('ollama_workers', 1)
+        )
+
+    return BatchQueue(
+        clients,
+        ai_agent.default_model,
+        path=batch_config.get('path', 'batch_queue.sqlite'),
+        max_batch_size=batch_config.get('max_batch_size', 100),
+        max_wait=batch_config.get('max_wait', 3600),
+        poll_interval=batch_config.get('poll_interval', 60),
+        max_attempts=batch_config.get('max_attempts', 3)
+    )
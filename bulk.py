@@ -0,0 +1,303 @@
+# bulk.py
+#
+# Hromadné zpracování úkolu nad mnoha vstupy z příkazové řádky:
+#   python main.py --task Shrnuti --bulk ./dokumenty --output-dir ./vysledky
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import logging
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from attachment_processor import TEXT_EXTENSIONS, get_extractor
+from chunker import chunking_settings, needs_chunking, map_reduce
+from logging_setup import email_context
+from metrics import percentile
+from pdf_converter import convert_markdown_to_pdf
+
+# Přípony souborů, ze kterých umí extraktor získat text
+INPUT_EXTENSIONS = tuple(TEXT_EXTENSIONS) + ('.pdf', '.docx')
+
+# Znaky, které se v id vstupu nahradí při odvození názvu výstupního souboru
+UNSAFE_NAME = re.compile(r'[^\w.-]')
+
+def _file_items(paths, root):
+    items = []
+    for path in paths:
+        if not path.lower().endswith(INPUT_EXTENSIONS):
+            logging.warning(f"Přeskakuji nepodporovaný soubor {path}")
+            continue
+        items.append({'id': os.path.relpath(path, root).replace(os.sep, '/'), 'path': path})
+    return items
+
+def _jsonl_items(path):
+    items = []
+    base = os.path.dirname(path)
+    with open(path, 'r', encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                logging.warning(f"Přeskakuji neplatný řádek {number} v {path}: {e}")
+                continue
+            if not isinstance(record, dict) or not isinstance(record.get('text', record.get('file')), str):
+                logging.warning(f"Řádek {number} v {path} nemá 'text' ani 'file', přeskakuji")
+                continue
+            item = {'id': str(record.get('id', number))}
+            if 'text' in record:
+                item['text'] = record['text']
+            else:
+                item['path'] = os.path.join(base, record['file'])
+            items.append(item)
+    return items
+
+def _inside(path, directory):
+    path, directory = os.path.realpath(path), os.path.realpath(directory)
+    return path == directory or path.startswith(directory + os.sep)
+
+def find_inputs(source, output_dir=None, output_format='text'):
+    """
+    Najde vstupy pro hromadné zpracování.
+
+    Args:
+        source (str): Adresář (prochází se i podadresáře), soubor .jsonl
+            s objekty {"id": ..., "text": ...} nebo {"id": ..., "file": ...},
+            nebo vzor jako "dokumenty/**/*.pdf"
+        output_dir (str, optional): Adresář výstupů - soubory v něm se za vstupy
+            nepovažují (výsledky předchozího běhu) a výstupy vstupů se v něm
+            nesmí překrývat
+        output_format (str): Formát výstupu úkolu (text nebo pdf)
+
+    Returns:
+        list: Vstupy {'id', 'text'} nebo {'id', 'path'} seřazené podle id
+
+    Raises:
+        ValueError: Duplicitní id vstupu, nebo dva vstupy se stejným výstupním souborem
+    """
+    if os.path.isdir(source):
+        paths = []
+        for directory, subdirectories, names in os.walk(source):
+            if output_dir is not None:
+                subdirectories[:] = [name for name in subdirectories
+                                     if not _inside(os.path.join(directory, name), output_dir)]
+                if _inside(directory, output_dir):
+                    continue
+            paths.extend(os.path.join(directory, name) for name in names)
+        items = _file_items(paths, source)
+    elif os.path.isfile(source) and source.lower().endswith('.jsonl'):
+        items = _jsonl_items(source)
+    else:
+        paths = [path for path in glob.glob(source, recursive=True)
+                 if os.path.isfile(path) and (output_dir is None or not _inside(path, output_dir))]
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths]) if paths else '.'
+        items = _file_items([os.path.abspath(path) for path in paths], root)
+
+    ids = set()
+    for item in items:
+        if item['id'] in ids:
+            raise ValueError(f"Vstup {item['id']} je uveden vícekrát")
+        ids.add(item['id'])
+    if output_dir is not None:
+        # Nahrazení znaků v output_path může dvěma id přidělit stejný soubor
+        outputs = {}
+        for item in items:
+            path = os.path.normcase(output_path(output_dir, item['id'], output_format))
+            if path in outputs:
+                raise ValueError(f"Vstupy {outputs[path]} a {item['id']} by se zapsaly do stejného souboru {path}")
+            outputs[path] = item['id']
+    return sorted(items, key=lambda item: item['id'])
+
+def output_path(output_dir, item_id, output_format):
+    """Cesta výstupu vstupu - id s připojenou příponou výstupu (a.pdf -> a.pdf.txt), adresáře se zachovají"""
+    parts = [UNSAFE_NAME.sub('_', part) for part in item_id.split('/') if part not in ('', '.', '..')]
+    name = os.path.join(output_dir, *parts) if parts else os.path.join(output_dir, '_')
+    return f"{name}.{'pdf' if output_format == 'pdf' else 'txt'}"
+
+def read_input(item):
+    """Text vstupu - soubory přes extraktor příloh (limit délky, časový limit, cache)"""
+    if 'text' in item:
+        return item['text']
+    with open(item['path'], 'rb') as file:
+        content = file.read()
+    result = get_extractor().extract_all([{'filename': item['path'], 'content': content}])[0]
+    if result['truncated'] in ('time', 'error'):
+        raise ValueError(f"text se nepodařilo získat ({result['truncated']})")
+    if result['truncated'] == 'size':
+        logging.warning(f"Text vstupu {item['id']} byl zkrácen")
+    return result['text']
+
+def answer(task, content, config, ai_agent):
+    """Odpověď AI na vstup, dlouhý vstup se zpracuje po částech"""
+    use_cache = task.get('cache', True)
+
+    def complete(prompt):
+        return ai_agent.complete(task['api'], task['model'], prompt, use_cache=use_cache)
+
+    prompt = f"{task['base_prompt']}\n{content}"
+    chunking = chunking_settings(config)
+    if needs_chunking(prompt, chunking):
+        return map_reduce(complete, task, content, chunking)
+    return complete(prompt)
+
+def _write_file(path, content):
+    # Přes dočasný soubor - rozepsaný výstup se při pokračování nepovažuje za hotový
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f"{path}.part"
+    with open(temporary, 'wb') as file:
+        file.write(content)
+    os.replace(temporary, path)
+
+def _finished_ids(path):
+    """Id vstupů s úspěšným výsledkem v existujícím výstupu JSONL"""
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Neúplný poslední řádek po přerušení
+                continue
+            if record.get('status') == 'ok':
+                finished.add(record['id'])
+    return finished
+
+class BulkRunner:
+    def __init__(self, task, config, ai_agent, output_dir=None, output_jsonl=None, workers=4, resume=True):
+        """
+        Souběžné zpracování úkolu nad mnoha vstupy.
+
+        Výsledek každého vstupu se zapíše do vlastního souboru v output_dir
+        (PDF nebo text podle output_format úkolu), nebo jako řádek JSON
+        {"id", "status", "output", "error", "seconds"} do output_jsonl
+        ('-' = standardní výstup, PDF se pak nevytváří, vypíše se text).
+        Při resume se přeskočí vstupy, které už výsledek mají, takže
+        přerušený běh stačí spustit znovu.
+
+        Args:
+            task (dict): Úkol včetně api a modelu
+            workers (int): Počet souběžně zpracovávaných vstupů
+        """
+        if (output_dir is None) == (output_jsonl is None):
+            raise ValueError("Zadejte právě jeden z výstupů: adresář nebo JSONL")
+        self.task = task
+        self.config = config
+        self.ai_agent = ai_agent
+        self.output_dir = output_dir
+        self.output_jsonl = output_jsonl
+        self.workers = workers
+        self.resume = resume
+        self.lock = threading.Lock()
+        self.jsonl_file = None
+
+    def _pending(self, items):
+        if not self.resume:
+            return items
+        if self.output_dir is not None:
+            return [item for item in items
+                    if not os.path.exists(output_path(self.output_dir, item['id'], self.task['output_format']))]
+        if self.output_jsonl == '-':
+            return items
+        finished = _finished_ids(self.output_jsonl)
+        return [item for item in items if item['id'] not in finished]
+
+    def _emit(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.jsonl_file.write(line + "\n")
+            self.jsonl_file.flush()
+
+    def _process(self, item):
+        start = time.monotonic()
+        with email_context():
+            logging.info(f"Zpracovávám vstup {item['id']}")
+            error = None
+            ai_response = None
+            try:
+                ai_response = answer(self.task, read_input(item), self.config, self.ai_agent)
+                if not ai_response:
+                    error = "Nepodařilo se získat odpověď od AI"
+                elif self.output_dir is not None:
+                    path = output_path(self.output_dir, item['id'], self.task['output_format'])
+                    if self.task['output_format'] == 'pdf':
+                        _write_file(path, convert_markdown_to_pdf(ai_response))
+                    else:
+                        _write_file(path, ai_response.encode('utf-8'))
+            except Exception as e:
+                error = str(e)
+            seconds = time.monotonic() - start
+            if error:
+                logging.error(f"Vstup {item['id']} se nepodařilo zpracovat: {error}")
+            if self.jsonl_file:
+                self._emit({
+                    'id': item['id'], 'status': 'failed' if error else 'ok',
+                    'output': None if error else ai_response, 'error': error, 'seconds': round(seconds, 3)
+                })
+        return error is None, seconds
+
+    def run(self, items):
+        """
+        Zpracuje vstupy, průběh vypisuje na standardní chybový výstup.
+
+        Returns:
+            dict: 'total', 'skipped', 'ok', 'failed', 'elapsed' a 'latencies' (sekundy úspěšných vstupů)
+        """
+        pending = self._pending(items)
+        summary = {'total': len(items), 'skipped': len(items) - len(pending), 'ok': 0, 'failed': 0,
+                   'elapsed': 0.0, 'latencies': []}
+        if summary['skipped']:
+            print(f"Přeskakuji {summary['skipped']} již zpracovaných vstupů", file=sys.stderr)
+        if not pending:
+            return summary
+
+        if self.output_jsonl == '-':
+            self.jsonl_file = sys.stdout
+        elif self.output_jsonl is not None:
+            os.makedirs(os.path.dirname(self.output_jsonl) or '.', exist_ok=True)
+            self.jsonl_file = open(self.output_jsonl, 'a' if self.resume else 'w', encoding='utf-8')
+
+        start = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = {executor.submit(self._process, item): item for item in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                success, seconds = future.result()
+                if success:
+                    summary['ok'] += 1
+                    summary['latencies'].append(seconds)
+                else:
+                    summary['failed'] += 1
+                print(f"[{done}/{len(pending)}] {futures[future]['id']}: "
+                      f"{'ok' if success else 'chyba'} ({seconds:.2f} s)", file=sys.stderr)
+        except KeyboardInterrupt:
+            print("Přerušeno, při dalším spuštění se pokračuje nezpracovanými vstupy", file=sys.stderr)
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            summary['elapsed'] = time.monotonic() - start
+            if self.jsonl_file and self.jsonl_file is not sys.stdout:
+                self.jsonl_file.close()
+        return summary
+
+def print_summary(summary, file=None):
+    """Vypíše počty, propustnost a latence hromadného zpracování"""
+    file = file or sys.stdout
+    processed = summary['ok'] + summary['failed']
+    elapsed = summary['elapsed']
+    print(f"Vstupů: {summary['total']}, zpracováno: {summary['ok']}, chyb: {summary['failed']}, "
+          f"přeskočeno: {summary['skipped']}", file=file)
+    if processed:
+        print(f"Doba zpracování: {elapsed:.2f} s, propustnost: {processed / elapsed if elapsed else 0:.2f} vstupů/s",
+              file=file)
+    latencies = summary['latencies']
+    if latencies:
+        print(f"Latence (s): průměr {statistics.mean(latencies):.3f}, p50 {percentile(latencies, 0.5):.3f}, "
+              f"p95 {percentile(latencies, 0.95):.3f}, max {max(latencies):.3f}", file=file)
@@ -0,0 +1,177 @@
+# chunker.py
+
+import asyncio
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from logging_setup import in_email_context
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding('cl100k_base')
+except Exception:
+    # tiktoken je volitelný, bez něj se počet tokenů odhaduje z délky textu
+    _ENCODING = None
+
+# Hranice, podle kterých se text dělí - od nejsilnější (stránka PDF) po nejslabší
+BOUNDARIES = [
+    re.compile(r'\f'),           # konec stránky (extract_text_from_pdf)
+    re.compile(r'\n\s*\n'),      # odstavec
+    re.compile(r'\n'),           # řádek
+    re.compile(r'(?<=[.!?])\s+'),  # věta
+]
+
+# Oddělovač dílčích výsledků při spojování
+PARTIAL_SEPARATOR = "\n\n---\n\n"
+
+def estimate_tokens(text):
+    """Počet tokenů textu (přesně s tiktoken, jinak odhad ~4 znaky na token)"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+def split_text(text, max_tokens, level=0):
+    """
+    Rozdělí text na části do max_tokens tokenů.
+
+    Dělí se přednostně na hranicích stránek, pak odstavců, řádků a vět;
+    teprve pokud nic z toho nestačí, dělí se natvrdo podle délky.
+
+    Returns:
+        list: Části textu v původním pořadí
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text] if text.strip() else []
+    if level >= len(BOUNDARIES):
+        # Odhad délky v znacích podle poměru tokenů
+        size = max(1, len(text) * max_tokens // estimate_tokens(text))
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    chunks = []
+    current = ""
+    for piece in BOUNDARIES[level].split(text):
+        if not piece.strip():
+            continue
+        if estimate_tokens(piece) > max_tokens:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(split_text(piece, max_tokens, level + 1))
+            continue
+        candidate = f"{current}\n\n{piece}" if current else piece
+        if estimate_tokens(candidate) > max_tokens:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+def chunking_settings(config):
+    """Nastavení z app_settings.chunking s výchozími hodnotami"""
+    settings = config.get('app_settings', {}).get('chunking', {}) or {}
+    return {
+        'max_prompt_tokens': settings.get('max_prompt_tokens', 12000),
+        'chunk_tokens': settings.get('chunk_tokens', 6000),
+        'workers': settings.get('workers', 4),
+    }
+
+def needs_chunking(prompt, settings):
+    return estimate_tokens(prompt) > settings['max_prompt_tokens']
+
+def _prompts(task):
+    base_prompt = task['base_prompt']
+    map_prompt = task.get('map_prompt') or (
+        f"{base_prompt}\n(Následující text je jen částí delšího dokumentu.)"
+    )
+    reduce_prompt = task.get('reduce_prompt') or (
+        f"{base_prompt}\n(Následují dílčí výsledky zpracování jednotlivých částí dokumentu, "
+        "spoj je do jednoho výsledného textu.)"
+    )
+    return map_prompt, reduce_prompt
+
+def _reduce_rounds(partials, reduce_prompt, settings):
+    """Rozdělí dílčí výsledky do skupin, které se vejdou do jednoho volání"""
+    budget = settings['max_prompt_tokens'] - estimate_tokens(reduce_prompt)
+    groups = []
+    current = []
+    for partial in partials:
+        if current and estimate_tokens(PARTIAL_SEPARATOR.join(current + [partial])) > budget:
+            groups.append(current)
+            current = []
+        current.append(partial)
+    if current:
+        groups.append(current)
+    if len(groups) == len(partials) and len(partials) > 1:
+        # Jednotlivé výsledky jsou samy příliš dlouhé - spojujeme aspoň po dvou
+        groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+    return groups
+
+def map_reduce(complete, task, content, settings):
+    """
+    Zpracuje dlouhý vstup po částech paralelně a výsledky spojí.
+
+    Args:
+        complete (callable): complete(prompt) -> odpověď nebo None
+        task (dict): Úkol s 'base_prompt' a volitelně 'map_prompt' a 'reduce_prompt'
+        content (str): Vstupní text (tělo emailu a obsah příloh)
+        settings (dict): Výsledek chunking_settings()
+
+    Returns:
+        str: Výsledná odpověď, nebo None pokud některé volání selhalo
+    """
+    map_prompt, reduce_prompt = _prompts(task)
+    chunks = split_text(content, settings['chunk_tokens'])
+    logging.info(f"Vstup rozdělen na {len(chunks)} částí")
+    if len(chunks) <= 1:
+        return complete(f"{task['base_prompt']}\n{content}")
+
+    # Volání v poolu zapisují do logu se stejným id emailu
+    complete = in_email_context(complete)
+    with ThreadPoolExecutor(max_workers=settings['workers']) as executor:
+        partials = list(executor.map(lambda chunk: complete(f"{map_prompt}\n{chunk}"), chunks))
+        if not all(partials):
+            return None
+
+        # Pokud se dílčí výsledky nevejdou do jednoho volání, spojují se po skupinách
+        while len(partials) > 1:
+            groups = _reduce_rounds(partials, reduce_prompt, settings)
+            partials = list(executor.map(
+                lambda group: complete(f"{reduce_prompt}\n{PARTIAL_SEPARATOR.join(group)}"), groups
+            ))
+            if not all(partials):
+                return None
+            if len(groups) == 1:
+                break
+
+    return partials[0] if partials else None
+
+async def map_reduce_async(acomplete, task, content, settings):
+    """Asynchronní obdoba map_reduce, acomplete(prompt) je korutina"""
+    map_prompt, reduce_prompt = _prompts(task)
+    chunks = split_text(content, settings['chunk_tokens'])
+    logging.info(f"Vstup rozdělen na {len(chunks)} částí")
+    if len(chunks) <= 1:
+        return await acomplete(f"{task['base_prompt']}\n{content}")
+    limit = asyncio.Semaphore(settings['workers'])
+
+    async def run(prompt):
+        async with limit:
+            return await acomplete(prompt)
+
+    partials = await asyncio.gather(*[run(f"{map_prompt}\n{chunk}") for chunk in chunks])
+    if not all(partials):
+        return None
+
+    while len(partials) > 1:
+        groups = _reduce_rounds(partials, reduce_prompt, settings)
+        partials = await asyncio.gather(*[
+            run(f"{reduce_prompt}\n{PARTIAL_SEPARATOR.join(group)}") for group in groups
+        ])
+        if not all(partials):
+            return None
+        if len(groups) == 1:
+            break
+
+    return partials[0] if partials else None
@@ -2,6 +2,40 @@ import os
 import sys
 import yaml
 import logging
+import threading
+from logging_setup import configure_logging
+from task_registry import TaskRegistry
+
+# Sekce config.yaml, jejichž změna se projeví bez restartu
+RELOADABLE_SECTIONS = ('allowed_users', 'rate_limit_defaults', 'logging')
+
+# Položky app_settings, které se čtou pro každý email nebo cyklus kontroly,
+# ostatní (pipeline, async_mode, streaming, ...) se nastaví jen při startu
+RELOADABLE_APP_SETTINGS = ('max_attachments', 'chunking', 'check_interval', 'idle_timeout')
+
+def read_config(config_file):
+    """
+    Načte a ověří config.yaml. Na rozdíl od load_config při chybě vyvolá
+    výjimku (použití při opětovném načtení za běhu).
+    """
+    with open(config_file, 'r', encoding='utf-8') as file:
+        config = yaml.safe_load(file)
+    if not isinstance(config, dict):
+        raise ValueError(f"{config_file} neobsahuje sekce konfigurace")
+
+    # Převést seznam allowed_users na slovník pro rychlejší přístup
+    allowed_users_dict = {}
+    for user in config.get('allowed_users', []) or []:
+        if not isinstance(user, dict) or not user.get('email'):
+            raise ValueError(f"Neplatný záznam v allowed_users: {user}")
+        allowed_users_dict[user['email']] = user
+    config['allowed_users'] = allowed_users_dict
+    return config
+
+def read_tasks(tasks_file):
+    """Načte a ověří tasks.yaml, při chybě vyvolá výjimku"""
+    with open(tasks_file, 'r', encoding='utf-8') as file:
+        return TaskRegistry(yaml.safe_load(file))
 
 def load_config(config_file='./config/config.yaml'):
     # Check if config file exists
@@ -12,34 +46,10 @@ def load_config(config_file='./config/config.yaml'):
         sys.exit(1)
 
     try:
-        with open(config_file, 'r', encoding='utf-8') as file:
-            config = yaml.safe_load(file)
-
-        # Nastavení úrovně logování z konfigurace
-        log_level = config.get('logging', {}).get('level', 'INFO')
-        
-        # Mapování textové úrovně na úroveň logování
-        log_level_mapping = {
-            'DEBUG': logging.DEBUG,
-            'INFO': logging.INFO,
-            'WARNING': logging.WARNING,
-            'ERROR': logging.ERROR,
-            'CRITICAL': logging.CRITICAL
-        }
-        
-        # Nastavení logování
-        logging.basicConfig(
-            level=log_level_mapping.get(log_level.upper(), logging.INFO),
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
-
-        # Převést seznam allowed_users na slovník pro rychlejší přístup
-        allowed_users_dict = {}
-        for user in config.get('allowed_users', []):
-            email = user['email']
-            allowed_users_dict[email] = user
-        config['allowed_users'] = allowed_users_dict
-        
+        config = read_config(config_file)
+
+        # Nastavení logování z konfigurace - zápis přes frontu ve vlastním vlákně
+        configure_logging(config.get('logging', {}) or {})
         return config
 
     except yaml.YAMLError as e:
@@ -60,17 +70,12 @@ def load_tasks(tasks_file='./config/tasks.yaml'):
         sys.exit(1)
 
     try:
-        with open(tasks_file, 'r', encoding='utf-8') as file:
-            tasks = yaml.safe_load(file)
-
-        # Optional: Validate tasks structure if needed
-        if not isinstance(tasks, (dict, list)) or not tasks:
-            logging.error(f"Invalid or empty tasks configuration in {tasks_file}")
-            print(f"Error: Invalid tasks configuration in {tasks_file}")
-            sys.exit(1)
-
-        return tasks
+        return read_tasks(tasks_file)
 
+    except ValueError as e:
+        logging.error(f"Invalid or empty tasks configuration in {tasks_file}: {e}")
+        print(f"Error: Invalid tasks configuration in {tasks_file}: {e}")
+        sys.exit(1)
     except yaml.YAMLError as e:
         logging.error(f"YAML parsing error in tasks file: {e}")
         print(f"Error: Unable to parse tasks file {tasks_file}")
@@ -84,3 +89,112 @@ def load_tasks(tasks_file='./config/tasks.yaml'):
         print(f"Error: Failed to load tasks from {tasks_file}")
         sys.exit(1)
 
+
+def _mtime(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+class ConfigWatcher:
+    def __init__(self, config, tasks, config_file='./config/config.yaml',
+                 tasks_file='./config/tasks.yaml', interval=5):
+        """
+        Sleduje config.yaml a tasks.yaml a po změně je znovu načte.
+
+        Změna se pozná podle mtime a velikosti souboru. Nová verze se
+        nejdřív celá načte a ověří, pak se vymění jediným přiřazením
+        dvojice current = (config, tasks). Rozpracované emaily dokončí
+        s úkolem, se kterým začaly, nové emaily dostanou novou verzi. Stupně
+        pipeline čtou current při zpracování jobu. Neplatný soubor se odmítne
+        a platí dál předchozí verze.
+
+        Z config.yaml se za běhu přebírají jen RELOADABLE_SECTIONS
+        a RELOADABLE_APP_SETTINGS, ostatní sekce (připojení, poskytovatelé AI,
+        router, governor, pipeline) vyžadují restart.
+
+        Args:
+            interval (float): Interval kontroly v sekundách, 0 = bez sledování
+        """
+        self.current = (config, tasks)
+        self.config_file = config_file
+        self.tasks_file = tasks_file
+        self.interval = interval
+        self.mtimes = {path: _mtime(path) for path in (config_file, tasks_file)}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.interval and self.interval > 0:
+            self.thread = threading.Thread(target=self._run, name='config-watcher', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Chyba při kontrole změn konfigurace: {e}")
+
+    def _reload_config(self, old):
+        new = read_config(self.config_file)
+        config = dict(old)
+        for section in set(old) | set(new):
+            if section == 'app_settings':
+                config[section] = self._reload_app_settings(old.get(section) or {}, new.get(section) or {})
+            elif section in RELOADABLE_SECTIONS:
+                if section in new:
+                    config[section] = new[section]
+                else:
+                    config.pop(section, None)
+            elif old.get(section) != new.get(section):
+                logging.warning(f"Změna sekce {section} v {self.config_file} se projeví až po restartu")
+        return config
+
+    def _reload_app_settings(self, old, new):
+        settings = dict(old)
+        for key in set(old) | set(new):
+            if key in RELOADABLE_APP_SETTINGS:
+                if key in new:
+                    settings[key] = new[key]
+                else:
+                    settings.pop(key, None)
+            elif old.get(key) != new.get(key):
+                logging.warning(f"Změna app_settings.{key} v {self.config_file} se projeví až po restartu")
+        return settings
+
+    def check(self):
+        """
+        Znovu načte změněné soubory.
+
+        Returns:
+            bool: True, pokud se vyměnila verze nastavení
+        """
+        changed = [path for path, mtime in self.mtimes.items() if _mtime(path) != mtime]
+        if not changed:
+            return False
+        for path in changed:
+            self.mtimes[path] = _mtime(path)
+
+        old_config, tasks = self.current
+        config = old_config
+        try:
+            if self.config_file in changed:
+                config = self._reload_config(old_config)
+            if self.tasks_file in changed:
+                tasks = read_tasks(self.tasks_file)
+        except Exception as e:
+            logging.error(f"Nové nastavení z {', '.join(changed)} je neplatné, platí předchozí: {e}")
+            return False
+
+        self.current = (config, tasks)
+        if config.get('logging') != old_config.get('logging'):
+            configure_logging(config.get('logging', {}) or {})
+        logging.warning(f"Načteno nové nastavení z {', '.join(changed)}")
+        return True
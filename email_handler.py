@@ -1,8 +1,154 @@
 import imaplib
 import smtplib
 import email
+import json
 import logging
+import os
+import random
+import re
+import select
+import socket
+import ssl
+import threading
+import time
+from contextlib import contextmanager
 from email.message import EmailMessage
+from imap_parser import parse_fetch_response, find_section, flatten_bodystructure, decode_transfer_encoding
+from metrics import STAGE_SECONDS
+
+# Neoznačená odpověď serveru o nové zprávě ve schránce, např. "* 12 EXISTS"
+EXISTS_RESPONSE = re.compile(rb'^\* \d+ EXISTS', re.IGNORECASE)
+
+# UIDVALIDITY v odpovědi na STATUS
+UIDVALIDITY_RESPONSE = re.compile(rb'UIDVALIDITY (\d+)')
+
+# První fáze načítání - jen odesílatel, předmět a struktura zprávy
+HEADER_FETCH_ITEMS = '(UID RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (FROM SUBJECT)])'
+
+# RFC 2177: server může IDLE ukončit po 30 minutách, obnovujeme dříve
+DEFAULT_IDLE_TIMEOUT = 25 * 60
+
+# Klíčové slovo (IMAP keyword) zprávy zabrané instancí: TaskMailer_<instance>_<lease>,
+# lease = pořadové číslo období délky email.claim.lease od počátku epochy
+CLAIM_PREFIX = 'TaskMailer_'
+
+# Zabrání starší než tolik období je prošlé (instance zprávu nedokončila)
+CLAIM_EXPIRY = 2
+
+def _claim_owner(flag):
+    """Instance a číslo období z klíčového slova zabrání"""
+    instance, _, lease = flag[len(CLAIM_PREFIX):].rpartition('_')
+    return instance, lease
+
+class SMTPPool:
+    def __init__(self, factory, size=2, noop_interval=60):
+        """
+        Malý pool dlouhodobých SMTP spojení sdílených mezi vlákny.
+
+        Args:
+            factory (callable): Funkce factory(reconnect) vracející nové přihlášené spojení
+            size (int): Maximální počet současně otevřených spojení
+            noop_interval (int): Po kolika sekundách nečinnosti se spojení ověří příkazem NOOP
+        """
+        self.factory = factory
+        self.size = max(1, int(size))
+        self.noop_interval = noop_interval
+        self._idle = []  # (spojení, čas posledního použití)
+        self._created = 0
+        self._broken = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.logger = logging.getLogger(__name__)
+
+    @contextmanager
+    def connection(self):
+        """Zapůjčí spojení z poolu, po chybě spojení ho zahodí"""
+        smtp = self._acquire()
+        try:
+            yield smtp
+        except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError):
+            self._discard(smtp)
+            raise
+        except Exception:
+            self._release(smtp)
+            raise
+        else:
+            self._release(smtp)
+
+    def warm_up(self):
+        """Otevře první spojení, pokud pool žádné nemá"""
+        with self._cond:
+            if self._created:
+                return
+        with self.connection():
+            pass
+
+    def close(self):
+        """Zavře všechna nečinná spojení"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for smtp, _ in idle:
+            try:
+                smtp.quit()
+                self.logger.info("Úspěšně odpojeno od SMTP serveru")
+            except Exception as e:
+                self.logger.warning(f"Chyba při odpojování od SMTP: {e}")
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                if self._idle:
+                    smtp, last_used = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    reconnect = self._broken > 0
+                    if reconnect:
+                        self._broken -= 1
+                    smtp = None
+                    break
+                self._cond.wait()
+
+        if smtp is None:
+            return self._create(reconnect)
+
+        if time.monotonic() - last_used >= self.noop_interval:
+            try:
+                smtp.noop()
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError):
+                self.logger.warning("SMTP spojení ztraceno, pokus o znovupřipojení")
+                self._close_quietly(smtp)
+                return self._create(True)
+        return smtp
+
+    def _create(self, reconnect):
+        try:
+            return self.factory(reconnect)
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, smtp):
+        with self._cond:
+            self._idle.append((smtp, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, smtp):
+        self._close_quietly(smtp)
+        with self._cond:
+            self._created -= 1
+            self._broken += 1
+            self._cond.notify()
+
+    def _close_quietly(self, smtp):
+        try:
+            smtp.close()
+        except Exception:
+            pass
 
 class EmailHandler:
     def __init__(self, config):
@@ -15,56 +161,149 @@ class EmailHandler:
                 - email.smtp_server: SMTP server address
                 - email.email_address: Email address
                 - email.password: Password
+                - email.smtp_pool_size: Počet SMTP spojení v poolu (volitelné)
+                - email.noop_interval: Po kolika sekundách nečinnosti ověřit spojení (volitelné)
+                - email.reconnect_attempts: Počet pokusů o připojení (volitelné)
+                - email.reconnect_base_delay: Počáteční prodleva mezi pokusy (volitelné)
+                - email.reconnect_max_delay: Maximální prodleva mezi pokusy (volitelné)
+                - email.fetch_batch_size: Počet zpráv stahovaných jedním příkazem (volitelné)
+                - email.state_file: Soubor s posledním zpracovaným UID (volitelné)
+                - email.claim: Zabírání zpráv při více instancích nad stejnou
+                  schránkou - enabled, instance, lease (volitelné)
         """
-        self.imap_server = config['email']['imap_server']
-        self.smtp_server = config['email']['smtp_server']
-        self.email_address = config['email']['email_address']
-        self.password = config['email']['password']
+        email_config = config['email']
+        self.imap_server = email_config['imap_server']
+        self.smtp_server = email_config['smtp_server']
+        self.email_address = email_config['email_address']
+        self.password = email_config['password']
+        self.noop_interval = email_config.get('noop_interval', 60)
+        self.reconnect_attempts = email_config.get('reconnect_attempts', 5)
+        self.reconnect_base_delay = email_config.get('reconnect_base_delay', 1)
+        self.reconnect_max_delay = email_config.get('reconnect_max_delay', 60)
+        self.fetch_batch_size = email_config.get('fetch_batch_size', 20)
+        self.state_file = email_config.get('state_file', 'imap_state.json')
+        claim_config = email_config.get('claim', {}) or {}
+        self.claim_enabled = claim_config.get('enabled', False)
+        self.claim_lease = claim_config.get('lease', 1800)
+        # Klíčové slovo smí obsahovat jen omezenou sadu znaků
+        self.claim_instance = re.sub(
+            r'[^A-Za-z0-9-]', '-', str(claim_config.get('instance') or socket.gethostname())
+        )
         self.imap = None
-        self.smtp = None
+        self.imap_last_used = 0
+        self.smtp_pool = SMTPPool(
+            self._open_smtp,
+            size=email_config.get('smtp_pool_size', 2),
+            noop_interval=self.noop_interval
+        )
+
+        # Počítadla navázaných spojení pro sledování zbytečného přihlašování
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'imap_handshakes': 0,
+            'imap_reconnects': 0,
+            'smtp_handshakes': 0,
+            'smtp_reconnects': 0,
+        }
         
         # Nastavení loggeru
         self.logger = logging.getLogger(__name__)
-        
+        self.uid_state = self._load_uid_state()
+
+    def _count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def get_connection_stats(self):
+        """Vrátí kopii počítadel navázaných a obnovených spojení"""
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def _connect_with_backoff(self, connect, name):
+        """Volá connect() s exponenciálně rostoucí prodlevou mezi neúspěšnými pokusy"""
+        delay = self.reconnect_base_delay
+        for attempt in range(1, self.reconnect_attempts + 1):
+            try:
+                return connect()
+            except Exception as e:
+                if attempt == self.reconnect_attempts:
+                    raise
+                self.logger.warning(
+                    f"Pokus {attempt} o připojení k {name} selhal: {e}, další pokus za {delay:.0f} s"
+                )
+                time.sleep(delay + random.uniform(0, delay / 2))
+                delay = min(delay * 2, self.reconnect_max_delay)
+
     def connect_imap(self):
         """Připojení k IMAP serveru"""
-        try:
-            self.imap = imaplib.IMAP4_SSL(self.imap_server)
-            self.imap.login(self.email_address, self.password)
-            self.imap.select('inbox')
-            self.logger.info("Úspěšně připojeno k IMAP serveru")
-        except Exception as e:
-            self.logger.error(f"Chyba při připojování k IMAP serveru: {e}")
-            self.imap = None
-            raise
+        reconnect = self.imap_last_used > 0
 
-    def connect_smtp(self):
-        """Připojení k SMTP serveru"""
-        try:
-            self.smtp = smtplib.SMTP_SSL(self.smtp_server, timeout=30)
-            self.smtp.login(self.email_address, self.password)
-            self.logger.info("Úspěšně připojeno k SMTP serveru")
-        except Exception as e:
-            self.logger.error(f"Chyba při připojování k SMTP serveru: {e}")
-            self.smtp = None
-            raise
+        def connect():
+            try:
+                imap = imaplib.IMAP4_SSL(self.imap_server)
+                imap.login(self.email_address, self.password)
+                imap.select('inbox')
+                return imap
+            except Exception as e:
+                self.logger.error(f"Chyba při připojování k IMAP serveru: {e}")
+                raise
 
-    def check_smtp_connection(self):
-        """Kontrola SMTP připojení a případné znovupřipojení"""
-        try:
-            if self.smtp:
-                self.smtp.noop()
-            else:
-                self.connect_smtp()
-        except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException):
-            self.logger.warning("SMTP spojení ztraceno, pokus o znovupřipojení")
+        self.imap = None
+        self.imap = self._connect_with_backoff(connect, 'IMAP')
+        self.imap_last_used = time.monotonic()
+        if self.claim_enabled and not self._keywords_allowed():
+            self.logger.warning(
+                "Schránka nepovoluje vlastní klíčová slova (PERMANENTFLAGS bez \\*), "
+                "zabírání zpráv se vypíná - schránku smí zpracovávat jen jedna instance"
+            )
+            self.claim_enabled = False
+        self._count('imap_handshakes')
+        if reconnect:
+            self._count('imap_reconnects')
+        self.logger.info("Úspěšně připojeno k IMAP serveru")
+
+    def ensure_imap(self):
+        """
+        Ověří živost IMAP spojení (NOOP po delší nečinnosti) a případně ho obnoví
+        """
+        if self.imap:
+            if time.monotonic() - self.imap_last_used < self.noop_interval:
+                return
             try:
-                self.smtp = None
-                self.connect_smtp()
+                self.imap.noop()
+                self.imap_last_used = time.monotonic()
+                return
             except Exception as e:
-                self.logger.error(f"Nelze obnovit SMTP spojení: {e}")
+                self.logger.warning(f"IMAP spojení ztraceno, pokus o znovupřipojení: {e}")
+                try:
+                    self.imap.shutdown()
+                except Exception:
+                    pass
+                self.imap = None
+        self.connect_imap()
+
+    def _open_smtp(self, reconnect=False):
+        """Otevře a přihlásí nové SMTP spojení (factory pro SMTPPool)"""
+        def connect():
+            try:
+                smtp = smtplib.SMTP_SSL(self.smtp_server, timeout=30)
+                smtp.login(self.email_address, self.password)
+                return smtp
+            except Exception as e:
+                self.logger.error(f"Chyba při připojování k SMTP serveru: {e}")
                 raise
 
+        smtp = self._connect_with_backoff(connect, 'SMTP')
+        self._count('smtp_handshakes')
+        if reconnect:
+            self._count('smtp_reconnects')
+        self.logger.info("Úspěšně připojeno k SMTP serveru")
+        return smtp
+
+    def connect_smtp(self):
+        """Připojení k SMTP serveru (naváže první spojení v poolu)"""
+        self.smtp_pool.warm_up()
+
     def disconnect(self):
         """Bezpečné odpojení od IMAP a SMTP serverů"""
         if self.imap:
@@ -75,50 +314,396 @@ class EmailHandler:
                 self.logger.warning(f"Chyba při odpojování od IMAP: {e}")
             finally:
                 self.imap = None
-                
-        if self.smtp:
+
+        self.smtp_pool.close()
+
+    def supports_idle(self):
+        """Vrátí True, pokud IMAP server podporuje příkaz IDLE"""
+        if not self.imap:
+            self.connect_imap()
+        if 'IDLE' in self.imap.capabilities:
+            return True
+        # Některé servery rozšíří seznam schopností až po přihlášení
+        typ, data = self.imap.capability()
+        if typ == 'OK' and data and data[0]:
+            self.imap.capabilities = tuple(data[0].decode('ascii', 'ignore').upper().split())
+        return 'IDLE' in self.imap.capabilities
+
+    def idle(self, timeout=DEFAULT_IDLE_TIMEOUT):
+        """
+        Čeká v režimu IMAP IDLE na novou zprávu ve schránce.
+
+        Vrací se při první notifikaci EXISTS nebo po uplynutí timeoutu, aby šlo
+        IDLE obnovit dřív, než ho server sám ukončí. EXISTS přijaté už během
+        předchozích příkazů (FETCH, STORE) se vrátí hned bez IDLE. Při chybě
+        spojení se IMAP připojení zahodí a výjimka se předá volajícímu, který
+        před dalším pokusem počká (spojení se naváže znovu v dalším cyklu).
+
+        Args:
+            timeout (int): Maximální doba čekání v sekundách
+
+        Returns:
+            bool: True pokud přišla nová zpráva
+
+        Raises:
+            Exception: Chyba spojení během IDLE
+        """
+        if not self.imap:
+            self.connect_imap()
+
+        imap = self.imap
+        # imaplib si neoznačené odpovědi předchozích příkazů ukládá
+        if imap.untagged_responses.pop('EXISTS', None):
+            self.logger.debug("Nová zpráva ohlášena během předchozích příkazů")
+            return True
+
+        tag = imap._new_tag()
+        new_mail = False
+
+        try:
+            imap.send(tag + b' IDLE\r\n')
+            line = self._read_idle_line(imap, 30)
+            if line is None or not line.startswith(b'+'):
+                raise imaplib.IMAP4.error(f"Server odmítl IDLE: {line!r}")
+            self.logger.debug("Čekám na nové emaily (IDLE)")
+
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                line = self._read_idle_line(imap, remaining)
+                if line is None:
+                    break
+                if EXISTS_RESPONSE.match(line):
+                    new_mail = True
+                    break
+
+            # Ukončení IDLE a dočtení odpovědi s tagem
+            imap.send(b'DONE\r\n')
+            while True:
+                line = self._read_idle_line(imap, 30)
+                if line is None:
+                    raise imaplib.IMAP4.abort("Server nepotvrdil ukončení IDLE")
+                if line.startswith(tag):
+                    break
+                if EXISTS_RESPONSE.match(line):
+                    new_mail = True
+            self.imap_last_used = time.monotonic()
+            return new_mail
+
+        except Exception as e:
+            self.logger.warning(f"IDLE selhal, IMAP spojení bude obnoveno: {e}")
             try:
-                self.check_smtp_connection()
-                self.smtp.quit()
-                self.logger.info("Úspěšně odpojeno od SMTP serveru")
-            except Exception as e:
-                self.logger.warning(f"Chyba při odpojování od SMTP: {e}")
-            finally:
-                self.smtp = None
+                imap.shutdown()
+            except Exception:
+                pass
+            self.imap = None
+            raise
 
-    def fetch_unseen_emails(self):
+    @staticmethod
+    def _buffered(imap):
         """
-        Načtení nepřečtených emailů
-        
+        Jsou v bufferu imaplib nebo TLS data k přečtení? Neblokuje.
+
+        Takové řádky select na socketu neohlásí, protože už jsou přečtené
+        ze socketu.
+        """
+        sock = imap.sock
+        # Dešifrovaná data v TLS spojení, která si ještě nikdo nepřečetl
+        if isinstance(sock, ssl.SSLSocket) and sock.pending():
+            return True
+        original_timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            return bool(imap.file.peek(1))
+        except (ssl.SSLWantReadError, BlockingIOError):
+            # Buffer je prázdný a na socketu nic nečeká
+            return False
+        finally:
+            sock.settimeout(original_timeout)
+
+    def _read_idle_line(self, imap, timeout):
+        """
+        Načte jeden řádek odpovědi přes čtecí buffer imaplib.
+
+        Na data se čeká přes select, timeout se na soubor spojení nenastavuje
+        (po socket.timeout by z něj už nešlo číst).
+
+        Returns:
+            bytes: Řádek bez CRLF, nebo None, pokud do timeoutu nic nepřišlo
+        """
+        if not self._buffered(imap):
+            ready, _, _ = select.select([imap.sock], [], [], timeout)
+            if not ready:
+                return None
+        return imap._get_line()
+
+    def _load_uid_state(self):
+        """Načte poslední zpracované UID ze souboru se stavem"""
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as file:
+                    return json.load(file)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Nelze načíst stav IMAP ze souboru {self.state_file}: {e}")
+        return {'uidvalidity': None, 'last_uid': 0}
+
+    def _save_uid_state(self):
+        """Atomicky uloží poslední zpracované UID"""
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as file:
+            json.dump(self.uid_state, file)
+        os.replace(tmp_file, self.state_file)
+
+    def _get_uidvalidity(self):
+        status, data = self.imap.status('INBOX', '(UIDVALIDITY)')
+        match = UIDVALIDITY_RESPONSE.search(data[0]) if status == 'OK' and data else None
+        return int(match.group(1)) if match else None
+
+    def _keywords_allowed(self):
+        """Zda lze zprávám trvale nastavit vlastní klíčové slovo (PERMANENTFLAGS obsahuje \\*)"""
+        _, data = self.imap.response('PERMANENTFLAGS')
+        flags = b' '.join(item for item in data if isinstance(item, bytes))
+        # Bez PERMANENTFLAGS smí klient podle RFC 3501 měnit všechny příznaky
+        return not flags or b'\\*' in flags
+
+    def _claim_lease_number(self):
+        return int(time.time() // self.claim_lease)
+
+    def _claim_keyword(self, lease=None):
+        return f"{CLAIM_PREFIX}{self.claim_instance}_{self._claim_lease_number() if lease is None else lease}"
+
+    def _claims(self, flags):
+        """
+        Rozdělí zabrání zprávy podle FLAGS na vlastní, platná cizí a prošlá cizí.
+
+        Cizí zabrání je prošlé, pokud je starší než jeden až dva lease (podle
+        čísla období v klíčovém slově), nebo číslo období nemá.
+        """
+        own, foreign, stale = [], [], []
+        current = self._claim_lease_number()
+        for flag in flags:
+            if not flag.startswith(CLAIM_PREFIX):
+                continue
+            instance, lease = _claim_owner(flag)
+            if instance == self.claim_instance:
+                own.append(flag)
+            elif not lease.isdigit() or current - int(lease) >= CLAIM_EXPIRY:
+                stale.append(flag)
+            else:
+                foreign.append(flag)
+        return own, foreign, stale
+
+    def _fetch_flags(self, uids):
+        """Vrátí UID -> seznam příznaků zprávy (str)"""
+        status, msg_data = self.imap.uid('FETCH', ','.join(str(uid) for uid in uids), '(UID FLAGS)')
+        self.imap_last_used = time.monotonic()
+        return {
+            items['UID']: [bytes(flag).decode('ascii', 'ignore') for flag in items.get('FLAGS') or []]
+            for items in parse_fetch_response(msg_data) if items.get('UID')
+        }
+
+    def _store_flags(self, uids, command, flags):
+        if not uids or not flags:
+            return
+        status, data = self.imap.uid('STORE', ','.join(str(uid) for uid in uids), command, f"({' '.join(flags)})")
+        self.imap_last_used = time.monotonic()
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"STORE {command} {' '.join(flags)} selhal: {data}")
+
+    def _claim(self, uids):
+        """
+        Zabere zprávy pro tuto instanci vlastním klíčovým slovem.
+
+        Zabrání probíhá jako zápis a následné ověření: zpráva patří instanci,
+        jen pokud po zápisu nemá platné zabrání jiné instance a není přečtená.
+        Při souběhu rozhoduje název instance: instance s vyšším názvem ustoupí,
+        instance s nejnižším názvem své zabrání ponechá a zprávu převezme
+        v dalším cyklu, pokud do té doby cizí zabrání zmizí. Zůstane-li cizí
+        zabrání, jeho instance zprávu zabrala dřív a vlastní zabrání se
+        odebere. Zprávu tak nikdy nezpracují dvě instance a souběžné instance
+        neustupují dokola. Prošlá zabrání (instance spadla dřív, než zprávu
+        označila jako přečtenou) se převezmou.
+
         Returns:
-            list: Seznam nepřečtených emailů
+            list: UID zabraných zpráv
         """
+        candidates, withdrawn = [], []
+        stale_flags = set()
+        for uid, flags in self._fetch_flags(uids).items():
+            own, foreign, stale = self._claims(flags)
+            if '\\Seen' in flags or foreign:
+                if own and foreign:
+                    withdrawn.append(uid)
+                continue
+            if stale:
+                self.logger.warning(f"Přebírám prošlé zabrání zprávy {uid}: {', '.join(stale)}")
+                stale_flags.update(stale)
+            candidates.append(uid)
+        if withdrawn:
+            self.logger.info(f"Zprávy {withdrawn} zabrala jiná instance")
+            self._release(withdrawn)
+        if not candidates:
+            return []
+
+        self._store_flags(candidates, '+FLAGS.SILENT', [self._claim_keyword()])
+        self._store_flags(candidates, '-FLAGS.SILENT', sorted(stale_flags))
+
+        claimed, deferred, lost = [], [], []
+        for uid, flags in self._fetch_flags(candidates).items():
+            _, foreign, _ = self._claims(flags)
+            if '\\Seen' in flags or any(_claim_owner(flag)[0] < self.claim_instance for flag in foreign):
+                lost.append(uid)
+            elif foreign:
+                # Souběh s instancí s vyšším názvem - ta ustoupí, zabrání necháme na další cyklus
+                deferred.append(uid)
+            else:
+                claimed.append(uid)
+        if deferred:
+            self.logger.info(f"Zprávy {deferred} zabírá souběžně i jiná instance, převezmou se v dalším cyklu")
+        if lost:
+            self.logger.info(f"Zprávy {lost} zabrala jiná instance")
+            self._release(lost)
+        return sorted(claimed)
+
+    def _release(self, uids):
+        """Odebere zprávám zabrání této instance (starší jsou už prošlá a převezmou se)"""
+        current = self._claim_lease_number()
+        self._store_flags(uids, '-FLAGS.SILENT', [
+            self._claim_keyword(lease) for lease in range(current - CLAIM_EXPIRY, current + 1)
+        ])
+
+    def fetch_unseen_emails(self, batch_size=None, throttle=None):
+        """
+        Postupné načítání nepřečtených emailů po dávkách podle UID
+
+        Stahují se jen hlavičky From/Subject a BODYSTRUCTURE, aby šlo odesílatele
+        a úkol ověřit ještě před stažením těla a příloh (viz fetch_message_parts).
+        Celá dávka se načte jedním příkazem UID FETCH a zprávy se předávají
+        volajícímu hned po rozparsování. Další dávka se stáhne až poté, co
+        volající zpracuje předchozí. Poslední zpracované UID se ukládá do
+        souboru se stavem, takže po restartu se schránka neprochází znovu.
+
+        Se zapnutým email.claim se zprávy každé dávky před stažením zaberou
+        (viz _claim), takže více instancí nad stejnou schránkou nezpracuje
+        stejnou zprávu dvakrát. Prochází se pak všechny nepřečtené zprávy,
+        protože zprávu zabranou jinou instancí může být potřeba převzít.
+
+        Args:
+            batch_size (int, optional): Počet zpráv v jedné dávce
+            throttle (callable, optional): Volá se před stažením každé dávky,
+                blokuje dokud navazující zpracování nemá volnou kapacitu
+
+        Yields:
+            dict: Slovník obsahující 'uid', 'uidvalidity', 'msg' (email.message.Message jen s hlavičkami),
+                'parts' (části zprávy z BODYSTRUCTURE, viz imap_parser.flatten_bodystructure)
+                a 'size' (velikost celé zprávy v bytes)
+        """
+        batch_size = batch_size or self.fetch_batch_size
         try:
             if not self.imap:
                 self.connect_imap()
-                
-            status, messages = self.imap.search(None, '(UNSEEN)')
-            email_id_list = messages[0].split()
-            emails = []
-            
-            for email_id in email_id_list:
-                try:
-                    status, msg_data = self.imap.fetch(email_id, '(RFC822)')
-                    for response_part in msg_data:
-                        if isinstance(response_part, tuple):
-                            msg = email.message_from_bytes(response_part[1])
-                            emails.append(msg)
-                except Exception as e:
-                    self.logger.error(f"Chyba při načítání emailu {email_id}: {e}")
-                    continue
-                    
-            self.logger.info(f"Úspěšně načteno {len(emails)} nepřečtených emailů")
-            return emails
-            
+
+            # Při změně UIDVALIDITY už uložené UID neplatí
+            uidvalidity = self._get_uidvalidity()
+            if uidvalidity != self.uid_state.get('uidvalidity'):
+                self.uid_state = {'uidvalidity': uidvalidity, 'last_uid': 0}
+
+            last_uid = 0 if self.claim_enabled else self.uid_state['last_uid']
+            with STAGE_SECONDS.time(stage='imap_fetch'):
+                status, messages = self.imap.uid('SEARCH', None, f'(UNSEEN UID {last_uid + 1}:*)')
+            self.imap_last_used = time.monotonic()
+            # Rozsah "N:*" vrací vždy i nejvyšší UID, i když je menší než N
+            uids = sorted(int(uid) for uid in messages[0].split() if int(uid) > last_uid)
         except Exception as e:
             self.logger.error(f"Chyba při načítání nepřečtených emailů: {e}")
             raise
 
+        fetched = 0
+        for i in range(0, len(uids), batch_size):
+            if throttle:
+                throttle()
+            batch_uids = uids[i:i + batch_size]
+            batch = ','.join(str(uid) for uid in batch_uids)
+            try:
+                if self.claim_enabled:
+                    batch_uids = self._claim(batch_uids)
+                    if not batch_uids:
+                        continue
+                    batch = ','.join(str(uid) for uid in batch_uids)
+                with STAGE_SECONDS.time(stage='imap_fetch'):
+                    status, msg_data = self.imap.uid('FETCH', batch, HEADER_FETCH_ITEMS)
+                self.imap_last_used = time.monotonic()
+                responses = parse_fetch_response(msg_data)
+            except Exception as e:
+                self.logger.error(f"Chyba při načítání emailů {batch}: {e}")
+                raise
+
+            # UID předaných (a nečitelných) zpráv - označí se i při přerušení uprostřed dávky
+            handled = []
+            try:
+                for items in responses:
+                    uid = items.get('UID')
+                    if not uid:
+                        continue
+                    try:
+                        msg = email.message_from_bytes(bytes(find_section(items, 'BODY[HEADER') or b''))
+                        parts = flatten_bodystructure(items.get('BODYSTRUCTURE'))
+                    except Exception as e:
+                        self.logger.error(f"Chyba při načítání emailu {uid}: {e}")
+                        handled.append(uid)
+                        continue
+                    fetched += 1
+                    yield {'uid': uid, 'uidvalidity': uidvalidity, 'msg': msg, 'parts': parts,
+                           'size': items.get('RFC822.SIZE', 0)}
+                    handled.append(uid)
+                    self.uid_state['last_uid'] = max(self.uid_state['last_uid'], uid)
+            finally:
+                # BODY.PEEK příznak \Seen nenastavuje, označíme zprávy dávky najednou
+                if handled:
+                    self.imap.uid('STORE', ','.join(str(uid) for uid in handled), '+FLAGS.SILENT', '(\\Seen)')
+                if self.claim_enabled:
+                    self._release(batch_uids)
+                self._save_uid_state()
+
+        self.logger.info(f"Úspěšně načteno {fetched} nepřečtených emailů")
+
+    def fetch_message_parts(self, uid, parts, decode=True):
+        """
+        Stáhne vybrané části zprávy (BODY.PEEK[část]) jedním příkazem
+
+        Args:
+            uid (int): UID zprávy
+            parts (list): Části zprávy z fetch_unseen_emails, které se mají stáhnout
+            decode (bool): False = vrátit obsah zakódovaný podle Content-Transfer-Encoding
+                (přílohy se pak dekódují po blocích rovnou do dočasného souboru)
+
+        Returns:
+            dict: Číslo části -> obsah (bytes)
+        """
+        if not parts:
+            return {}
+        if not self.imap:
+            self.connect_imap()
+
+        items = ' '.join(f"BODY.PEEK[{part['part']}]" for part in parts)
+        try:
+            with STAGE_SECONDS.time(stage='imap_parts'):
+                status, msg_data = self.imap.uid('FETCH', str(uid), f'({items})')
+            self.imap_last_used = time.monotonic()
+            responses = parse_fetch_response(msg_data)
+        except Exception as e:
+            self.logger.error(f"Chyba při stahování částí emailu {uid}: {e}")
+            raise
+
+        fetched = responses[0] if responses else {}
+        contents = {}
+        for part in parts:
+            data = fetched.get(f"BODY[{part['part']}]")
+            contents[part['part']] = decode_transfer_encoding(data, part['encoding']) if decode else bytes(data or b'')
+        return contents
+
     def send_email(self, to_address, subject, body, attachment=None, max_retries=3):
         """
         Odeslání emailu s možností opakování při selhání
@@ -133,37 +718,35 @@ class EmailHandler:
         Returns:
             bool: True pokud byl email úspěšně odeslán
         """
+        msg = EmailMessage()
+        msg['Subject'] = subject
+        msg['From'] = self.email_address
+        msg['To'] = to_address
+        msg.set_content(body)
+
+        if attachment:
+            msg.add_attachment(
+                attachment['content'],
+                maintype='application',
+                subtype='octet-stream',
+                filename=attachment['filename']
+            )
+
         for attempt in range(max_retries):
             try:
-                self.check_smtp_connection()
-                
-                msg = EmailMessage()
-                msg['Subject'] = subject
-                msg['From'] = self.email_address
-                msg['To'] = to_address
-                msg.set_content(body)
-
-                if attachment:
-                    msg.add_attachment(
-                        attachment['content'],
-                        maintype='application',
-                        subtype='octet-stream',
-                        filename=attachment['filename']
-                    )
-
-                self.smtp.send_message(msg)
+                with STAGE_SECONDS.time(stage='smtp'), self.smtp_pool.connection() as smtp:
+                    smtp.send_message(msg)
                 self.logger.info(f"Email úspěšně odeslán na {to_address}")
                 return True
 
             except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException) as e:
+                # Vadné spojení pool sám zahodí, další pokus dostane nové
                 self.logger.warning(f"Pokus {attempt + 1} o odeslání selhal: {e}")
-                self.smtp = None  # Reset spojení
-                
+
                 if attempt == max_retries - 1:
                     self.logger.error("Vyčerpány všechny pokusy o odeslání emailu")
                     raise
-                    
+
             except Exception as e:
                 self.logger.error(f"Neočekávaná chyba při odesílání emailu: {e}")
                 raise
-
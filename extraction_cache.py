@@ -0,0 +1,98 @@
+# extraction_cache.py
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from threading import Lock
+
+class ExtractionCache:
+    def __init__(self, path='extraction_cache.sqlite', max_mb=500):
+        """
+        Diskový cache textu extrahovaného z příloh (SQLite, text komprimovaný zlib).
+
+        Klíčem je SHA-256 obsahu přílohy spolu s verzí extraktoru, takže stejná
+        příloha poslaná znovu (i pod jiným názvem) se nemusí parsovat.
+
+        Args:
+            path (str): Soubor databáze
+            max_mb (int): Maximální velikost komprimovaných textů (MB), nad ní se
+                mažou nejdéle nepoužité
+        """
+        self.max_bytes = max_mb * 1024 * 1024
+        self.lock = Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.logger = logging.getLogger(__name__)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS extractions ('
+            'key TEXT PRIMARY KEY, text BLOB, truncated TEXT, accessed REAL, size INTEGER)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS extractions_accessed ON extractions (accessed)')
+        self.db.commit()
+
+    @staticmethod
+    def make_key(content, *parts):
+        """Klíč z hashe obsahu a dalších parametrů ovlivňujících výsledek (verze, přípona, limit)"""
+        digest = hashlib.sha256(content).hexdigest()
+        return ':'.join([digest] + [str(part) for part in parts])
+
+    def get(self, key):
+        """Vrátí (text, truncated), nebo None pokud v cache není"""
+        with self.lock:
+            row = self.db.execute('SELECT text, truncated FROM extractions WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.counters['misses'] += 1
+                return None
+            self.db.execute('UPDATE extractions SET accessed = ? WHERE key = ?', (time.time(), key))
+            self.db.commit()
+            self.counters['hits'] += 1
+        return zlib.decompress(row[0]).decode('utf-8'), row[1]
+
+    def set(self, key, text, truncated=None):
+        data = zlib.compress(text.encode('utf-8'))
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO extractions (key, text, truncated, accessed, size) VALUES (?, ?, ?, ?, ?)',
+                (key, data, truncated, time.time(), len(data))
+            )
+            self._evict()
+            self.db.commit()
+
+    def stats(self):
+        """Vrátí kopii počítadel zásahů a výpadků cache"""
+        with self.lock:
+            return dict(self.counters)
+
+    def _evict(self):
+        """Smaže nejdéle nepoužité texty nad limit velikosti"""
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM extractions').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute('SELECT key, size FROM extractions ORDER BY accessed').fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute('DELETE FROM extractions WHERE key = ?', (key,))
+            total -= size
+            self.counters['evictions'] += 1
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def create_extraction_cache(config):
+    """Vytvoří cache podle extraction.cache konfigurace, nebo None pokud je vypnutá"""
+    cache_config = (config.get('extraction', {}) or {}).get('cache', {}) or {}
+    if not cache_config.get('enabled', False):
+        return None
+    return ExtractionCache(
+        path=cache_config.get('path', 'extraction_cache.sqlite'),
+        max_mb=cache_config.get('max_mb', 500)
+    )
@@ -0,0 +1,254 @@
+# imap_parser.py
+
+import base64
+import binascii
+import email.header
+import email.utils
+import quopri
+import re
+import urllib.parse
+
+# Literál na konci řádku odpovědi, např. "BODY[1] {1234}"
+LITERAL_MARKER = re.compile(rb'\{\d+\}$')
+
+# Tokeny odpovědi: závorky, řetězce v uvozovkách, atomy včetně "BODY[...]<n>"
+TOKEN = re.compile(
+    rb'\s*(?:(?P<open>\()|(?P<close>\))|"(?P<quoted>(?:[^"\\]|\\.)*)"'
+    rb'|(?P<section>[^\s()"\[]+\[[^\]]*\](?:<\d+>)?)|(?P<atom>[^\s()"]+))'
+)
+
+# Velikost bloku zakódovaného obsahu při postupném dekódování
+DECODE_CHUNK_SIZE = 64 * 1024
+
+class _Literal(bytes):
+    """Obsah literálu z odpovědi serveru (odlišený od atomů)"""
+
+def _tokenize_text(text):
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if not match:
+            break
+        pos = match.end()
+        if match.group('open'):
+            yield '('
+        elif match.group('close'):
+            yield ')'
+        elif match.group('quoted') is not None:
+            yield re.sub(rb'\\(.)', rb'\1', match.group('quoted'))
+        elif match.group('section'):
+            yield match.group('section')
+        else:
+            atom = match.group('atom')
+            yield None if atom.upper() == b'NIL' else atom
+
+def _tokenize(msg_data):
+    for item in msg_data:
+        if isinstance(item, tuple):
+            text, literal = item
+            yield from _tokenize_text(LITERAL_MARKER.sub(b'', text.rstrip()))
+            yield _Literal(literal)
+        elif item:
+            yield from _tokenize_text(item)
+
+def _build(tokens):
+    """Sestaví z tokenů vnořené seznamy podle závorek"""
+    root = []
+    stack = [root]
+    for token in tokens:
+        if token == '(':
+            child = []
+            stack[-1].append(child)
+            stack.append(child)
+        elif token == ')':
+            if len(stack) > 1:
+                stack.pop()
+        else:
+            stack[-1].append(token)
+    return root
+
+def parse_fetch_response(msg_data):
+    """
+    Rozparsuje odpověď na příkaz (UID) FETCH z imaplib.
+
+    Parametry:
+        msg_data (list): Data vrácená imaplib (řetězce a dvojice s literály).
+
+    Návratová hodnota:
+        list: Slovník pro každou zprávu, klíče jsou názvy položek velkými písmeny
+            (např. 'UID', 'RFC822.SIZE', 'BODYSTRUCTURE', 'BODY[1]').
+    """
+    tree = _build(_tokenize(msg_data))
+    responses = []
+    for element in tree:
+        if not isinstance(element, list):
+            # Pořadové číslo zprávy před seznamem položek
+            continue
+        items = {}
+        for i in range(0, len(element) - 1, 2):
+            key = element[i]
+            if isinstance(key, bytes):
+                items[key.decode('ascii', 'ignore').upper()] = element[i + 1]
+        for key in ('UID', 'RFC822.SIZE'):
+            if isinstance(items.get(key), bytes):
+                items[key] = int(items[key])
+        responses.append(items)
+    return responses
+
+def find_section(items, prefix):
+    """Vrátí obsah první položky začínající na prefix, např. 'BODY[HEADER'"""
+    for key, value in items.items():
+        if key.startswith(prefix):
+            return value
+    return None
+
+def _text(value):
+    if value is None:
+        return None
+    return bytes(value).decode('utf-8', errors='replace')
+
+def _params(values):
+    """Převede seznam (klíč hodnota ...) na slovník s klíči malými písmeny"""
+    params = {}
+    if isinstance(values, list):
+        for i in range(0, len(values) - 1, 2):
+            if values[i] is not None:
+                params[_text(values[i]).lower()] = _text(values[i + 1])
+    return params
+
+def _filename(params):
+    # RFC 2231 (filename*=utf-8''...) nebo RFC 2047 (=?utf-8?...?=)
+    for key in ('filename*', 'name*'):
+        if params.get(key):
+            charset, _, value = email.utils.decode_rfc2231(params[key])
+            try:
+                return urllib.parse.unquote(value, encoding=charset or 'utf-8', errors='replace')
+            except LookupError:
+                return urllib.parse.unquote(value)
+    for key in ('filename', 'name'):
+        if params.get(key):
+            decoded = []
+            for value, charset in email.header.decode_header(params[key]):
+                if isinstance(value, bytes):
+                    value = value.decode(charset or 'utf-8', errors='replace')
+                decoded.append(value)
+            return ''.join(decoded)
+    return None
+
+def flatten_bodystructure(structure, prefix=''):
+    """
+    Převede BODYSTRUCTURE na seznam koncových částí zprávy.
+
+    Parametry:
+        structure (list): Hodnota položky BODYSTRUCTURE z parse_fetch_response.
+        prefix (str): Číslo nadřazené části (pro rekurzi).
+
+    Návratová hodnota:
+        list: Slovníky s klíči 'part' (číslo pro BODY[...]), 'content_type',
+            'charset', 'encoding', 'size', 'disposition' a 'filename'.
+    """
+    if not isinstance(structure, list) or not structure:
+        return []
+
+    if isinstance(structure[0], list):
+        # multipart: nejdřív podčásti, pak podtyp a rozšíření
+        parts = []
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            number = f"{prefix}.{index}" if prefix else str(index)
+            parts.extend(flatten_bodystructure(child, number))
+        return parts
+
+    content_type = f"{_text(structure[0])}/{_text(structure[1])}".lower()
+    params = _params(structure[2] if len(structure) > 2 else None)
+    encoding = (_text(structure[5]) or '7bit').lower() if len(structure) > 5 else '7bit'
+    size = int(structure[6]) if len(structure) > 6 and structure[6] is not None else 0
+
+    # Pozice rozšíření závisí na typu části (RFC 3501, 7.4.2)
+    if content_type.startswith('text/'):
+        disposition_index = 9
+    elif content_type == 'message/rfc822':
+        disposition_index = 11
+    else:
+        disposition_index = 8
+    disposition = None
+    disposition_params = {}
+    if len(structure) > disposition_index and isinstance(structure[disposition_index], list):
+        disposition_value = structure[disposition_index]
+        disposition = (_text(disposition_value[0]) or '').lower()
+        if len(disposition_value) > 1:
+            disposition_params = _params(disposition_value[1])
+
+    return [{
+        'part': prefix or '1',
+        'content_type': content_type,
+        'charset': params.get('charset'),
+        'encoding': encoding,
+        'size': size,
+        'disposition': disposition,
+        'filename': _filename(disposition_params) or _filename(params),
+    }]
+
+def decode_transfer_encoding(data, encoding):
+    """Dekóduje obsah části podle Content-Transfer-Encoding"""
+    data = bytes(data or b'')
+    encoding = (encoding or '').lower()
+    if encoding == 'base64':
+        try:
+            return base64.b64decode(data)
+        except (binascii.Error, ValueError):
+            return base64.b64decode(re.sub(rb'[^A-Za-z0-9+/=]', b'', data) + b'==')
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(data)
+    return data
+
+def _encoded_bytes(chunk):
+    """Úsek zakódovaného obsahu jako bytes (email.message drží obsah jako str)"""
+    if isinstance(chunk, bytes):
+        return chunk
+    try:
+        return chunk.encode('ascii', 'surrogateescape')
+    except UnicodeError:
+        return chunk.encode('raw-unicode-escape')
+
+def iter_transfer_decoded(data, encoding, chunk_size=DECODE_CHUNK_SIZE):
+    """
+    Dekóduje obsah části po blocích podle Content-Transfer-Encoding.
+
+    Na rozdíl od decode_transfer_encoding nevytváří najednou dekódovanou
+    kopii celého obsahu. Obsah může být str (email.message) i bytes.
+    """
+    encoding = (encoding or '').lower()
+    if encoding == 'base64':
+        pending = b''
+        for start in range(0, len(data), chunk_size):
+            pending += re.sub(rb'[^A-Za-z0-9+/]', b'', _encoded_bytes(data[start:start + chunk_size]))
+            usable = len(pending) - len(pending) % 4
+            if usable:
+                yield base64.b64decode(pending[:usable])
+                pending = pending[usable:]
+        # Zbytek bez doplnění '=' (jeden znak navíc nenese celý byte)
+        if len(pending) > 1:
+            yield base64.b64decode(pending + b'=' * (-len(pending) % 4))
+    elif encoding == 'quoted-printable':
+        # Dělí se na koncích řádků, aby se nerozdělila sekvence =XX ani měkký zlom řádku
+        newline = '\n' if isinstance(data, str) else b'\n'
+        start = 0
+        while start < len(data):
+            end = data.find(newline, start + chunk_size)
+            end = len(data) if end < 0 else end + 1
+            yield quopri.decodestring(_encoded_bytes(data[start:end]))
+            start = end
+    else:
+        for start in range(0, len(data), chunk_size):
+            yield _encoded_bytes(data[start:start + chunk_size])
+
+def decoded_size(part):
+    """Odhad velikosti části po dekódování (BODYSTRUCTURE uvádí zakódovanou velikost)"""
+    if part['encoding'] == 'base64':
+        return part['size'] * 3 // 4
+    return part['size']
@@ -0,0 +1,195 @@
+# job_queue.py
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+from attachment_processor import read_content, spool_content
+
+# Pole jobu, která se neukládají (obsah zpráv, mezivýsledky převodu do PDF)
+TRANSIENT_FIELDS = ('msg', 'parts', 'attachments', 'attachment', 'html', 'job_id')
+
+# Pole, která po dosažení stupně už nejsou potřeba
+DROPPED_FIELDS = {
+    'fetched': (),
+    'extracted': ('body',),
+    'batched': ('body', 'content', 'prompt'),
+    'answered': ('body', 'content', 'prompt'),
+}
+
+class JobQueue:
+    def __init__(self, path='job_queue.sqlite', max_attempts=3, keep_days=7):
+        """
+        Trvalá fronta emailů mezi načtením a odesláním odpovědi (SQLite).
+
+        U každého emailu se ukládá dosažený stupeň (fetched, extracted,
+        answered, sent) a data potřebná pro navázání. Po restartu se
+        nedokončené joby zpracují od uloženého stupně, joby s odpovědí
+        tedy AI znovu nevolají.
+
+        Args:
+            path (str): Soubor databáze
+            max_attempts (int): Po kolika neúspěšných pokusech se job vzdá (stupeň 'failed')
+            keep_days (int): Jak dlouho se drží záznamy dokončených jobů (kvůli
+                rozpoznání znovu načtených zpráv)
+        """
+        self.max_attempts = max_attempts
+        self.keep_days = keep_days
+        self.lock = Lock()
+        self.logger = logging.getLogger(__name__)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, source TEXT UNIQUE, stage TEXT, data TEXT, '
+            'attempts INTEGER DEFAULT 0, error TEXT, created REAL, updated REAL)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS jobs_stage ON jobs (stage)')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS job_files ('
+            'job_id INTEGER, position INTEGER, content BLOB, PRIMARY KEY (job_id, position))'
+        )
+        self.db.commit()
+
+    @staticmethod
+    def _data(job, stage):
+        dropped = DROPPED_FIELDS.get(stage, ())
+        data = {key: value for key, value in job.items()
+                if key not in TRANSIENT_FIELDS and key not in dropped}
+        if stage == 'fetched':
+            data['attachments'] = [
+                {key: attachment[key] for key in ('filename', 'content_type', 'size')}
+                for attachment in job.get('attachments', [])
+            ]
+        return json.dumps(data)
+
+    def contains(self, source):
+        """Je zpráva už ve frontě (i dokončená)?"""
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM jobs WHERE source = ?', (source,)).fetchone() is not None
+
+    def add(self, job, source):
+        """
+        Uloží nově načtený job včetně obsahu příloh a nastaví job['job_id'].
+
+        Returns:
+            bool: False, pokud už zpráva ve frontě je
+        """
+        now = time.time()
+        with self.lock:
+            try:
+                cursor = self.db.execute(
+                    'INSERT INTO jobs (source, stage, data, created, updated) VALUES (?, ?, ?, ?, ?)',
+                    (source, 'fetched', self._data(job, 'fetched'), now, now)
+                )
+            except sqlite3.IntegrityError:
+                return False
+            job['job_id'] = cursor.lastrowid
+            self.db.executemany(
+                'INSERT INTO job_files (job_id, position, content) VALUES (?, ?, ?)',
+                [(job['job_id'], position, read_content(attachment))
+                 for position, attachment in enumerate(job.get('attachments', []))]
+            )
+            self.db.commit()
+        return True
+
+    def advance(self, job, stage):
+        """Uloží job po dokončení stupně, po 'sent' se data smažou"""
+        if 'job_id' not in job:
+            return
+        data = None if stage == 'sent' else self._data(job, stage)
+        with self.lock:
+            self.db.execute(
+                'UPDATE jobs SET stage = ?, data = ?, error = NULL, updated = ? WHERE id = ?',
+                (stage, data, time.time(), job['job_id'])
+            )
+            # Obsah příloh je po extrakci zbytečný
+            self.db.execute('DELETE FROM job_files WHERE job_id = ?', (job['job_id'],))
+            self.db.commit()
+
+    def fail(self, job, error):
+        """
+        Zaznamená neúspěšný pokus, job zůstane na dosaženém stupni a zkusí se
+        znovu po restartu. Po max_attempts pokusech se vzdá.
+        """
+        if 'job_id' not in job:
+            return
+        with self.lock:
+            self.db.execute(
+                'UPDATE jobs SET attempts = attempts + 1, error = ?, updated = ? WHERE id = ?',
+                (str(error), time.time(), job['job_id'])
+            )
+            attempts = self.db.execute('SELECT attempts FROM jobs WHERE id = ?', (job['job_id'],)).fetchone()[0]
+            if attempts >= self.max_attempts:
+                self.db.execute("UPDATE jobs SET stage = 'failed', data = NULL WHERE id = ?", (job['job_id'],))
+                self.db.execute('DELETE FROM job_files WHERE job_id = ?', (job['job_id'],))
+            self.db.commit()
+        if attempts >= self.max_attempts:
+            self.logger.error(f"Job {job['job_id']} se nepodařilo zpracovat ani na {attempts}. pokus: {error}")
+
+    def pending(self):
+        """
+        Nedokončené joby k navázání po restartu.
+
+        Returns:
+            list: Dvojice (stupeň, job) v pořadí načtení, přílohy joby ve stupni
+                'fetched' mají obsah ve spooled souboru ('file')
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, stage, data FROM jobs WHERE stage IN ('fetched', 'extracted', 'answered') ORDER BY id"
+            ).fetchall()
+            files = {}
+            for job_id, position, content in self.db.execute(
+                    "SELECT job_id, position, content FROM job_files WHERE job_id IN "
+                    "(SELECT id FROM jobs WHERE stage = 'fetched') ORDER BY job_id, position"):
+                files.setdefault(job_id, []).append(content)
+
+        jobs = []
+        for job_id, stage, data in rows:
+            job = json.loads(data)
+            job['job_id'] = job_id
+            if stage == 'fetched':
+                contents = files.get(job_id, [])
+                for attachment, content in zip(job['attachments'], contents):
+                    attachment['file'], attachment['size'] = spool_content([content])
+            jobs.append((stage, job))
+        return jobs
+
+    def purge(self):
+        """Smaže záznamy dokončených a vzdaných jobů starší než keep_days"""
+        cutoff = time.time() - self.keep_days * 24 * 3600
+        with self.lock:
+            cursor = self.db.execute(
+                "DELETE FROM jobs WHERE stage IN ('sent', 'failed') AND updated < ?", (cutoff,)
+            )
+            self.db.commit()
+        return cursor.rowcount
+
+    def stats(self):
+        """Počet jobů v jednotlivých stupních"""
+        with self.lock:
+            return dict(self.db.execute('SELECT stage, COUNT(*) FROM jobs GROUP BY stage').fetchall())
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def create_job_queue(config):
+    """Vytvoří frontu podle sekce job_queue konfigurace, nebo None pokud je vypnutá"""
+    queue_config = config.get('job_queue', {}) or {}
+    if not queue_config.get('enabled', True):
+        return None
+    job_queue = JobQueue(
+        path=queue_config.get('path', 'job_queue.sqlite'),
+        max_attempts=queue_config.get('max_attempts', 3),
+        keep_days=queue_config.get('keep_days', 7)
+    )
+    job_queue.purge()
+    return job_queue
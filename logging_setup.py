@@ -0,0 +1,199 @@
+# logging_setup.py
+
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import uuid
+from contextlib import contextmanager
+from metrics import REGISTRY, Counter
+
+# Id emailu, ke kterému patří právě zapisované řádky logu
+EMAIL_ID = contextvars.ContextVar('email_id', default=None)
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - [%(email_id)s] %(message)s'
+
+LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+    'CRITICAL': logging.CRITICAL
+}
+
+# Délka začátku zprávy, který zůstane v režimu payload_mode: hash
+HASH_MODE_PREFIX = 100
+
+LOG_DROPPED = REGISTRY.register(Counter(
+    'taskmailer_log_dropped_total', 'Nezapsane radky logu (sampled, queue_full)', ('reason',)
+))
+
+_installed = []
+_listener = None
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+
+def describe_payload(text):
+    """Délka a SHA-256 promptu nebo odpovědi AI - do logu místo samotného textu"""
+    if text is None:
+        return "bez obsahu"
+    return f"{len(text)} znaků, sha256 {_digest(text)}"
+
+def new_email_id():
+    return uuid.uuid4().hex[:12]
+
+@contextmanager
+def email_context(email_id=None):
+    """Řádky logu uvnitř bloku with dostanou id emailu (bez id se vytvoří nové)"""
+    token = EMAIL_ID.set(email_id or new_email_id())
+    try:
+        yield EMAIL_ID.get()
+    finally:
+        EMAIL_ID.reset(token)
+
+def in_email_context(func):
+    """Obalí func pro spuštění v jiném vlákně (pool) se stejným id emailu"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+class PayloadFilter(logging.Filter):
+    def __init__(self, max_chars=2000, mode='truncate', sample_rate=1.0):
+        """
+        Doplní do záznamu id emailu, zkrátí dlouhé zprávy a vzorkuje řádky DEBUG.
+
+        Prompty a odpovědi AI se do logu nepíší (viz describe_payload), zprávy
+        delší než max_chars (např. chybové odpovědi poskytovatelů) se přesto
+        zkrátí (truncate), nebo se z nich ponechá jen začátek (hash) - vždy
+        s délkou a SHA-256 celé zprávy. Z řádků DEBUG se zapíše jen podíl
+        sample_rate, vyšší úrovně se nevzorkují.
+        """
+        super().__init__()
+        self.max_chars = max_chars
+        self.mode = mode
+        self.sample_rate = sample_rate
+
+    def _shorten(self, message):
+        keep = min(HASH_MODE_PREFIX, self.max_chars) if self.mode == 'hash' else self.max_chars
+        return f"{message[:keep]}… [zkráceno, {len(message)} znaků, sha256 {_digest(message)}]"
+
+    def filter(self, record):
+        record.email_id = EMAIL_ID.get() or '-'
+        message = record.getMessage()
+        oversized = self.max_chars and len(message) > self.max_chars
+        if record.levelno <= logging.DEBUG and self.sample_rate < 1:
+            if random.random() >= self.sample_rate:
+                LOG_DROPPED.inc(reason='sampled')
+                return False
+        if oversized:
+            record.msg = self._shorten(message)
+            record.args = None
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Jeden řádek JSON na záznam - čas, úroveň, logger, id emailu a zpráva"""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'email_id': getattr(record, 'email_id', '-'),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, který při plné frontě řádek zahodí místo čekání (kromě chyb)"""
+
+    def enqueue(self, record):
+        if record.levelno >= logging.ERROR:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc(reason='queue_full')
+
+def _stop_listener(listener=None):
+    """Zastaví listener (výchozí je aktuální) po zapsání zbylých řádků z fronty"""
+    global _listener
+    if listener is None:
+        listener, _listener = _listener, None
+    if listener:
+        listener.stop()
+        # Řádky vložené až po zastavení (vlákno ještě drželo starý handler fronty)
+        while True:
+            try:
+                record = listener.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not None:
+                listener.handle(record)
+        for handler in listener.handlers:
+            handler.close()
+
+def configure_logging(logging_config):
+    """
+    Nastaví logování podle sekce logging konfigurace.
+
+    Ve výchozím režimu (async) volající vlákno jen vloží záznam do fronty,
+    formátování a zápis do konzole a souboru probíhá ve vlákně QueueListeneru,
+    takže zpracování emailu na zápis do logu nečeká.
+
+    Args:
+        logging_config (dict): level, format (text | json), file, async,
+            queue_size, max_payload_chars, payload_mode (truncate | hash), sample_rate
+    """
+    global _listener
+    root = logging.getLogger()
+    # Při obnovení konfigurace se starý listener zastaví až po instalaci nového
+    # handleru, aby se žádný řádek logu neztratil ani nezapsal do zastavené fronty
+    old_handlers = list(_installed)
+    old_listener, _listener = _listener, None
+    _installed.clear()
+
+    if logging_config.get('format', 'text') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if logging_config.get('file'):
+        handlers.append(logging.FileHandler(logging_config['file'], encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    payload_filter = PayloadFilter(
+        max_chars=logging_config.get('max_payload_chars', 2000),
+        mode=logging_config.get('payload_mode', 'truncate'),
+        sample_rate=logging_config.get('sample_rate', 1.0)
+    )
+    if logging_config.get('async', True):
+        log_queue = queue.Queue(logging_config.get('queue_size', 10000))
+        _listener = logging.handlers.QueueListener(log_queue, *handlers)
+        _listener.start()
+        handlers = [DroppingQueueHandler(log_queue)]
+    for handler in handlers:
+        handler.addFilter(payload_filter)
+        root.addHandler(handler)
+        _installed.append(handler)
+    root.setLevel(LEVELS.get(str(logging_config.get('level', 'INFO')).upper(), logging.INFO))
+
+    for handler in old_handlers:
+        root.removeHandler(handler)
+        if old_listener is None:
+            handler.close()
+    if old_listener:
+        _stop_listener(old_listener)
+
+# Zbylé řádky ve frontě se zapíšou i při ukončení aplikace
+atexit.register(_stop_listener)
@@ -1,19 +1,29 @@
 # main.py
 
 import time
+import asyncio
 import email
 import email.utils
 import logging
 import argparse
 import sys
-from config_loader import load_config, load_tasks
+from config_loader import load_config, load_tasks, ConfigWatcher
 from email_handler import EmailHandler
 from ai_agent import AIAgent
-from attachment_processor import extract_text_from_attachment
-from pdf_converter import convert_markdown_to_pdf
-from rate_limiter import RateLimiter
+from async_ai_agent import AsyncAIAgent
+from attachment_processor import configure_extractor, get_extractor, spool_content, close_content, SPOOL_MAX_SIZE
+from pdf_converter import convert_markdown_to_pdf, convert_html_to_pdf, MarkdownStreamRenderer, configure_renderer
+from rate_limiter import create_rate_limiter
+from job_queue import create_job_queue
+from batch_queue import create_batch_queue
+from tracing import create_trace_recorder
+from bulk import BulkRunner, find_inputs, print_summary
+from logging_setup import EMAIL_ID, describe_payload, email_context, new_email_id
+from metrics import REGISTRY, STAGE_SECONDS, EMAILS, QUEUE_DEPTH, INFLIGHT_BYTES, JOBS, start_metrics_server
+from pipeline import InflightBudget, Pipeline, Stage
+from imap_parser import decoded_size, decode_transfer_encoding, iter_transfer_decoded
+from chunker import chunking_settings, needs_chunking, map_reduce, map_reduce_async
 import os
-import re
 
 def get_charset(part):
     """Získá charset z části emailu, defaultně vrací 'utf-8'"""
@@ -22,80 +32,144 @@ def get_charset(part):
     return 'utf-8'
 
 def get_task_from_subject(subject, tasks):
-    task_name, api, model = parse_subject(subject)
-    for task in tasks:
-        if task['subject'].lower() == task_name.lower():
-            task['api'] = api
-            task['model'] = model
-            return task
-    return None
-
-def parse_subject(subject):
-    pattern = r'^((?:RE:|FW:)\s*)?(\w*)(\s*\((\w*)(:(.*))?\))?$'
-    match = re.match(pattern, subject, re.IGNORECASE)
-    logging.debug(f"Parsuji subject: {subject}")
-    if match:
-        task_name = match.group(2).strip()
-        if match.group(4):
-            api = match.group(4).strip()
-        else:
-            api = None
-        if match.group(6):
-            model = match.group(6).strip()
-        else:
-            model = None
-        logging.debug(f"Identifikován úkol: {task_name}, API: {api}, Model: {model}")
-        return task_name, api, model
-    logging.debug(f"Nebyl nalezen žádný úkol v subjectu: {subject}")
-    return subject, None, None
-
-def get_email_content(msg):
-    body = ""
-    attachments = []
-    
-    if msg.is_multipart():
-        for part in msg.walk():
-            content_disposition = part.get("Content-Disposition", "")
-            if part.get_content_type() == 'text/plain' and 'attachment' not in content_disposition:
-                # Tělo e-mailu
-                charset = get_charset(part)
-                try:
-                    # Zkusíme nejdřív původní charset
-                    body += part.get_payload(decode=True).decode(charset)
-                except UnicodeDecodeError:
-                    try:
-                        # Pokud selže, zkusíme windows-1250 (běžné pro české emaily)
-                        body += part.get_payload(decode=True).decode('windows-1250')
-                    except UnicodeDecodeError:
-                        try:
-                            # Případně iso-8859-2
-                            body += part.get_payload(decode=True).decode('iso-8859-2')
-                        except UnicodeDecodeError:
-                            # Pokud vše selže, použijeme 'utf-8' s ignorováním chyb
-                            body += part.get_payload(decode=True).decode('utf-8', errors='ignore')
-            elif 'attachment' in content_disposition:
-                # Příloha - zde zůstává stejné
-                filename = part.get_filename()
-                if filename:
-                    attachment_content = part.get_payload(decode=True)
-                    attachments.append({
-                        'filename': filename,
-                        'content': attachment_content,
-                        'content_type': part.get_content_type()
-                    })
-    else:
+    """Úkol ze subjectu emailu - vlastní kopie pro tento požadavek (viz TaskRegistry)"""
+    return tasks.resolve(subject)
+
+# Omezení pro přílohy
+MAX_ATTACHMENT_SIZE = 5 * 1024 * 1024  # 5 MB
+ALLOWED_EXTENSIONS = ['.txt', '.md', '.csv', '.json', '.pdf', '.docx']
+
+def decode_text(payload, charset):
+    """Dekóduje text těla emailu, při chybě zkouší kódování běžná pro české emaily"""
+    # Nejdřív původní charset, pak windows-1250 (běžné pro české emaily) a iso-8859-2
+    for candidate in (charset, 'windows-1250', 'iso-8859-2'):
+        try:
+            return payload.decode(candidate)
+        except (UnicodeDecodeError, LookupError):
+            continue
+    # Pokud vše selže, použijeme 'utf-8' s ignorováním chyb
+    return payload.decode('utf-8', errors='ignore')
+
+def attachment_allowed(filename, size):
+    """Povolená přípona a velikost přílohy (stejná pravidla jako filter_attachments)"""
+    _, file_extension = os.path.splitext(filename)
+    return file_extension.lower() in ALLOWED_EXTENSIONS and size <= MAX_ATTACHMENT_SIZE
+
+def _encoded_payload(part):
+    """
+    Zakódovaný obsah části, Content-Transfer-Encoding a odhad velikosti po dekódování.
+
+    Odhad je horní mez (quoted-printable dekódováním jen zmenší), takže
+    podle něj lze přeskočit příliš velké přílohy bez dekódování.
+    """
+    payload = part.get_payload()
+    encoding = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+    if not isinstance(payload, str):
+        return None, encoding, 0
+    if encoding == 'base64':
+        return payload, encoding, (len(payload) - payload.count('\n') - payload.count('\r')) * 3 // 4
+    return payload, encoding, len(payload)
+
+def _spool_part(part, payload, encoding):
+    """Dekóduje přílohu po blocích do dočasného souboru"""
+    if payload is not None and encoding in ('base64', 'quoted-printable'):
+        return spool_content(iter_transfer_decoded(payload, encoding))
+    return spool_content([part.get_payload(decode=True) or b''])
+
+def get_email_content(msg, max_attachments=None):
+    """
+    Vybere ze zprávy tělo a přílohy v jednom průchodu.
+
+    Každá část se dekóduje jen jednou. Přílohy s nepovolenou příponou nebo
+    příliš velké se nedekódují vůbec (zůstane jen jejich popis pro
+    filter_attachments), povolené se dekódují po blocích do SpooledTemporaryFile
+    ('file'), takže velké přílohy neleží v paměti dvakrát.
+
+    Args:
+        msg: email.message.Message
+        max_attachments (int, optional): Při větším počtu příloh se žádná nedekóduje
+            (filter_attachments zprávu stejně odmítne)
+
+    Returns:
+        tuple: (tělo, přílohy)
+    """
+    if not msg.is_multipart():
         # Jednoduché zprávy bez multipart
-        body = msg.get_payload(decode=True).decode()
-    
-    return body, attachments
+        return decode_text(msg.get_payload(decode=True) or b'', get_charset(msg)), []
 
-def process_email(msg, email_handler, ai_agent, config, tasks, rate_limiter):
+    body_parts = []
+    attachments = []
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        content_disposition = str(part.get("Content-Disposition", ""))
+        if part.get_content_type() == 'text/plain' and 'attachment' not in content_disposition:
+            # Tělo e-mailu
+            body_parts.append(decode_text(part.get_payload(decode=True) or b'', get_charset(part)))
+        elif 'attachment' in content_disposition:
+            filename = part.get_filename()
+            if filename:
+                # U nepovolené přípony se obsah nečte vůbec, velikost pak není potřeba
+                payload, encoding, size = None, None, 0
+                if attachment_allowed(filename, 0):
+                    payload, encoding, size = _encoded_payload(part)
+                attachments.append({
+                    'filename': filename,
+                    'content_type': part.get_content_type(),
+                    'size': size,
+                    'part': (part, payload, encoding)
+                })
+
+    too_many = max_attachments is not None and len(attachments) > max_attachments
+    for attachment in attachments:
+        part, payload, encoding = attachment.pop('part')
+        if not too_many and attachment_allowed(attachment['filename'], attachment['size']):
+            attachment['file'], attachment['size'] = _spool_part(part, payload, encoding)
+    return "".join(body_parts), attachments
+
+def filter_attachments(attachments, email_handler, from_email, config):
+    """
+    Ověří počet příloh a vybere ty s povolenou příponou a velikostí.
 
-    # Omezení pro přílohy
-    MAX_ATTACHMENT_SIZE = 5 * 1024 * 1024  # 5 MB
+    Obsah odmítnutých příloh (dočasné soubory z get_email_content) se uvolní.
+
+    Returns:
+        list: Povolené přílohy, nebo None pokud je příloh příliš mnoho (uživatel je informován)
+    """
     MAX_ATTACHMENTS = config['app_settings']['max_attachments']
-    ALLOWED_EXTENSIONS = ['.txt', '.md', '.csv', '.json', '.pdf', '.docx']
 
+    if len(attachments) > MAX_ATTACHMENTS:
+        logging.warning(f"Příliš mnoho příloh. Maximální počet je {MAX_ATTACHMENTS}.")
+        EMAILS.inc(outcome='rejected')
+        for attachment in attachments:
+            close_content(attachment)
+        email_handler.send_email(
+            to_address=from_email,
+            subject="Příliš mnoho příloh",
+            body=f"Vaše zpráva obsahuje příliš mnoho příloh. Maximální povolený počet je {MAX_ATTACHMENTS}."
+        )
+        return None
+
+    valid_attachments = []
+    for attachment in attachments:
+        _, file_extension = os.path.splitext(attachment['filename'])
+        if file_extension.lower() in ALLOWED_EXTENSIONS:
+            if attachment['size'] <= MAX_ATTACHMENT_SIZE:
+                valid_attachments.append(attachment)
+                continue
+            logging.warning(f"Příloha {attachment['filename']} je příliš velká a bude přeskočena.")
+        else:
+            logging.warning(f"Přípona {file_extension} není podporována. Příloha {attachment['filename']} bude přeskočena.")
+        close_content(attachment)
+    return valid_attachments
+
+def prepare_email(msg, email_handler, config, tasks, rate_limiter):
+    """
+    Ověří odesílatele, rate limit a úkol ze subjectu.
+
+    Returns:
+        dict: Job pro další zpracování, nebo None pokud se email nemá zpracovat
+    """
     subject = msg['subject']
     from_email = email.utils.parseaddr(msg['From'])[1]
     allowed_users = config['allowed_users']
@@ -104,7 +178,8 @@ def process_email(msg, email_handler, ai_agent, config, tasks, rate_limiter):
     user_config = allowed_users.get(from_email.lower())
     if not user_config:
         logging.warning(f"Uživatel {from_email.lower()} není oprávněn používat tuto službu.")
-        return
+        EMAILS.inc(outcome='rejected')
+        return None
 
     # Načtení rate limitu pro uživatele s defaultními hodnotami
     rate_limit_defaults = config.get('rate_limit_defaults', {'max_requests': 10, 'time_window': 3600})
@@ -116,91 +191,578 @@ def process_email(msg, email_handler, ai_agent, config, tasks, rate_limiter):
     if not rate_limiter.is_allowed(from_email, max_requests, time_window):
         time_until_reset = rate_limiter.get_time_until_reset(from_email, time_window)
         logging.warning(f"Uživatel {from_email} překročil limit požadavků. Další požadavek může odeslat za {time_until_reset} sekund.")
+        EMAILS.inc(outcome='rate_limited')
         # Odeslání e-mailu s upozorněním
         email_handler.send_email(
             to_address=from_email,
             subject="Limit požadavků překročen",
             body=f"Překročili jste maximální počet {max_requests} požadavků za poslední časové okno. Prosím, zkuste to znovu za {time_until_reset} sekund."
         )
-        return
+        return None
 
     task = get_task_from_subject(subject, tasks)
-    if task:
-        body, attachments = get_email_content(msg)
-
-        # Filtrování a omezení příloh
-        if len(attachments) > MAX_ATTACHMENTS:
-            logging.warning(f"Příliš mnoho příloh. Maximální počet je {MAX_ATTACHMENTS}.")
-            email_handler.send_email(
-                to_address=from_email,
-                subject="Příliš mnoho příloh",
-                body=f"Vaše zpráva obsahuje příliš mnoho příloh. Maximální povolený počet je {MAX_ATTACHMENTS}."
-            )
-            return
+    if not task:
+        logging.warning(f"Nenašel jsem odpovídající úkol pro předmět: {subject}")
+        EMAILS.inc(outcome='rejected')
+        return None
 
-        valid_attachments = []
-        for attachment in attachments:
-            _, file_extension = os.path.splitext(attachment['filename'])
-            if file_extension.lower() in ALLOWED_EXTENSIONS:
-                if len(attachment['content']) <= MAX_ATTACHMENT_SIZE:
-                    valid_attachments.append(attachment)
-                else:
-                    logging.warning(f"Příloha {attachment['filename']} je příliš velká a bude přeskočena.")
-            else:
-                logging.warning(f"Přípona {file_extension} není podporována. Příloha {attachment['filename']} bude přeskočena.")
+    return {
+        'msg': msg,
+        'subject': subject,
+        'from_email': from_email,
+        'task': task,
+        # Id pro řádky logu všech stupňů zpracování tohoto emailu
+        'email_id': EMAIL_ID.get() or new_email_id()
+    }
+
+def download_email(job, email_handler, config):
+    """
+    Druhá fáze načítání: stáhne z IMAP jen text/plain tělo a povolené přílohy.
+
+    Volá se ve vlákně, které čte emaily (IMAP spojení není sdílené mezi vlákny).
+    """
+    body_parts = []
+    attachment_parts = []
+    for part in job.pop('parts'):
+        if part['content_type'] == 'text/plain' and part['disposition'] != 'attachment':
+            body_parts.append(part)
+        elif part['disposition'] == 'attachment' and part['filename']:
+            attachment_parts.append({
+                'filename': part['filename'],
+                'content_type': part['content_type'],
+                'size': decoded_size(part),
+                'part': part
+            })
+
+    valid_attachments = filter_attachments(attachment_parts, email_handler, job['from_email'], config)
+    if valid_attachments is None:
+        return None
 
-        # Zpracování příloh
-        attachments_text = ""
+    # Obsah zůstane zakódovaný, přílohy se dekódují po blocích rovnou do dočasného souboru
+    contents = email_handler.fetch_message_parts(
+        job['uid'], body_parts + [attachment['part'] for attachment in valid_attachments], decode=False
+    )
+    job['body'] = "".join(
+        decode_text(decode_transfer_encoding(contents.pop(part['part']), part['encoding']), part['charset'] or 'utf-8')
+        for part in body_parts
+    )
+    job['attachments'] = []
+    for attachment in valid_attachments:
+        part = attachment.pop('part')
+        attachment['file'], attachment['size'] = spool_content(
+            iter_transfer_decoded(contents.pop(part['part']), part['encoding'])
+        )
+        job['attachments'].append(attachment)
+    # Pro limit paměti pipeline se počítá jen obsah, který zůstal v paměti
+    job['size'] = len(job['body']) + sum(
+        a['size'] for a in job['attachments'] if a['size'] <= SPOOL_MAX_SIZE
+    )
+    return job
+
+def receive_email(item, email_handler, config, tasks, rate_limiter, job_queue=None, recorder=None):
+    """
+    Ověří email z fetch_unseen_emails podle hlaviček a stáhne potřebné části.
+
+    S frontou jobů se stažený email uloží do fronty ještě před označením
+    jako přečtený. Zpráva, která už ve frontě je (načtená znovu po pádu
+    před označením), se přeskočí bez dalšího započtení do rate limitu.
+    S recorderem se jobu založí záznam průběhu (tracing.TraceRecorder).
+
+    Returns:
+        dict: Job připravený pro extract_stage, nebo None
+    """
+    with email_context():
+        return _receive_email(item, email_handler, config, tasks, rate_limiter, job_queue, recorder)
+
+def _receive_email(item, email_handler, config, tasks, rate_limiter, job_queue, recorder):
+    source = f"{item.get('uidvalidity')}:{item['uid']}"
+    if job_queue and job_queue.contains(source):
+        logging.info(f"Email {item['uid']} už je ve frontě jobů, přeskakuji")
+        return None
+
+    msg = item['msg']
+    logging.warning(f"Procesuji email s predmetem: {msg['subject']}")
+    EMAILS.inc(outcome='received')
+    start = time.monotonic()
+    # Odesílatel, úkol a rate limit se ověří jen z hlaviček
+    job = prepare_email(msg, email_handler, config, tasks, rate_limiter)
+    if not job:
+        return None
+    job['uid'] = item['uid']
+    job['parts'] = item['parts']
+    job.pop('msg')
+    job = download_email(job, email_handler, config)
+    if job and recorder:
+        recorder.start(job, time.monotonic() - start)
+    if job and job_queue and not job_queue.add(job, source):
+        for attachment in job['attachments']:
+            close_content(attachment)
+        return None
+    return job
+
+def extract_stage(job, email_handler, config):
+    """Extrahuje text z příloh a sestaví prompt"""
+    if 'msg' in job:
+        # Celá zpráva (process_email) - tělo a přílohy se teprve vyberou
+        body, attachments = get_email_content(job.pop('msg'), config['app_settings']['max_attachments'])
+        valid_attachments = filter_attachments(attachments, email_handler, job['from_email'], config)
+        if valid_attachments is None:
+            return None
+    else:
+        # Již stažené části (download_email)
+        body = job.pop('body')
+        valid_attachments = job.pop('attachments')
+
+    # Zpracování příloh - paralelně, s časovým limitem a limitem délky textu
+    attachments_text = ""
+    extractor = get_extractor()
+    try:
+        results = extractor.extract_all(valid_attachments)
+    finally:
         for attachment in valid_attachments:
-            text = extract_text_from_attachment(attachment)
-            if text:
-                attachments_text += f"\n[Obsah přílohy {attachment['filename']}]:\n{text}\n"
-            else:
-                logging.warning(f"Příloha {attachment['filename']} nelze zpracovat nebo je prázdná.")
-
-        # Vytvoření promptu pro AI model
-        prompt = f"{task['base_prompt']}\n{body}\n{attachments_text}"
-
-        if task['api'] == 'openai':
-            ai_response = ai_agent.call_openai_api(prompt, model=task['model'] if task['model'] else None)
-        elif task['api'] == 'openrouter':
-            ai_response = ai_agent.call_openrouter_api(prompt, model=task['model'] if task['model'] else None)
-        elif task['api'] == 'azure':
-            ai_response = ai_agent.call_azure_openai_api(prompt, model=task['model'] if task['model'] else None)
-        elif task['api'] == 'ollama':
-            ai_response = ai_agent.call_ollama_api(prompt, model=task['model'] if task['model'] else None)
+            close_content(attachment)
+    for result in results:
+        text = result['text']
+        if result['truncated'] == 'size':
+            job.setdefault('notices', []).append(
+                f"Příloha {result['filename']} je příliš dlouhá, zpracováno bylo jen prvních "
+                f"{extractor.max_chars} znaků textu."
+            )
+        elif result['truncated'] == 'time':
+            job.setdefault('notices', []).append(
+                f"Zpracování přílohy {result['filename']} překročilo časový limit "
+                f"{extractor.timeout} s, " + ("použita byla jen část textu." if text else "příloha byla vynechána.")
+            )
+        if text:
+            attachments_text += f"\n[Obsah přílohy {result['filename']}]:\n{text}\n"
         else:
-            # Default to OpenAI API if no API specified
-            ai_response = ai_agent.call_openai_api(prompt, model=task['model'] if task['model'] else None)
+            logging.warning(f"Příloha {result['filename']} nelze zpracovat nebo je prázdná.")
 
-        if ai_response:
-            if task['output_format'] == 'pdf':
-                pdf_content = convert_markdown_to_pdf(ai_response)
-                attachment = {
-                    'content': pdf_content,
-                    'filename': 'vysledek.pdf'
-                }
-                email_handler.send_email(
-                    to_address=from_email,
-                    subject="Výsledek úkolu",
-                    body="Viz příloha.",
-                    attachment=attachment
-                )
-            else:
-                logging.warning(f"Send Email - Odpověď od AI: {ai_response}")
-                email_handler.send_email(
-                    to_address=from_email,
-                    subject="Výsledek úkolu",
-                    body=ai_response
-                )
+    # Vytvoření promptu pro AI model, obsah zvlášť pro případné dělení na části
+    task = job['task']
+    job['content'] = f"{body}\n{attachments_text}"
+    job['prompt'] = f"{task['base_prompt']}\n{job['content']}"
+    return job
+
+def ai_stage(job, ai_agent, config, streaming=False):
+    """
+    Zavolá AI model s připraveným promptem.
+
+    Příliš dlouhý vstup se rozdělí na části, které se zpracují paralelně
+    (map_prompt) a výsledky se spojí (reduce_prompt). Při streamování se
+    u PDF úkolů markdown převádí na HTML průběžně během generování odpovědi,
+    render_stage pak už jen vytvoří PDF.
+    """
+    task = job['task']
+    model = task['model'] if task['model'] else None
+    use_cache = task.get('cache', True)
+    chunking = chunking_settings(config)
+    start = time.monotonic()
+
+    if job.get('content') is not None and needs_chunking(job['prompt'], chunking):
+        ai_response = map_reduce(
+            lambda prompt: ai_agent.complete(task['api'], model, prompt, use_cache=use_cache),
+            task, job['content'], chunking
+        )
+    elif streaming:
+        renderer = MarkdownStreamRenderer() if task['output_format'] == 'pdf' else None
+        chunks = []
+        for chunk in ai_agent.stream(task['api'], model, job['prompt'], use_cache=use_cache):
+            chunks.append(chunk)
+            if renderer:
+                renderer.feed(chunk)
+        ai_response = "".join(chunks)
+        if renderer and ai_response:
+            job['html'] = renderer.finish()
+    else:
+        ai_response = ai_agent.complete(task['api'], model, job['prompt'], use_cache=use_cache)
+    STAGE_SECONDS.observe(time.monotonic() - start, stage='ai')
+
+    if not ai_response:
+        logging.error("Nepodařilo se získat odpověď od AI.")
+        EMAILS.inc(outcome='failed')
+        return None
+
+    job['ai_response'] = ai_response
+    return job
+
+def render_stage(job):
+    """Převede odpověď na PDF, pokud to úkol vyžaduje"""
+    if job['task']['output_format'] == 'pdf':
+        if job.get('html'):
+            pdf_content = convert_html_to_pdf(job.pop('html'))
         else:
-            logging.error("Nepodařilo se získat odpověď od AI.")
+            pdf_content = convert_markdown_to_pdf(job['ai_response'])
+        job['attachment'] = {
+            'content': pdf_content,
+            'filename': 'vysledek.pdf'
+        }
+    return job
+
+def send_stage(job, email_handler):
+    """Odešle výsledek uživateli, včetně upozornění na zkrácené přílohy"""
+    notices = ""
+    if job.get('notices'):
+        notices = "\n\n---\nUpozornění:\n" + "\n".join(f"- {notice}" for notice in job['notices'])
+    if job.get('attachment'):
+        email_handler.send_email(
+            to_address=job['from_email'],
+            subject="Výsledek úkolu",
+            body="Viz příloha." + notices,
+            attachment=job['attachment']
+        )
     else:
-        logging.warning(f"Nenašel jsem odpovídající úkol pro předmět: {subject}")
+        logging.warning(f"Send Email - Odpověď od AI: {describe_payload(job['ai_response'])}")
+        email_handler.send_email(
+            to_address=job['from_email'],
+            subject="Výsledek úkolu",
+            body=job['ai_response'] + notices
+        )
+    EMAILS.inc(outcome='processed')
+    return job
 
-def process_cli_task(task_name, input_text, input_file, api, model, subject, config, tasks, ai_agent):
-    """Zpracuje úkol přímo z příkazové řádky"""
-    # Najít odpovídající úkol
+def collect_job_metrics(job_queue):
+    """Nastaví gauge počtu jobů ve frontě, i pro stavy, které už žádný job nemají"""
+    stats = job_queue.stats()
+    for stage in ('fetched', 'extracted', 'batched', 'answered', 'sent', 'failed'):
+        JOBS.set(stats.get(stage, 0), stage=stage)
+
+def collect_batch_metrics(batch_queue):
+    for state, count in batch_queue.stats().items():
+        QUEUE_DEPTH.set(count, stage=f"batch_{state}")
+
+def durable_stage(func, job_queue, stage):
+    """
+    Obalí stupeň zpracování tak, aby se po jeho dokončení uložil stav jobu
+    do fronty. Chyba nebo zahozený job se zaznamená jako neúspěšný pokus.
+
+    Args:
+        stage (str, optional): Stupeň ve frontě po dokončení, None = neukládá se
+    """
+    if not job_queue:
+        return func
+
+    def run(job):
+        try:
+            result = func(job)
+        except Exception as e:
+            job_queue.fail(job, e)
+            raise
+        if result is None:
+            job_queue.fail(job, "zpracování nedokončeno")
+        elif stage:
+            job_queue.advance(result, stage)
+        return result
+    return run
+
+def durable_stage_async(func, job_queue, stage):
+    """Obdoba durable_stage pro asynchronní stupeň"""
+    if not job_queue:
+        return func
+
+    async def run(job):
+        try:
+            result = await func(job)
+        except Exception as e:
+            job_queue.fail(job, e)
+            raise
+        if result is None:
+            job_queue.fail(job, "zpracování nedokončeno")
+        elif stage:
+            job_queue.advance(result, stage)
+        return result
+    return run
+
+def batch_job(job, batch_queue, job_queue, config):
+    """
+    Předá job úkolu s delivery: batch do dávkové fronty místo okamžitého volání AI.
+
+    Vstup, který by se musel dělit na části, a API bez dávkového
+    zpracování se zpracují hned.
+
+    Returns:
+        bool: True, pokud job převzala dávková fronta (dál pokračuje až s výsledkem dávky)
+    """
+    task = job['task']
+    if not batch_queue or task.get('delivery') != 'batch':
+        return False
+    if not batch_queue.supports(task['api']):
+        logging.warning(f"API {task['api']} nemá dávkové zpracování, úkol {task['subject']} se zpracuje hned")
+        return False
+    if needs_chunking(job['prompt'], chunking_settings(config)):
+        logging.warning(f"Vstup úkolu {task['subject']} je pro dávku příliš dlouhý, zpracuje se hned po částech")
+        return False
+    batch_queue.add(job)
+    if job_queue:
+        job_queue.advance(job, 'batched')
+    return True
+
+def batched_stage(func, batch_queue, job_queue, get_config):
+    """Obalí stupeň AI tak, že úkoly s delivery: batch převezme dávková fronta"""
+    if not batch_queue:
+        return func
+
+    def run(job):
+        if batch_job(job, batch_queue, job_queue, get_config()):
+            return None
+        return func(job)
+    return run
+
+def start_batch_queue(batch_queue, submit, job_queue=None, recorder=None):
+    """
+    Spustí dávkovou frontu. Job s odpovědí z dávky se uloží jako 'answered'
+    a předá funkci submit, která ho zpracuje od render_stage.
+    """
+    def deliver(job):
+        if job_queue:
+            job_queue.advance(job, 'answered')
+        submit(job)
+
+    def fail(job, error):
+        if job_queue:
+            job_queue.advance(job, 'failed')
+        if recorder and job.get('trace') is not None:
+            recorder.record(job['trace'], 'failed')
+
+    batch_queue.start(deliver, fail)
+
+def process_email(msg, email_handler, ai_agent, config, tasks, rate_limiter):
+    """Zpracuje jeden email sekvenčně všemi stupni"""
+    with email_context():
+        job = prepare_email(msg, email_handler, config, tasks, rate_limiter)
+        if job:
+            job = extract_stage(job, email_handler, config)
+        if job:
+            job = ai_stage(job, ai_agent, config)
+        if job:
+            job = render_stage(job)
+        if job:
+            send_stage(job, email_handler)
+
+# Stupeň pipeline, od kterého pokračuje job uložený ve frontě v daném stavu
+RESUME_STAGES = {'fetched': 'extract', 'extracted': 'ai', 'answered': 'render'}
+
+def traced_stage(recorder, name, func, final=False):
+    """Obalí stupeň záznamem průběhu, pokud je tracing zapnutý"""
+    return recorder.stage(name, func, final) if recorder else func
+
+def build_pipeline(email_handler, ai_agent, config, job_queue=None, recorder=None, batch_queue=None, watcher=None):
+    """
+    Sestaví paralelní pipeline ze stupňů zpracování emailu
+
+    Args:
+        watcher (ConfigWatcher, optional): Stupně berou aktuální verzi konfigurace
+            (max_attachments, chunking), počty workerů a fronty platí od startu
+    """
+    pipeline_config = config.get('app_settings', {}).get('pipeline', {})
+    streaming = config.get('app_settings', {}).get('streaming', False)
+
+    def live_config():
+        return watcher.current[0] if watcher else config
+
+    stages = [
+        Stage('extract', durable_stage(
+                  traced_stage(recorder, 'extract', lambda job: extract_stage(job, email_handler, live_config())),
+                  job_queue, 'extracted'),
+              pipeline_config.get('extract_workers', 2)),
+        Stage('ai', batched_stage(durable_stage(
+                  traced_stage(recorder, 'ai', lambda job: ai_stage(job, ai_agent, live_config(), streaming)),
+                  job_queue, 'answered'), batch_queue, job_queue, live_config),
+              pipeline_config.get('ai_workers', 4)),
+        Stage('render', durable_stage(traced_stage(recorder, 'render', render_stage), job_queue, None),
+              pipeline_config.get('render_workers', 2)),
+        Stage('send', durable_stage(
+                  traced_stage(recorder, 'send', lambda job: send_stage(job, email_handler), final=True),
+                  job_queue, 'sent'),
+              pipeline_config.get('send_workers', 2)),
+    ]
+    return Pipeline(
+        stages,
+        queue_size=pipeline_config.get('queue_size', 20),
+        max_inflight_bytes=pipeline_config.get('max_inflight_mb', 200) * 1024 * 1024
+    )
+
+async def ai_stage_async(job, ai_agent, config):
+    """Asynchronní obdoba ai_stage pro AsyncAIAgent"""
+    task = job['task']
+    model = task['model'] if task['model'] else None
+    use_cache = task.get('cache', True)
+    chunking = chunking_settings(config)
+    start = time.monotonic()
+
+    if needs_chunking(job['prompt'], chunking):
+        ai_response = await map_reduce_async(
+            lambda prompt: ai_agent.acomplete(task['api'], model, prompt, use_cache=use_cache),
+            task, job['content'], chunking
+        )
+    else:
+        ai_response = await ai_agent.acomplete(task['api'], model, job['prompt'], use_cache=use_cache)
+    STAGE_SECONDS.observe(time.monotonic() - start, stage='ai')
+    if not ai_response:
+        logging.error("Nepodařilo se získat odpověď od AI.")
+        EMAILS.inc(outcome='failed')
+        return None
+    job['ai_response'] = ai_response
+    return job
+
+async def process_job_async(job, email_handler, ai_agent, config, job_queue=None, stage='fetched', recorder=None,
+                            batch_queue=None):
+    """
+    Zpracuje stažený email - blokující kroky běží ve vláknech, volání AI v event loopu
+
+    Args:
+        stage (str): Stav jobu ve frontě, od kterého se pokračuje
+    """
+    extract = durable_stage(
+        traced_stage(recorder, 'extract', lambda job: extract_stage(job, email_handler, config)),
+        job_queue, 'extracted'
+    )
+    render = durable_stage(traced_stage(recorder, 'render', render_stage), job_queue, None)
+    send = durable_stage(
+        traced_stage(recorder, 'send', lambda job: send_stage(job, email_handler), final=True),
+        job_queue, 'sent'
+    )
+    ai = lambda job: ai_stage_async(job, ai_agent, config)
+    if recorder:
+        ai = recorder.stage_async('ai', ai)
+
+    if stage == 'fetched':
+        job = await asyncio.to_thread(extract, job)
+    if job and stage in ('fetched', 'extracted'):
+        if await asyncio.to_thread(batch_job, job, batch_queue, job_queue, config):
+            return
+        job = await durable_stage_async(ai, job_queue, 'answered')(job)
+    if job:
+        job = await asyncio.to_thread(render, job)
+    if job:
+        await asyncio.to_thread(send, job)
+
+async def run_email_loop_async(config, tasks, watcher=None):
+    """
+    Emailová smyčka nad asyncio.
+
+    IMAP a SMTP zůstávají blokující a volají se postupně přes asyncio.to_thread,
+    zpracování jednotlivých emailů běží jako samostatné úlohy. Počet současně
+    rozpracovaných emailů omezuje app_settings.async_max_in_flight, jejich
+    velikost v paměti app_settings.pipeline.max_inflight_mb jako u pipeline.
+    """
+    app_settings = config.get('app_settings', {})
+    use_idle = app_settings.get('idle', True)
+    email_handler = EmailHandler(config)
+    ai_agent = AsyncAIAgent(config)
+    rate_limiter = create_rate_limiter(config)
+    job_queue = create_job_queue(config)
+    recorder = create_trace_recorder(config)
+    # Dávky volají poskytovatele z vlastního vlákna, potřebují synchronního agenta
+    batch_queue = None
+    if (config.get('batch') or {}).get('enabled', False):
+        batch_queue = create_batch_queue(config, AIAgent(config, use_cache=False))
+    in_flight = asyncio.Semaphore(app_settings.get('async_max_in_flight', 50))
+    budget = InflightBudget(app_settings.get('pipeline', {}).get('max_inflight_mb', 200) * 1024 * 1024)
+    running = set()
+
+    async def run_job(job, stage='fetched'):
+        # Každá úloha má vlastní kopii contextvars, id emailu platí jen pro ni
+        EMAIL_ID.set(job.get('email_id'))
+        # Job se dokončí s verzí konfigurace platnou při jeho spuštění
+        live_config = watcher.current[0] if watcher else config
+        try:
+            await process_job_async(job, email_handler, ai_agent, live_config, job_queue, stage, recorder,
+                                    batch_queue)
+        except Exception as e:
+            logging.error(f"Chyba při zpracování emailu: {e}")
+            EMAILS.inc(outcome='failed')
+        finally:
+            budget.release(job.get('size', 0))
+            in_flight.release()
+
+    def start_job(job, stage='fetched'):
+        task = asyncio.create_task(run_job(job, stage))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    def collect_metrics():
+        QUEUE_DEPTH.set(len(running), stage='in_flight')
+        INFLIGHT_BYTES.set(budget.bytes)
+        if job_queue:
+            collect_job_metrics(job_queue)
+        if batch_queue:
+            collect_batch_metrics(batch_queue)
+
+    loop = asyncio.get_running_loop()
+
+    def submit_batch_result(job):
+        # Volá se z vlákna dávkové fronty, čeká na volné místo v limitu rozpracovaných emailů
+        asyncio.run_coroutine_threadsafe(in_flight.acquire(), loop).result()
+        budget.acquire(job.get('size', 0))
+        loop.call_soon_threadsafe(start_job, job, 'answered')
+
+    REGISTRY.add_collector(collect_metrics)
+    if batch_queue:
+        start_batch_queue(batch_queue, submit_batch_result, job_queue, recorder)
+    try:
+        # Navázání na joby rozpracované před restartem
+        if job_queue:
+            for stage, job in job_queue.pending():
+                logging.warning(f"Navazuji na rozpracovaný job {job['job_id']} ({stage}): {job['subject']}")
+                await in_flight.acquire()
+                await asyncio.to_thread(budget.acquire, job.get('size', 0))
+                start_job(job, stage)
+
+        while True:
+            # check_interval a idle_timeout se mohou změnit za běhu
+            app_settings = (watcher.current[0] if watcher else config).get('app_settings', {})
+            try:
+                await asyncio.to_thread(email_handler.ensure_imap)
+                logging.warning(f"Kontroluji emaily")
+                # Další dávka se stáhne, až rozpracované emaily uvolní paměťový limit
+                emails = email_handler.fetch_unseen_emails(throttle=budget.wait_for_capacity)
+                while True:
+                    # Při vyčerpaném limitu se další emaily nestahují
+                    await in_flight.acquire()
+                    item = job = None
+                    try:
+                        item = await asyncio.to_thread(next, emails, None)
+                        if item is not None:
+                            # Aktuální verze allowed_users, limitů a úkolů (viz ConfigWatcher)
+                            live_config, live_tasks = watcher.current if watcher else (config, tasks)
+                            job = await asyncio.to_thread(
+                                receive_email, item, email_handler, live_config, live_tasks, rate_limiter,
+                                job_queue, recorder
+                            )
+                    finally:
+                        # Místo v limitu drží jen spuštěný job (i při chybě načítání)
+                        if not job:
+                            in_flight.release()
+                    if job:
+                        await asyncio.to_thread(budget.acquire, job.get('size', 0))
+                        start_job(job)
+                    elif item is None:
+                        break
+
+                if use_idle and await asyncio.to_thread(email_handler.supports_idle):
+                    await asyncio.to_thread(email_handler.idle, app_settings.get('idle_timeout', 25 * 60))
+                    continue
+            except Exception as e:
+                # Chyba při načítání neukončí smyčku, rozpracované joby běží dál
+                logging.error(f"Chyba při kontrole emailů: {e}")
+            await asyncio.sleep(app_settings.get('check_interval', 60))
+    finally:
+        if batch_queue:
+            await asyncio.to_thread(batch_queue.close)
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        REGISTRY.remove_collector(collect_metrics)
+        await ai_agent.aclose()
+        email_handler.disconnect()
+        rate_limiter.close()
+        if job_queue:
+            job_queue.close()
+        if recorder:
+            recorder.close()
+
+def find_cli_task(task_name, api, model, subject, tasks):
+    """Najde úkol podle --task nebo --subject, při neúspěchu vypíše dostupné úkoly a vrátí None"""
     task = None
     
     if subject:
@@ -211,22 +773,23 @@ def process_cli_task(task_name, input_text, input_file, api, model, subject, con
             print("Dostupné úkoly:")
             for t in tasks:
                 print(f"- {t['subject']}")
-            return
+            return None
     else:
-        # Původní zpracování pomocí task_name
-        for t in tasks:
-            if t['subject'].lower() == task_name.lower():
-                task = t.copy()
-                # Použít explicitní parametry pouze pokud subject není zadán
-                task['api'] = api
-                task['model'] = model
-                break
+        # Původní zpracování pomocí task_name, explicitní api a model jen bez subjectu
+        task = tasks.get(task_name, api, model)
     
     if not task:
         print(f"Chyba: Úkol '{task_name}' nebyl nalezen.")
         print("Dostupné úkoly:")
         for t in tasks:
             print(f"- {t['subject']}")
+    return task
+
+def process_cli_task(task_name, input_text, input_file, api, model, subject, config, tasks, ai_agent):
+    """Zpracuje úkol přímo z příkazové řádky"""
+    # Najít odpovídající úkol
+    task = find_cli_task(task_name, api, model, subject, tasks)
+    if not task:
         return
 
     # Získat vstupní text
@@ -242,25 +805,24 @@ def process_cli_task(task_name, input_text, input_file, api, model, subject, con
 
     # Vytvořit prompt
     prompt = f"{task['base_prompt']}\n{content}"
+    chunking = chunking_settings(config)
 
     # Zpracovat pomocí AI
     try:
         # Použít model z command line pokud je zadán, jinak použít model z tasku
         selected_model = model if model else task['model']
         
-        if task['api'] == 'openai':
-            ai_response = ai_agent.call_openai_api(prompt, model=selected_model)
-        elif task['api'] == 'openrouter':
-            ai_response = ai_agent.call_openrouter_api(prompt, model=selected_model)
-        elif task['api'] == 'azure':
-            ai_response = ai_agent.call_azure_openai_api(prompt, model=selected_model)
-        elif task['api'] == 'ollama':
-            ai_response = ai_agent.call_ollama_api(prompt, model=selected_model)
-        else:
-            ai_response = ai_agent.call_openai_api(prompt, model=selected_model)
+        use_cache = task.get('cache', True)
 
-        if ai_response:
-            if task['output_format'] == 'pdf':
+        if needs_chunking(prompt, chunking):
+            # Dlouhý vstup se zpracuje po částech, výsledek se nestreamuje
+            ai_response = map_reduce(
+                lambda part_prompt: ai_agent.complete(task['api'], selected_model, part_prompt, use_cache=use_cache),
+                task, content, chunking
+            )
+            if not ai_response:
+                print("Chyba: Nepodařilo se získat odpověď od AI.")
+            elif task['output_format'] == 'pdf':
                 pdf_content = convert_markdown_to_pdf(ai_response)
                 output_file = 'vysledek.pdf'
                 with open(output_file, 'wb') as f:
@@ -268,11 +830,55 @@ def process_cli_task(task_name, input_text, input_file, api, model, subject, con
                 print(f"Výsledek byl uložen do souboru: {output_file}")
             else:
                 print(ai_response)
+        elif task['output_format'] == 'pdf':
+            # Markdown se převádí na HTML průběžně během generování
+            renderer = MarkdownStreamRenderer()
+            for chunk in ai_agent.stream(task['api'], selected_model, prompt, use_cache=use_cache):
+                renderer.feed(chunk)
+            if renderer.text:
+                pdf_content = convert_html_to_pdf(renderer.finish())
+                output_file = 'vysledek.pdf'
+                with open(output_file, 'wb') as f:
+                    f.write(pdf_content)
+                print(f"Výsledek byl uložen do souboru: {output_file}")
+            else:
+                print("Chyba: Nepodařilo se získat odpověď od AI.")
         else:
-            print("Chyba: Nepodařilo se získat odpověď od AI.")
+            # Textová odpověď se vypisuje průběžně, jak přichází
+            received = False
+            for chunk in ai_agent.stream(task['api'], selected_model, prompt, use_cache=use_cache):
+                received = True
+                sys.stdout.write(chunk)
+                sys.stdout.flush()
+            if received:
+                print()
+            else:
+                print("Chyba: Nepodařilo se získat odpověď od AI.")
     except Exception as e:
         print(f"Chyba při zpracování úkolu: {e}")
 
+def process_bulk_task(source, task, config, ai_agent, output_dir=None, output_jsonl=None, workers=4, resume=True):
+    """Zpracuje úkol nad všemi vstupy z adresáře, vzoru nebo JSONL (viz bulk.py) a vypíše souhrn"""
+    try:
+        items = find_inputs(source, output_dir, task['output_format'])
+    except (OSError, ValueError) as e:
+        print(f"Chyba při načítání vstupů: {e}")
+        return
+    if not items:
+        print(f"Chyba: V '{source}' nebyly nalezeny žádné vstupy.")
+        return
+
+    if output_dir is None and output_jsonl is None:
+        output_jsonl = '-'
+    runner = BulkRunner(task, config, ai_agent, output_dir=output_dir, output_jsonl=output_jsonl,
+                        workers=workers, resume=resume)
+    try:
+        summary = runner.run(items)
+    except KeyboardInterrupt:
+        return
+    # Při výstupu JSONL na standardní výstup jde souhrn na chybový výstup
+    print_summary(summary, sys.stderr if output_jsonl == '-' else sys.stdout)
+
 def main():
     parser = argparse.ArgumentParser(description='TaskMailer AI - Zpracování úkolů pomocí AI')
     parser.add_argument('--task', '-t', help='Název úkolu k provedení (nepoužívat společně s --subject)')
@@ -282,6 +888,12 @@ def main():
     parser.add_argument('--api', help='API k použití (openai, openrouter, azure, ollama) - ignorováno při použití --subject')
     parser.add_argument('--model', help='Model k použití - ignorováno při použití --subject')
     parser.add_argument('--list-tasks', '-l', action='store_true', help='Vypíše dostupné úkoly')
+    parser.add_argument('--bulk', '-b', help='Hromadné zpracování: adresář, vzor (např. "docs/**/*.pdf") nebo soubor .jsonl')
+    parser.add_argument('--output-dir', '-o', help='Hromadné zpracování: adresář pro výstup každého vstupu')
+    parser.add_argument('--output-jsonl', help='Hromadné zpracování: výsledky jako JSON Lines do souboru (výchozí: standardní výstup)')
+    parser.add_argument('--workers', '-w', type=int, default=4, help='Hromadné zpracování: počet souběžně zpracovávaných vstupů')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='Hromadné zpracování: zpracovat znovu i vstupy, které už výsledek mají')
     
     args = parser.parse_args()
     
@@ -300,35 +912,154 @@ def main():
         print("Chyba: Nelze použít --task a --subject současně. Použijte pouze jeden z parametrů.")
         return
         
+    if args.bulk:
+        if not (args.task or args.subject):
+            print("Chyba: Hromadné zpracování vyžaduje --task nebo --subject.")
+            return
+        if args.input or args.file:
+            print("Chyba: --bulk nelze kombinovat s --input ani --file.")
+            return
+        if args.output_dir and args.output_jsonl:
+            print("Chyba: Použijte jen jeden z výstupů --output-dir a --output-jsonl.")
+            return
+        if args.workers < 1:
+            print("Chyba: --workers musí být alespoň 1.")
+            return
+        task = find_cli_task(args.task, args.api, args.model, args.subject, tasks)
+        if not task:
+            return
+        # PDF a extrakce souborů v poolech procesů jako v emailovém módu
+        renderer = configure_renderer(config)
+        extractor = configure_extractor(config)
+        try:
+            process_bulk_task(args.bulk, task, config, AIAgent(config), args.output_dir, args.output_jsonl,
+                              args.workers, not args.no_resume)
+        finally:
+            renderer.close()
+            extractor.close()
+        return
+
     if args.task or args.subject:
+        configure_renderer(config, workers=0)
         ai_agent = AIAgent(config)
         process_cli_task(args.task, args.input, args.file, args.api, args.model, args.subject, config, tasks, ai_agent)
         return
 
+    # Převod do PDF a extrakce příloh - v emailovém módu v poolech procesů
+    renderer = configure_renderer(config)
+    extractor = configure_extractor(config)
+    metrics_server = start_metrics_server(config)
+    # Změny config.yaml a tasks.yaml se načtou za běhu
+    watcher = ConfigWatcher(config, tasks, interval=config.get('app_settings', {}).get('reload_interval', 5))
+    watcher.start()
+
+    # Email mód nad asyncio
+    if config.get('app_settings', {}).get('async_mode', False):
+        try:
+            asyncio.run(run_email_loop_async(config, tasks, watcher))
+        except KeyboardInterrupt:
+            logging.info("Ukončuji aplikaci...")
+        except Exception as e:
+            logging.error(f"Neočekávaná chyba: {e}")
+        finally:
+            watcher.stop()
+            renderer.close()
+            extractor.close()
+            if metrics_server:
+                metrics_server.shutdown()
+        return
+
     # Email mód
     email_handler = EmailHandler(config)
     ai_agent = AIAgent(config)
-    rate_limiter = RateLimiter()
+    rate_limiter = create_rate_limiter(config)
+    job_queue = create_job_queue(config)
+    recorder = create_trace_recorder(config)
+    batch_queue = create_batch_queue(config, ai_agent)
+    pipeline = build_pipeline(email_handler, ai_agent, config, job_queue, recorder, batch_queue, watcher)
+    pipeline.start()
+    if batch_queue:
+        start_batch_queue(batch_queue, lambda job: pipeline.submit(job, 'render'), job_queue, recorder)
+
+    def collect_metrics():
+        for stage, depth in pipeline.queue_depths().items():
+            QUEUE_DEPTH.set(depth, stage=stage)
+        INFLIGHT_BYTES.set(pipeline.inflight_bytes)
+        if job_queue:
+            collect_job_metrics(job_queue)
+        if batch_queue:
+            collect_batch_metrics(batch_queue)
+
+    REGISTRY.add_collector(collect_metrics)
 
     try:
+        app_settings = config.get('app_settings', {})
+        use_idle = app_settings.get('idle', True)
+        # Navázání na joby rozpracované před restartem
+        if job_queue:
+            for stage, job in job_queue.pending():
+                logging.warning(f"Navazuji na rozpracovaný job {job['job_id']} ({stage}): {job['subject']}")
+                pipeline.submit(job, RESUME_STAGES[stage])
         while True:
-            email_handler.connect_imap()
-            email_handler.connect_smtp()
-            emails = email_handler.fetch_unseen_emails()
-            logging.warning(f"Kontroluji emaily")
-            for msg in emails:
-                subject = msg['subject']
-                logging.warning(f"Procesuji email s predmetem: {subject}")
-                process_email(msg, email_handler, ai_agent, config, tasks, rate_limiter)
-            time.sleep(2)    
-            email_handler.disconnect()
-            time.sleep(config.get('app_settings', {}).get('check_interval', 60))
+            # check_interval a idle_timeout se mohou změnit za běhu
+            app_settings = watcher.current[0].get('app_settings', {})
+            try:
+                # Spojení zůstávají otevřená mezi cykly, obnoví se jen při výpadku
+                email_handler.ensure_imap()
+                logging.warning(f"Kontroluji emaily")
+                # Další dávka se stáhne, až pipeline uvolní paměťový limit
+                for item in email_handler.fetch_unseen_emails(throttle=pipeline.wait_for_capacity):
+                    # Aktuální verze allowed_users, limitů a úkolů (viz ConfigWatcher)
+                    live_config, live_tasks = watcher.current
+                    job = receive_email(item, email_handler, live_config, live_tasks, rate_limiter,
+                                        job_queue, recorder)
+                    if job:
+                        # Při plné frontě blokuje, dokud pipeline neuvolní místo
+                        pipeline.submit(job)
+                if use_idle and email_handler.supports_idle():
+                    # Spojení zůstává otevřené, čekáme na notifikaci od serveru
+                    email_handler.idle(app_settings.get('idle_timeout', 25 * 60))
+                else:
+                    time.sleep(app_settings.get('check_interval', 60))
+            except Exception as e:
+                # Chyba při načítání neukončí smyčku, pipeline zpracovává dál
+                logging.error(f"Chyba při kontrole emailů: {e}")
+                time.sleep(app_settings.get('check_interval', 60))
+            logging.debug(f"Statistika spojení: {email_handler.get_connection_stats()}")
+            if job_queue:
+                logging.debug(f"Fronta jobů: {job_queue.stats()}")
+            if batch_queue:
+                logging.debug(f"Dávková fronta: {batch_queue.stats()}")
+            if ai_agent.cache:
+                logging.debug(f"Statistika cache odpovědí: {ai_agent.cache.stats()}")
+            if extractor.cache:
+                logging.debug(f"Statistika cache příloh: {extractor.cache.stats()}")
+            if ai_agent.router:
+                logging.debug(f"Statistika poskytovatelů AI: {ai_agent.router.snapshot()}")
+            if ai_agent.governor:
+                logging.debug(f"Limity poskytovatelů AI: {ai_agent.governor.snapshot()}")
     except KeyboardInterrupt:
         logging.info("Ukončuji aplikaci...")
     except Exception as e:
         logging.error(f"Neočekávaná chyba: {e}")
     finally:
+        watcher.stop()
+        # Dávková fronta předává výsledky do pipeline, zastaví se dřív než ona
+        if batch_queue:
+            batch_queue.close()
+        # Rozpracované joby se dokončí dřív, než se zavřou spojení a fronty, které používají
+        pipeline.stop()
+        REGISTRY.remove_collector(collect_metrics)
         email_handler.disconnect()
+        rate_limiter.close()
+        renderer.close()
+        extractor.close()
+        if job_queue:
+            job_queue.close()
+        if recorder:
+            recorder.close()
+        if metrics_server:
+            metrics_server.shutdown()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,212 @@
+# metrics.py
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Hranice košů histogramů latence v sekundách (od IMAP příkazu po dlouhé volání AI)
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def percentile(values, fraction):
+    """Hodnota na daném kvantilu (0-1) neprázdného seznamu, pro souhrny zátěžových běhů"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def _samples(self):
+        with self.lock:
+            return [(self.name, key, (), value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        """Řádky metriky v textovém formátu Prometheus"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for name, key, extra, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labels, key, extra)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+class Histogram(_Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # [počty v koších, součet, počet pozorování]
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Změří dobu bloku with (i když skončí výjimkou)"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def _samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, observations) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key, (('le', f"{bound:g}"),), count))
+                samples.append((f"{self.name}_bucket", key, (('le', '+Inf'),), observations))
+                samples.append((f"{self.name}_sum", key, (), total))
+                samples.append((f"{self.name}_count", key, (), observations))
+        return samples
+
+class Registry:
+    def __init__(self):
+        """Sada metrik aplikace a funkcí, které před výpisem aktualizují gauge"""
+        self.metrics = []
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, func):
+        """func() se zavolá před každým výpisem, typicky nastaví gauge z aktuálního stavu"""
+        with self.lock:
+            self.collectors.append(func)
+
+    def remove_collector(self, func):
+        with self.lock:
+            if func in self.collectors:
+                self.collectors.remove(func)
+
+    def render(self):
+        with self.lock:
+            collectors = list(self.collectors)
+            metrics = list(self.metrics)
+        for collect in collectors:
+            try:
+                collect()
+            except Exception as e:
+                logging.warning(f"Nelze aktualizovat metriky: {e}")
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'taskmailer_stage_duration_seconds',
+    'Doba kroku zpracovani (imap_fetch, imap_parts, rate_limit, extract, ai, render, smtp)',
+    ('stage',)
+))
+AI_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'taskmailer_ai_request_duration_seconds', 'Doba jednoho volani poskytovatele AI', ('provider',)
+))
+AI_REQUESTS = REGISTRY.register(Counter(
+    'taskmailer_ai_requests_total', 'Volani poskytovatelu AI podle vysledku (ok, error, rate_limited)',
+    ('provider', 'outcome')
+))
+EMAILS = REGISTRY.register(Counter(
+    'taskmailer_emails_total', 'Emaily podle vysledku (received, processed, rejected, rate_limited, failed)',
+    ('outcome',)
+))
+ATTACHMENTS = REGISTRY.register(Counter(
+    'taskmailer_attachments_total', 'Extrahovane prilohy podle vysledku (ok, size, time, error)', ('outcome',)
+))
+RATE_LIMIT_CHECKS = REGISTRY.register(Counter(
+    'taskmailer_rate_limit_checks_total', 'Kontroly rate limitu uzivatelu (allowed, limited)', ('result',)
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'taskmailer_queue_depth', 'Pocet jobu cekajicich pred stupnem pipeline', ('stage',)
+))
+INFLIGHT_BYTES = REGISTRY.register(Gauge(
+    'taskmailer_inflight_bytes', 'Velikost rozpracovanych emailu v pameti'
+))
+JOBS = REGISTRY.register(Gauge(
+    'taskmailer_jobs', 'Joby v trvale fronte podle stavu', ('stage',)
+))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Metriky: {format % args}")
+
+def start_metrics_server(config):
+    """
+    Spustí HTTP endpoint /metrics (formát Prometheus) podle sekce metrics konfigurace.
+
+    Returns:
+        ThreadingHTTPServer: Běžící server (ukončí se shutdown()), nebo None pokud je vypnutý
+    """
+    metrics_config = config.get('metrics', {}) or {}
+    if not metrics_config.get('enabled', False):
+        return None
+    server = ThreadingHTTPServer(
+        (metrics_config.get('host', '127.0.0.1'), metrics_config.get('port', 9108)),
+        _MetricsHandler
+    )
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    logging.info(f"Metriky dostupné na http://{server.server_address[0]}:{server.server_address[1]}/metrics")
+    return server
@@ -2,11 +2,273 @@
 
 import pdfkit
 import markdown
-import os
-import tempfile
+import logging
+import re
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from markdown.extensions import tables, fenced_code, attr_list, def_list, footnotes
+from metrics import STAGE_SECONDS
 
+try:
+    import weasyprint
+except Exception:
+    # weasyprint je volitelný - převod v procesu bez spouštění wkhtmltopdf
+    weasyprint = None
 
+# Seznam použitých rozšíření
+MARKDOWN_EXTENSIONS = [
+    'tables',                    # podpora tabulek
+    'fenced_code',              # podpora ohraničených bloků kódu
+    'attr_list',                # podpora HTML atributů
+    'def_list',                 # podpora definičních seznamů
+    'footnotes',                # podpora poznámek pod čarou
+    'markdown.extensions.nl2br', # převod nových řádků na <br>
+    'markdown.extensions.sane_lists', # lepší zpracování seznamů
+]
+
+# Poznámky pod čarou a odkazy definované jinde v dokumentu nejdou převádět po blocích
+DOCUMENT_LEVEL_SYNTAX = re.compile(r'\[\^[^\]]+\]|^\s{0,3}\[[^\]]+\]:', re.MULTILINE)
+
+# Začátek ohraničeného bloku kódu
+FENCE = re.compile(r'^\s{0,3}(```|~~~)')
+
+# Řádek, který může pokračovat předchozím blokem i po prázdném řádku
+# (odsazení, položka seznamu, řádek tabulky)
+CONTINUATION = re.compile(r'^(\s|[-*+]\s|\d+[.)]\s|\|)')
+
+# Nastavení wkhtmltopdf
+PDF_OPTIONS = {
+    'encoding': 'UTF-8',
+    'enable-local-file-access': None,
+    'margin-top': '20mm',
+    'margin-right': '20mm',
+    'margin-bottom': '20mm',
+    'margin-left': '20mm'
+}
+
+# CSS styly
+CSS_STYLES = """
+<style>
+@page { margin: 20mm; }
+body { font-family: Arial; line-height: 1.6; margin: 20px; }
+table { border-collapse: collapse; width: 100%; margin: 15px 0; border: 2px solid black; }
+th, td { border: 1px solid black; padding: 8px; text-align: left; }
+th { background-color: #f2f2f2; font-weight: bold; }
+tr:nth-child(even) { background-color: #f9f9f9; }
+</style>
+"""
+
+# Šablona HTML dokumentu sestavená jednou, obsah se vkládá mezi prefix a suffix
+HTML_PREFIX = (
+    "<!DOCTYPE html>"
+    "<html>"
+    "<head>"
+    "<meta charset='UTF-8'>"
+    f"{CSS_STYLES}"
+    "</head>"
+    "<body>"
+)
+HTML_SUFFIX = "</body></html>"
+
+# Instance markdown.Markdown se rozšířeními se vytváří jednou pro každé vlákno
+# (instance není thread-safe) a mezi převody se jen resetuje
+_local = threading.local()
+
+def _markdown():
+    if not hasattr(_local, 'markdown'):
+        _local.markdown = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return _local.markdown.reset()
+
+def markdown_to_html(markdown_text):
+    """
+    Převádí markdownový text na HTML (bez obalového dokumentu).
+
+    Parametry:
+        markdown_text (str): Vstupní markdownový text.
+
+    Návratová hodnota:
+        str: HTML obsah.
+    """
+    return _markdown().convert(markdown_text)
+
+def html_document(html_content):
+    """Vloží HTML obsah do dokumentu se styly"""
+    return f"{HTML_PREFIX}{html_content}{HTML_SUFFIX}"
+
+# Konfigurace pdfkit (cesta k wkhtmltopdf) se hledá jen jednou na proces
+_pdfkit_configuration = None
+
+def _render_wkhtmltopdf(document):
+    """PDF z wkhtmltopdf - výstup se čte ze stdout, bez dočasného souboru"""
+    global _pdfkit_configuration
+    if _pdfkit_configuration is None:
+        _pdfkit_configuration = pdfkit.configuration()
+    return pdfkit.from_string(document, False, options=PDF_OPTIONS, configuration=_pdfkit_configuration)
+
+def _render_weasyprint(document):
+    """PDF z weasyprint přímo v procesu"""
+    return weasyprint.HTML(string=document).write_pdf()
+
+BACKENDS = {
+    'wkhtmltopdf': _render_wkhtmltopdf,
+    'weasyprint': _render_weasyprint,
+}
+
+def _render_documents(backend, documents):
+    """Převede seznam HTML dokumentů na PDF (volá se i v procesech poolu)"""
+    render = BACKENDS[backend]
+    return [render(document) for document in documents]
+
+def _warm_up_worker(backend):
+    """Inicializace procesu poolu - načte backend předem"""
+    if backend == 'wkhtmltopdf':
+        global _pdfkit_configuration
+        _pdfkit_configuration = pdfkit.configuration()
+    return backend
+
+class PdfRenderer:
+    def __init__(self, backend='auto', workers=0):
+        """
+        Převod HTML a markdownu na PDF.
+
+        Args:
+            backend (str): wkhtmltopdf | weasyprint | auto (weasyprint, pokud
+                je nainstalovaný, jinak wkhtmltopdf)
+            workers (int): Počet procesů poolu, 0 = převod v aktuálním procesu
+        """
+        if backend == 'auto':
+            backend = 'weasyprint' if weasyprint is not None else 'wkhtmltopdf'
+        if backend not in BACKENDS:
+            raise ValueError(f"Neznámý backend pro PDF: {backend}")
+        if backend == 'weasyprint' and weasyprint is None:
+            raise ValueError("Backend weasyprint není nainstalovaný")
+        self.backend = backend
+        self.workers = workers
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                # spawn - fork vícevláknového procesu (IMAP, pipeline) není bezpečný
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_warm_up_worker,
+                    initargs=(self.backend,)
+                )
+            return self.pool
+
+    def warm_up(self):
+        """Spustí procesy poolu předem, aby první převod nečekal na jejich start"""
+        if self.workers:
+            pool = self._get_pool()
+            list(pool.map(_warm_up_worker, [self.backend] * self.workers))
+
+    def render_html(self, html_content):
+        """HTML obsah (bez obalového dokumentu) -> PDF bytes"""
+        return self.render_html_batch([html_content])[0]
+
+    def render_markdown(self, markdown_text):
+        """Markdown -> PDF bytes"""
+        return self.render_html(markdown_to_html(markdown_text))
+
+    def render_html_batch(self, html_contents):
+        """
+        Převede více HTML obsahů najednou.
+
+        Dokumenty se rozdělí do dávek po jedné na proces poolu, každý proces
+        tak převede celou dávku v jednom volání.
+
+        Returns:
+            list: PDF bytes ve stejném pořadí
+        """
+        with STAGE_SECONDS.time(stage='render'):
+            return self._render_html_batch(html_contents)
+
+    def _render_html_batch(self, html_contents):
+        documents = [html_document(html_content) for html_content in html_contents]
+        if not self.workers or not documents:
+            return _render_documents(self.backend, documents)
+        batches = [documents[i::self.workers] for i in range(min(self.workers, len(documents)))]
+        pool = self._get_pool()
+        try:
+            results = list(pool.map(_render_documents, [self.backend] * len(batches), batches))
+        except BrokenProcessPool:
+            # Pool s ukončeným procesem už nejde použít, příští převod vytvoří nový
+            with self.lock:
+                if self.pool is pool:
+                    self.pool = None
+            pool.shutdown(wait=False)
+            raise
+        # Zpětné proložení výsledků dávek do původního pořadí
+        pdfs = [None] * len(documents)
+        for index, batch_result in enumerate(results):
+            pdfs[index::self.workers] = batch_result
+        return pdfs
+
+    def render_markdown_batch(self, markdown_texts):
+        """Převede více markdownových textů najednou, viz render_html_batch"""
+        return self.render_html_batch([markdown_to_html(text) for text in markdown_texts])
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+def configure_renderer(config, workers=None):
+    """
+    Nastaví výchozí renderer podle sekce pdf konfigurace (backend, workers).
+
+    Args:
+        workers (int, optional): Přepíše počet procesů z konfigurace
+            (CLI převádí jediný dokument, pool se mu nevyplatí)
+
+    Returns:
+        PdfRenderer: Nový výchozí renderer
+    """
+    global _renderer
+    pdf_config = config.get('pdf', {}) or {}
+    renderer = PdfRenderer(
+        backend=pdf_config.get('backend', 'wkhtmltopdf'),
+        workers=pdf_config.get('workers', 0) if workers is None else workers
+    )
+    if pdf_config.get('warm_up', True):
+        try:
+            renderer.warm_up()
+        except Exception as e:
+            logging.error(f"Nepodařilo se připravit procesy pro převod PDF: {e}")
+    with _renderer_lock:
+        previous, _renderer = _renderer, renderer
+    if previous:
+        previous.close()
+    return renderer
+
+def get_renderer():
+    """Výchozí renderer, bez configure_renderer převádí v procesu přes wkhtmltopdf"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = PdfRenderer(backend='wkhtmltopdf')
+        return _renderer
+
+def convert_html_to_pdf(html_content):
+    """
+    Vloží HTML obsah do dokumentu se styly a převede ho na PDF.
+
+    Parametry:
+        html_content (str): HTML obsah (např. z markdown_to_html).
+
+    Návratová hodnota:
+        bytes: Obsah generovaného PDF souboru.
+    """
+    return get_renderer().render_html(html_content)
 
 def convert_markdown_to_pdf(markdown_text):
     """
@@ -18,60 +280,63 @@ def convert_markdown_to_pdf(markdown_text):
     Návratová hodnota:
         bytes: Obsah generovaného PDF souboru.
     """
+    return get_renderer().render_markdown(markdown_text)
 
-    # Seznam použitých rozšíření
-    extensions = [
-        'tables',                    # podpora tabulek
-        'fenced_code',              # podpora ohraničených bloků kódu
-        'attr_list',                # podpora HTML atributů
-        'def_list',                 # podpora definičních seznamů
-        'footnotes',                # podpora poznámek pod čarou
-        'markdown.extensions.nl2br', # převod nových řádků na <br>
-        'markdown.extensions.sane_lists', # lepší zpracování seznamů
-    ]
-
-    # Převod markdownu na HTML
-    html_content = markdown.markdown(markdown_text, extensions=extensions)
-
-    options = {
-        'encoding': 'UTF-8',
-        'enable-local-file-access': None,
-        'margin-top': '20mm',
-        'margin-right': '20mm',
-        'margin-bottom': '20mm',
-        'margin-left': '20mm'
-    }
-
-    # CSS styly
-    css_styles = """
-    <style>
-    body { font-family: Arial; line-height: 1.6; margin: 20px; }
-    table { border-collapse: collapse; width: 100%; margin: 15px 0; border: 2px solid black; }
-    th, td { border: 1px solid black; padding: 8px; text-align: left; }
-    th { background-color: #f2f2f2; font-weight: bold; }
-    tr:nth-child(even) { background-color: #f9f9f9; }
-    </style>
+class MarkdownStreamRenderer:
     """
+    Převádí markdown na HTML průběžně, jak přicházejí části streamované odpovědi.
 
-    # Sestavení HTML dokumentu
-    html_template = (
-        "<!DOCTYPE html>"
-        "<html>"
-        "<head>"
-        "<meta charset='UTF-8'>"
-        f"{css_styles}"
-        "</head>"
-        "<body>"
-        f"{html_content}"
-        "</body>"
-        "</html>"
-    )
-    
-    # Nastavení dočasného souboru pro výstup PDF
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
-        pdfkit.from_string(html_template, tmp_file.name, options=options)
-        tmp_file.seek(0)
-        pdf_content = tmp_file.read()
-    # Odstranění dočasného souboru
-    os.unlink(tmp_file.name)
-    return pdf_content
\ No newline at end of file
+    Hotové bloky (oddělené prázdným řádkem mimo blok kódu, za kterým nezačíná
+    pokračování seznamu, tabulky či odsazeného textu) se převedou hned, takže
+    na konci zbývá převést jen poslední blok. Pokud dokument obsahuje poznámky
+    pod čarou nebo definice odkazů, převede se na konci celý najednou.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.pending = ""
+        self.html_parts = []
+
+    def feed(self, chunk):
+        """Přidá další část textu a převede dokončené bloky"""
+        self.chunks.append(chunk)
+        self.pending += chunk
+
+        # Nezpracovaný text vždy začíná na hranici bloku, tedy mimo blok kódu
+        lines = self.pending.split('\n')
+        in_fence = False
+        consumed = 0
+        offset = 0
+        # Poslední řádek ještě nemusí být celý
+        for index, line in enumerate(lines[:-1]):
+            offset += len(line) + 1
+            if FENCE.match(line):
+                in_fence = not in_fence
+                continue
+            if in_fence or line.strip():
+                continue
+            if index + 1 >= len(lines) - 1:
+                # Řádek za prázdným řádkem ještě nedorazil celý
+                break
+            following = lines[index + 1]
+            if not following.strip() or CONTINUATION.match(following):
+                continue
+            block = self.pending[consumed:offset]
+            if block.strip():
+                self.html_parts.append(markdown_to_html(block))
+            consumed = offset
+        self.pending = self.pending[consumed:]
+
+    @property
+    def text(self):
+        """Celý dosud přijatý markdown"""
+        return "".join(self.chunks)
+
+    def finish(self):
+        """Převede zbytek textu a vrátí HTML celého dokumentu"""
+        text = self.text
+        if DOCUMENT_LEVEL_SYNTAX.search(text):
+            return markdown_to_html(text)
+        if self.pending.strip():
+            self.html_parts.append(markdown_to_html(self.pending))
+            self.pending = ""
+        return "\n".join(self.html_parts)
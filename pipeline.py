@@ -0,0 +1,169 @@
+# pipeline.py
+
+import logging
+import queue
+import threading
+from metrics import EMAILS
+from logging_setup import email_context
+
+# Značka pro ukončení workeru
+_STOP = object()
+
+
+class Stage:
+    def __init__(self, name, func, workers=1):
+        """
+        Jeden stupeň pipeline
+
+        Args:
+            name (str): Název stupně (pro logování)
+            func (callable): Funkce, která dostane job (dict) a vrátí job pro další stupeň,
+                nebo None, pokud má být job zahozen
+            workers (int): Počet paralelních workerů stupně
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+
+
+class InflightBudget:
+    def __init__(self, max_bytes=None):
+        """
+        Limit součtu velikostí rozpracovaných jobů (job['size']), sdílený
+        načítáním emailů a jejich zpracováním.
+
+        Args:
+            max_bytes (int, optional): Limit v bytes, None = bez limitu
+        """
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, size):
+        """Započítá job, při vyčerpaném limitu blokuje"""
+        with self.cond:
+            # Samotný job větší než limit projde, pokud nic jiného neběží
+            while self.max_bytes and self.bytes and self.bytes + size > self.max_bytes:
+                self.cond.wait()
+            self.bytes += size
+
+    def release(self, size):
+        if size:
+            with self.cond:
+                self.bytes -= size
+                self.cond.notify_all()
+
+    def wait_for_capacity(self):
+        """Blokuje, dokud rozpracované joby nezabírají méně než limit"""
+        with self.cond:
+            while self.max_bytes and self.bytes >= self.max_bytes:
+                self.cond.wait()
+
+class Pipeline:
+    def __init__(self, stages, queue_size=20, max_inflight_bytes=None):
+        """
+        Vícestupňová pipeline s omezenými frontami mezi stupni.
+
+        Každý stupeň má vlastní sadu vláken. Pokud se fronta před stupněm zaplní,
+        předchozí stupeň (případně volající submit()) čeká - tím vzniká backpressure
+        až do smyčky, která načítá emaily.
+
+        Args:
+            stages (list[Stage]): Stupně v pořadí zpracování
+            queue_size (int): Maximální počet jobů čekajících před každým stupněm
+            max_inflight_bytes (int, optional): Limit součtu velikostí (job['size'])
+                rozpracovaných jobů, po jeho dosažení submit() čeká
+        """
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=max(1, int(queue_size))) for _ in stages]
+        self.threads = []
+        self.budget = InflightBudget(max_inflight_bytes)
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """Spustí workery všech stupňů"""
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(index,),
+                    name=f"{stage.name}-{n}",
+                    daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+        self.logger.info(
+            "Pipeline spuštěna: " + ", ".join(f"{s.name}={s.workers}" for s in self.stages)
+        )
+
+    def submit(self, job, stage=None):
+        """
+        Vloží job do prvního stupně, při plné frontě nebo vyčerpaném limitu paměti blokuje
+
+        Args:
+            stage (str, optional): Název stupně, od kterého se má job zpracovat
+                (navázání rozpracovaného jobu), výchozí je první stupeň
+        """
+        index = 0
+        if stage is not None:
+            index = [s.name for s in self.stages].index(stage)
+        self.budget.acquire(job.get('size', 0))
+        self.queues[index].put(job)
+
+    @property
+    def inflight_bytes(self):
+        return self.budget.bytes
+
+    def wait_for_capacity(self):
+        """Blokuje, dokud rozpracované joby nezabírají méně než limit paměti"""
+        self.budget.wait_for_capacity()
+
+    def _release(self, job):
+        self.budget.release(job.get('size', 0))
+
+    def join(self):
+        """Počká, až budou všechny vložené joby zpracovány"""
+        for q in self.queues:
+            q.join()
+
+    def stop(self, wait=True):
+        """
+        Ukončí workery. S wait=True se nejdřív dokončí rozpracované joby.
+        """
+        if wait:
+            self.join()
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                self.queues[index].put(_STOP)
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.threads = []
+
+    def queue_depths(self):
+        """Vrátí počet čekajících jobů před jednotlivými stupni"""
+        return {stage.name: self.queues[i].qsize() for i, stage in enumerate(self.stages)}
+
+    def _worker(self, index):
+        stage = self.stages[index]
+        in_queue = self.queues[index]
+        out_queue = self.queues[index + 1] if index + 1 < len(self.queues) else None
+
+        while True:
+            job = in_queue.get()
+            if job is _STOP:
+                in_queue.task_done()
+                break
+            passed = False
+            try:
+                with email_context(job.get('email_id')):
+                    result = stage.func(job)
+                if result is not None and out_queue is not None:
+                    out_queue.put(result)
+                    passed = True
+            except Exception as e:
+                self.logger.error(f"Chyba ve stupni {stage.name}: {e}")
+                EMAILS.inc(outcome='failed')
+            finally:
+                if not passed:
+                    self._release(job)
+                in_queue.task_done()
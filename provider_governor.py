@@ -0,0 +1,387 @@
+# provider_governor.py
+
+import asyncio
+import contextvars
+import email.utils
+import logging
+import random
+import re
+import time
+from threading import Condition
+
+# Jak dlouho async volání čeká, než znovu zkusí volný slot (uvolnění nelze oznámit)
+ASYNC_POLL_INTERVAL = 0.05
+
+# Povolení právě probíhajícího volání - přes něj se hlášení hlaviček a spotřeby
+# tokenů (report) přiřadí ke správnému volání ve vlákně i v asyncio úloze
+_current_permit = contextvars.ContextVar('current_permit', default=None)
+
+class RateLimited(Exception):
+    """Poskytovatel odmítl požadavek kvůli limitu (HTTP 429)"""
+    def __init__(self, message, headers=None):
+        super().__init__(message)
+        self.headers = {key.lower(): value for key, value in (headers or {}).items()}
+
+def parse_duration(value):
+    """
+    Převede dobu z hlavičky na sekundy.
+
+    Podporuje číslo sekund ("1.5") i formát OpenAI ("20ms", "6m0s", "1h2m3s").
+    """
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts:
+        return None
+    units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+def retry_delay(headers, now=None):
+    """Za kolik sekund lze podle hlaviček odpovědi zkusit požadavek znovu, None pokud to neuvádějí"""
+    now = now or time.time()
+    if 'retry-after-ms' in headers:
+        return float(headers['retry-after-ms']) / 1000
+    if 'retry-after' in headers:
+        delay = parse_duration(headers['retry-after'])
+        if delay is not None:
+            return delay
+        try:
+            return email.utils.parsedate_to_datetime(headers['retry-after']).timestamp() - now
+        except (TypeError, ValueError):
+            pass
+    delays = [parse_duration(headers[name]) for name in ('x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens')
+              if name in headers]
+    delays = [delay for delay in delays if delay is not None]
+    if delays:
+        return max(delays)
+    if 'x-ratelimit-reset' in headers:
+        # OpenRouter uvádí čas obnovení v milisekundách od epochy
+        reset = float(headers['x-ratelimit-reset'])
+        if reset > 1e12:
+            return reset / 1000 - now
+        if reset > 1e9:
+            return reset - now
+        return reset
+    return None
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        """Kbelík doplňovaný rovnoměrně rychlostí per_minute za minutu"""
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Za kolik sekund bude v kbelíku amount (větší požadavek než kapacita čeká na plný kbelík)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0
+        return (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount):
+        self.level -= amount
+
+    def sync(self, remaining):
+        """Srovná stav se zbývajícím limitem hlášeným poskytovatelem"""
+        self.level = min(self.level, float(remaining))
+
+class ProviderLimit:
+    def __init__(self, name, max_concurrency=None, rpm=None, tpm=None):
+        """
+        Limity jednoho poskytovatele nebo modelu.
+
+        Args:
+            name (str): "api" nebo "api:model"
+            max_concurrency (int): Max. počet souběžných požadavků, None = bez omezení
+            rpm (int): Požadavky za minutu, None = bez omezení (lze převzít z hlaviček)
+            tpm (int): Tokeny za minutu, None = bez omezení (lze převzít z hlaviček)
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.active = 0
+        self.backoff_until = 0
+        self.failures = 0
+
+    def wait_time(self, tokens, now):
+        """Za kolik sekund lze poslat požadavek, None pokud se čeká na uvolnění slotu"""
+        if self.max_concurrency and self.active >= self.max_concurrency:
+            return None
+        waits = [self.backoff_until - now]
+        if self.requests:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens:
+            waits.append(self.tokens.wait_time(tokens, now))
+        return max(0, *waits)
+
+    def take(self, tokens):
+        self.active += 1
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+
+class Permit:
+    def __init__(self, limits, tokens):
+        self.limits = limits
+        self.tokens = tokens
+
+class ProviderGovernor:
+    def __init__(self, governor_config):
+        """
+        Omezení odchozích požadavků na poskytovatele AI.
+
+        Hlídá souběžné požadavky a požadavky/tokeny za minutu pro poskytovatele
+        i jednotlivé modely. Požadavek nad limit čeká ve frontě, dokud se
+        neuvolní slot nebo kapacita. Odpověď 429 vede k odložení dalších
+        požadavků podle hlaviček odpovědi (jinak exponenciálně s náhodným
+        rozptylem) a k opakování požadavku.
+
+        Args:
+            governor_config (dict): Sekce 'governor' konfigurace:
+                - providers: api -> {max_concurrency, rpm, tpm}
+                - models: "api:model" -> {max_concurrency, rpm, tpm}
+                - max_wait: max. doba čekání ve frontě (s)
+                - max_retries: počet opakování po odpovědi 429
+                - backoff_base, backoff_max: exponenciální odklad bez hlaviček (s)
+                - completion_tokens: odhad tokenů odpovědi pro limit tpm
+        """
+        self.providers_config = governor_config.get('providers', {}) or {}
+        self.models_config = governor_config.get('models', {}) or {}
+        self.max_wait = governor_config.get('max_wait', 300)
+        self.max_retries = governor_config.get('max_retries', 3)
+        self.backoff_base = governor_config.get('backoff_base', 1)
+        self.backoff_max = governor_config.get('backoff_max', 60)
+        self.completion_tokens = governor_config.get('completion_tokens', 1000)
+        self.limits = {}
+        self.condition = Condition()
+        self.logger = logging.getLogger(__name__)
+
+    def _limit(self, key, settings):
+        if key not in self.limits:
+            settings = settings or {}
+            self.limits[key] = ProviderLimit(
+                key,
+                max_concurrency=settings.get('max_concurrency'),
+                rpm=settings.get('rpm'),
+                tpm=settings.get('tpm')
+            )
+        return self.limits[key]
+
+    def _limits_for(self, api, model):
+        """Limity modelu a poskytovatele - model vždy (sleduje se u něj odklad po 429)"""
+        target = f"{api}:{model}"
+        return [
+            self._limit(target, self.models_config.get(target)),
+            self._limit(api, self.providers_config.get(api)),
+        ]
+
+    def _try_acquire(self, api, model, tokens):
+        """Vrátí (povolení, None), nebo (None, doba čekání v s; None = do uvolnění slotu)"""
+        now = time.monotonic()
+        limits = self._limits_for(api, model)
+        waits = [limit.wait_time(tokens, now) for limit in limits]
+        if None in waits:
+            return None, None
+        if max(waits) > 0:
+            return None, max(waits)
+        for limit in limits:
+            limit.take(tokens)
+        return Permit(limits, tokens), None
+
+    def acquire(self, api, model, tokens):
+        """Počká na volný slot a kapacitu, None pokud to trvá déle než max_wait"""
+        tokens = tokens + self.completion_tokens
+        deadline = time.monotonic() + self.max_wait
+        with self.condition:
+            while True:
+                permit, wait = self._try_acquire(api, model, tokens)
+                if permit:
+                    return permit
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.logger.error(f"Požadavek na {api}:{model} čekal na limit déle než {self.max_wait} s")
+                    return None
+                self.condition.wait(remaining if wait is None else min(wait, remaining))
+
+    async def acquire_async(self, api, model, tokens):
+        """Asynchronní obdoba acquire - čekání neblokuje event loop"""
+        tokens = tokens + self.completion_tokens
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self.condition:
+                permit, wait = self._try_acquire(api, model, tokens)
+            if permit:
+                return permit
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.logger.error(f"Požadavek na {api}:{model} čekal na limit déle než {self.max_wait} s")
+                return None
+            await asyncio.sleep(min(ASYNC_POLL_INTERVAL if wait is None else wait, remaining))
+
+    def release(self, permit):
+        with self.condition:
+            for limit in permit.limits:
+                limit.active -= 1
+            self.condition.notify_all()
+
+    def observe(self, permit, headers=None, used_tokens=None):
+        """Zpracuje hlavičky limitů a skutečnou spotřebu tokenů úspěšné odpovědi"""
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        now = time.monotonic()
+        with self.condition:
+            model_limit = permit.limits[0]
+            model_limit.failures = 0
+            for limit in permit.limits:
+                if limit.tokens and used_tokens is not None:
+                    # Vrátí se rozdíl mezi odhadem a skutečností (může být i záporný)
+                    limit.tokens.take(used_tokens - permit.tokens)
+            self._sync(model_limit, 'requests', headers, now)
+            self._sync(model_limit, 'tokens', headers, now)
+
+    def _sync(self, limit, kind, headers, now):
+        """Převezme zbývající limit z hlaviček x-ratelimit-* (OpenAI i OpenRouter)"""
+        remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+        if remaining is None and kind == 'requests':
+            remaining = headers.get('x-ratelimit-remaining')
+        if remaining is None:
+            return
+        limit_value = headers.get(f'x-ratelimit-limit-{kind}') or (
+            headers.get('x-ratelimit-limit') if kind == 'requests' else None
+        )
+        try:
+            remaining = float(remaining)
+            limit_value = float(limit_value) if limit_value else None
+        except ValueError:
+            return
+        bucket = getattr(limit, kind)
+        if bucket is None and limit_value:
+            bucket = TokenBucket(limit_value)
+            setattr(limit, kind, bucket)
+        if bucket:
+            # Nastavený limit může být nižší než kvóta poskytovatele, proto se přebírá jen zbytek
+            bucket._refill(now)
+            bucket.sync(remaining)
+        if remaining < 1:
+            delay = retry_delay(headers)
+            if delay:
+                limit.backoff_until = max(limit.backoff_until, now + delay)
+
+    def rate_limited(self, permit, error):
+        """Po odpovědi 429 odloží další požadavky na model, vrací dobu odkladu"""
+        with self.condition:
+            limit = permit.limits[0]
+            limit.failures += 1
+            delay = retry_delay(error.headers)
+            if delay is None or delay <= 0:
+                # Exponenciální odklad s plným náhodným rozptylem
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (limit.failures - 1)))
+            else:
+                delay += random.uniform(0, min(delay, self.backoff_base))
+            limit.backoff_until = max(limit.backoff_until, time.monotonic() + delay)
+            if limit.requests:
+                limit.requests.level = min(limit.requests.level, 0)
+        self.logger.warning(f"Limit poskytovatele {limit.name} překročen, další pokus za {delay:.1f} s")
+        return delay
+
+    def call(self, api, model, tokens, func):
+        """
+        Zavolá func() v rámci limitů, při RateLimited ji zopakuje.
+
+        Returns:
+            Výsledek func(), nebo None pokud se nepodařilo získat slot
+            nebo došly pokusy
+        """
+        for _ in range(self.max_retries + 1):
+            permit = self.acquire(api, model, tokens)
+            if permit is None:
+                return None
+            context = _current_permit.set((self, permit))
+            try:
+                return func()
+            except RateLimited as e:
+                self.rate_limited(permit, e)
+            finally:
+                _current_permit.reset(context)
+                self.release(permit)
+        self.logger.error(f"Požadavek na {api}:{model} odmítnut kvůli limitu i po {self.max_retries} opakováních")
+        return None
+
+    async def acall(self, api, model, tokens, func):
+        """Asynchronní obdoba call, func() vrací korutinu"""
+        for _ in range(self.max_retries + 1):
+            permit = await self.acquire_async(api, model, tokens)
+            if permit is None:
+                return None
+            context = _current_permit.set((self, permit))
+            try:
+                return await func()
+            except RateLimited as e:
+                self.rate_limited(permit, e)
+            finally:
+                _current_permit.reset(context)
+                self.release(permit)
+        self.logger.error(f"Požadavek na {api}:{model} odmítnut kvůli limitu i po {self.max_retries} opakováních")
+        return None
+
+    def stream(self, api, model, tokens, func):
+        """
+        Obdoba call pro streamované volání - func() vrací generátor částí.
+
+        Slot je obsazený, dokud stream neskončí. Opakovat lze jen odmítnutí
+        před první částí odpovědi (429 přichází vždy hned).
+        """
+        for _ in range(self.max_retries + 1):
+            permit = self.acquire(api, model, tokens)
+            if permit is None:
+                return
+            try:
+                yield from func()
+                return
+            except RateLimited as e:
+                self.rate_limited(permit, e)
+            finally:
+                self.release(permit)
+        self.logger.error(f"Požadavek na {api}:{model} odmítnut kvůli limitu i po {self.max_retries} opakováních")
+
+    def snapshot(self):
+        """Aktuální stav limitů pro logování a metriky"""
+        now = time.monotonic()
+        with self.condition:
+            return {
+                name: {
+                    'active': limit.active,
+                    'backoff': round(max(0, limit.backoff_until - now), 1),
+                    'requests_left': round(limit.requests.level) if limit.requests else None,
+                    'tokens_left': round(limit.tokens.level) if limit.tokens else None,
+                }
+                for name, limit in self.limits.items()
+            }
+
+def report(headers=None, used_tokens=None):
+    """
+    Nahlásí hlavičky a spotřebu tokenů odpovědi probíhajícího volání.
+
+    Volají metody call_* agenta po úspěšné odpovědi; mimo ProviderGovernor.call
+    nedělá nic.
+    """
+    current = _current_permit.get()
+    if current:
+        governor, permit = current
+        governor.observe(permit, headers, used_tokens)
+
+def create_governor(config):
+    """Vytvoří governor podle sekce governor konfigurace, nebo None pokud je vypnutý"""
+    governor_config = config.get('governor', {}) or {}
+    if not governor_config.get('enabled', True):
+        return None
+    return ProviderGovernor(governor_config)
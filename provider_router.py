@@ -0,0 +1,226 @@
+# provider_router.py
+
+import logging
+import random
+import time
+from collections import deque
+from threading import Lock
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=3, reset_timeout=60):
+        """
+        Jistič pro jednoho poskytovatele a model.
+
+        Po failure_threshold chybách v řadě se rozpojí a požadavky se posílají
+        jinam. Po reset_timeout sekundách propustí jeden zkušební požadavek -
+        při úspěchu se sepne, při chybě zůstane rozpojený další reset_timeout.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """Zda lze poskytovateli poslat požadavek (v half_open jen jeden najednou)"""
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def record(self, ok):
+        self.trial_running = False
+        if ok:
+            self.failures = 0
+            self.opened_at = None
+        else:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class ProviderStats:
+    def __init__(self, window=50):
+        """Klouzavé okno posledních volání - latence a úspěšnost"""
+        self.calls = deque(maxlen=window)  # (latence v s, úspěch)
+
+    def record(self, latency, ok):
+        self.calls.append((latency, ok))
+
+    @property
+    def error_rate(self):
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls)
+
+    @property
+    def latency(self):
+        """Průměrná latence úspěšných volání, None pokud zatím žádná nebyla"""
+        latencies = [latency for latency, ok in self.calls if ok]
+        if not latencies:
+            return None
+        return sum(latencies) / len(latencies)
+
+    def percentile(self, p):
+        latencies = sorted(latency for latency, ok in self.calls if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+class ProviderRouter:
+    def __init__(self, routing_config, available_apis):
+        """
+        Výběr poskytovatele a modelu podle latence, chybovosti a stavu jističe.
+
+        Args:
+            routing_config (dict): Sekce 'routing' konfigurace:
+                - strategy: least_latency | weighted | ordered
+                - equivalent_models: seznam skupin ["api:model", ...] se zaměnitelnými modely
+                - failover: api -> seznam záložních API
+                - weights: api -> váha pro strategii weighted
+                - failure_threshold, reset_timeout: nastavení jističe
+                - window: počet posledních volání pro statistiky
+            available_apis (iterable): API, která jsou zapnutá a nakonfigurovaná
+        """
+        self.strategy = routing_config.get('strategy', 'least_latency')
+        self.failover = routing_config.get('failover', {}) or {}
+        self.weights = routing_config.get('weights', {}) or {}
+        self.failure_threshold = routing_config.get('failure_threshold', 3)
+        self.reset_timeout = routing_config.get('reset_timeout', 60)
+        self.window = routing_config.get('window', 50)
+        self.available_apis = set(available_apis)
+
+        # "api:model" -> skupina ekvivalentních (api, model)
+        self.equivalents = {}
+        for group in routing_config.get('equivalent_models', []) or []:
+            members = [self._parse_target(target) for target in group]
+            for member in members:
+                self.equivalents[member] = members
+
+        self.stats = {}
+        self.breakers = {}
+        self.lock = Lock()
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def _parse_target(target):
+        api, _, model = target.partition(':')
+        return (api.strip(), model.strip() or None)
+
+    def _get(self, target):
+        if target not in self.stats:
+            self.stats[target] = ProviderStats(self.window)
+            self.breakers[target] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.stats[target], self.breakers[target]
+
+    def _score(self, target):
+        """Očekávaná latence penalizovaná chybovostí (nižší je lepší)"""
+        stats, _ = self._get(target)
+        latency = stats.latency
+        if latency is None:
+            # Neznámý poskytovatel se zkusí, aby se o něm sbíraly statistiky
+            return 0.0
+        return latency * (1 + 4 * stats.error_rate)
+
+    def _order(self, targets):
+        if self.strategy == 'ordered' or len(targets) < 2:
+            return targets
+        if self.strategy == 'weighted':
+            remaining = list(targets)
+            ordered = []
+            while remaining:
+                weights = [
+                    self.weights.get(api, 1.0) * (1 - self._get((api, model))[0].error_rate) /
+                    max(self._get((api, model))[0].latency or 1.0, 0.1)
+                    for api, model in remaining
+                ]
+                if not any(weights):
+                    ordered.extend(remaining)
+                    break
+                choice = random.choices(range(len(remaining)), weights=weights)[0]
+                ordered.append(remaining.pop(choice))
+            return ordered
+        return sorted(targets, key=self._score)
+
+    def candidates(self, api, model, default_model):
+        """
+        Seznam (api, model) v pořadí, v jakém se mají zkoušet.
+
+        Nejdřív požadovaný model a jeho ekvivalenty u jiných poskytovatelů
+        seřazené podle strategie, pak záložní poskytovatelé z 'failover'.
+        Poskytovatelé s rozpojeným jističem se přeskočí; pokud by nezbyl
+        žádný, zkusí se aspoň požadovaný.
+
+        Args:
+            default_model (callable): Vrací výchozí model pro API
+        """
+        primary = (api, model)
+        group = [target for target in self.equivalents.get(primary, [primary])
+                 if target[0] in self.available_apis]
+        if primary not in group:
+            group.insert(0, primary)
+
+        targets = []
+        with self.lock:
+            group = self._order(group)
+            for fallback_api in self.failover.get(api, []) or []:
+                if fallback_api not in self.available_apis:
+                    continue
+                equivalent = [target for target in group if target[0] == fallback_api]
+                group.extend([] if equivalent else [(fallback_api, default_model(fallback_api))])
+            for target in group:
+                if target in targets:
+                    continue
+                if self._get(target)[1].allow():
+                    targets.append(target)
+                else:
+                    self.logger.info(f"Jistič pro {target[0]}:{target[1]} je rozpojený, přeskakuji")
+        return targets or [primary]
+
+    def record(self, api, model, latency, ok):
+        """Zaznamená výsledek volání"""
+        with self.lock:
+            stats, breaker = self._get((api, model))
+            stats.record(latency, ok)
+            was_open = breaker.state != 'closed'
+            breaker.record(ok)
+            if not ok and breaker.state == 'open' and not was_open:
+                self.logger.warning(f"Jistič pro {api}:{model} rozpojen po {breaker.failures} chybách")
+
+    def release(self, api, model):
+        """Uvolní zkušební průchod jističe u kandidáta, který se nakonec nevolal"""
+        with self.lock:
+            breaker = self.breakers.get((api, model))
+            if breaker:
+                breaker.trial_running = False
+
+    def snapshot(self):
+        """Aktuální statistiky pro logování a metriky"""
+        with self.lock:
+            return {
+                f"{api}:{model}": {
+                    'calls': len(stats.calls),
+                    'error_rate': round(stats.error_rate, 3),
+                    'latency': stats.latency,
+                    'p95': stats.percentile(0.95),
+                    'breaker': self.breakers[(api, model)].state,
+                }
+                for (api, model), stats in self.stats.items()
+            }
+
+def create_router(config, available_apis):
+    """Vytvoří router podle sekce routing konfigurace, nebo None pokud je vypnutý"""
+    routing_config = config.get('routing', {})
+    if not routing_config.get('enabled', False):
+        return None
+    return ProviderRouter(routing_config, available_apis)
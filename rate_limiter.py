@@ -2,52 +2,301 @@
 
 import os
 import json
+import math
 import time
+import logging
+import sqlite3
+import tempfile
+import threading
 from threading import Lock
+from metrics import STAGE_SECONDS, RATE_LIMIT_CHECKS
 
-class RateLimiter:
-    def __init__(self, stats_file='rate_limit_stats.json'):
+class MemoryStore:
+    def __init__(self, stats_file='rate_limit_stats.json', snapshot_interval=30):
+        """
+        Stav limitů v paměti, na disk se ukládá jen periodicky.
+
+        Snímek se zapisuje do dočasného souboru a přejmenuje přes os.replace,
+        takže soubor nikdy nezůstane zapsaný napůl. Soubor je ve stejném
+        formátu jako dřív, stávající statistiky se tedy načtou.
+
+        Args:
+            stats_file (str): Soubor se snímkem, None = jen paměť
+            snapshot_interval (int): Interval ukládání snímku v sekundách
+        """
         self.stats_file = stats_file
+        self.snapshot_interval = snapshot_interval
         self.lock = Lock()
-        self.load_stats()
+        self.stats = {}
+        self.dirty = False
+        if stats_file and os.path.exists(stats_file):
+            try:
+                with open(stats_file, 'r') as file:
+                    self.stats = json.load(file)
+            except (OSError, ValueError) as e:
+                logging.error(f"Nelze načíst statistiky limitů z {stats_file}: {e}")
 
-    def load_stats(self):
-        if os.path.exists(self.stats_file):
-            with open(self.stats_file, 'r') as file:
-                self.stats = json.load(file)
-        else:
-            self.stats = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+        if stats_file and snapshot_interval:
+            self.thread = threading.Thread(target=self._snapshot_loop, name='rate-limit-snapshot', daemon=True)
+            self.thread.start()
 
-    def save_stats(self):
+    def update(self, key, func):
+        """Atomicky zavolá func(stav) -> (nový stav, výsledek) a vrátí výsledek"""
         with self.lock:
-            with open(self.stats_file, 'w') as file:
-                json.dump(self.stats, file)
+            state, result = func(self.stats.get(key))
+            self.stats[key] = state
+            self.dirty = True
+            return result
 
-    def is_allowed(self, user_email, max_requests, time_window):
-        current_time = int(time.time())
-        user_stats = self.stats.get(user_email, {"request_count": 0, "window_start": current_time})
+    def get(self, key):
+        with self.lock:
+            state = self.stats.get(key)
+            return dict(state) if state else None
+
+    def snapshot(self):
+        """Uloží aktuální stav na disk, pokud se od posledního snímku změnil"""
+        if not self.stats_file:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps(self.stats)
+            self.dirty = False
+        directory = os.path.dirname(os.path.abspath(self.stats_file))
+        try:
+            with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as file:
+                file.write(data)
+            os.replace(file.name, self.stats_file)
+        except OSError as e:
+            logging.error(f"Nelze uložit statistiky limitů do {self.stats_file}: {e}")
+            with self.lock:
+                self.dirty = True
+
+    def _snapshot_loop(self):
+        while not self.stop_event.wait(self.snapshot_interval):
+            self.snapshot()
+
+    def close(self):
+        self.stop_event.set()
+        self.snapshot()
+
+class SqliteStore:
+    def __init__(self, path='rate_limit_stats.sqlite', busy_timeout=30):
+        """
+        Stav limitů v SQLite (WAL) - sdílený více procesy, případně i více
+        stroji nad sdíleným úložištěm. Čtení a zápis stavu jednoho uživatele
+        probíhá v jedné transakci BEGIN IMMEDIATE.
+
+        Args:
+            path (str): Soubor databáze
+            busy_timeout (int): Jak dlouho čekat na zámek databáze (s)
+        """
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = self._connection()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, state TEXT)')
+
+    def _connection(self):
+        """Každé vlákno má vlastní spojení"""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            self.local.db = db
+        return db
+
+    def update(self, key, func):
+        """Atomicky zavolá func(stav) -> (nový stav, výsledek) a vrátí výsledek"""
+        db = self._connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute('SELECT state FROM rate_limits WHERE key = ?', (key,)).fetchone()
+            state, result = func(json.loads(row[0]) if row else None)
+            db.execute(
+                'INSERT OR REPLACE INTO rate_limits (key, state) VALUES (?, ?)',
+                (key, json.dumps(state))
+            )
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return result
+
+    def get(self, key):
+        row = self._connection().execute('SELECT state FROM rate_limits WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def snapshot(self):
+        pass
+
+    def close(self):
+        db = getattr(self.local, 'db', None)
+        if db is not None:
+            db.close()
+            self.local.db = None
+
+class FixedWindow:
+    """Pevné okno - počítadlo se vynuluje time_window sekund po prvním požadavku okna"""
+    KEYS = ('request_count', 'window_start')
 
-        # Kontrola, zda jsme stále v časovém okně
-        if current_time - user_stats['window_start'] >= time_window:
+    @staticmethod
+    def hit(state, now, max_requests, time_window):
+        if not state or now - state['window_start'] >= time_window:
             # Resetujeme počítadlo a začneme nové okno
-            user_stats['request_count'] = 1
-            user_stats['window_start'] = current_time
+            state = {'request_count': 1, 'window_start': now}
         else:
             # Zvýšíme počítadlo
-            user_stats['request_count'] += 1
+            state = dict(state, request_count=state['request_count'] + 1)
+        return state, state['request_count'] <= max_requests
 
-        # Uložíme zpět statistiky
-        self.stats[user_email] = user_stats
-        self.save_stats()
+    @staticmethod
+    def time_until_reset(state, now, time_window):
+        if not state:
+            return 0
+        return max(0, time_window - (now - state['window_start']))
 
-        # Ověříme, zda uživatel nepřekročil limit
-        if user_stats['request_count'] > max_requests:
-            return False
-        else:
-            return True
+class SlidingWindow:
+    """
+    Klouzavé okno (odhad z počtu v aktuálním a předchozím okně).
+
+    Počet v předchozím okně se započítá poměrem, jakým ještě zasahuje do
+    posledních time_window sekund, takže na hranici oken nevznikne dvojnásobná
+    špička jako u pevného okna. Odmítnuté požadavky se nezapočítávají.
+    """
+    KEYS = ('request_count', 'window_start', 'previous_count')
+
+    @staticmethod
+    def _advance(state, now, time_window):
+        window_start = now - now % time_window
+        if not state:
+            return {'window_start': window_start, 'request_count': 0, 'previous_count': 0}
+        if state['window_start'] == window_start:
+            return dict(state)
+        previous = state['request_count'] if window_start - state['window_start'] == time_window else 0
+        return dict(state, window_start=window_start, request_count=0, previous_count=previous)
+
+    @staticmethod
+    def hit(state, now, max_requests, time_window):
+        state = SlidingWindow._advance(state, now, time_window)
+        weight = 1 - (now - state['window_start']) / time_window
+        estimate = state['previous_count'] * weight + state['request_count']
+        state['max_requests'] = max_requests
+        if estimate + 1 > max_requests:
+            return state, False
+        state['request_count'] += 1
+        return state, True
+
+    @staticmethod
+    def time_until_reset(state, now, time_window):
+        if not state or 'max_requests' not in state:
+            return 0
+        state = SlidingWindow._advance(state, now, time_window)
+        max_requests = state['max_requests']
+        elapsed = now - state['window_start']
+        if state['request_count'] + 1 > max_requests:
+            # V tomto okně už nic, v dalším se uvolní podle jeho začátku
+            return time_window - elapsed
+        if not state['previous_count']:
+            return 0
+        # Kdy klesne podíl předchozího okna natolik, že se vejde další požadavek
+        needed = time_window * (1 - (max_requests - 1 - state['request_count']) / state['previous_count'])
+        return max(0, math.ceil(needed - elapsed))
+
+class TokenBucket:
+    """
+    Token bucket - kapacita max_requests, doplňuje se rovnoměrně rychlostí
+    max_requests za time_window. Povoluje krátké dávky a pak plynulý provoz.
+    """
+    KEYS = ('tokens', 'updated', 'max_requests')
+
+    @staticmethod
+    def _refill(state, now, max_requests, time_window):
+        if not state:
+            return {'tokens': float(max_requests), 'updated': now, 'max_requests': max_requests}
+        rate = max_requests / time_window
+        tokens = min(float(max_requests), state['tokens'] + (now - state['updated']) * rate)
+        return {'tokens': tokens, 'updated': now, 'max_requests': max_requests}
+
+    @staticmethod
+    def hit(state, now, max_requests, time_window):
+        state = TokenBucket._refill(state, now, max_requests, time_window)
+        if state['tokens'] < 1:
+            return state, False
+        state['tokens'] -= 1
+        return state, True
+
+    @staticmethod
+    def time_until_reset(state, now, time_window):
+        if not state:
+            return 0
+        state = TokenBucket._refill(state, now, state['max_requests'], time_window)
+        if state['tokens'] >= 1:
+            return 0
+        return math.ceil((1 - state['tokens']) * time_window / state['max_requests'])
+
+ALGORITHMS = {
+    'fixed_window': FixedWindow,
+    'sliding_window': SlidingWindow,
+    'token_bucket': TokenBucket,
+}
+
+class RateLimiter:
+    def __init__(self, stats_file='rate_limit_stats.json', store=None, algorithm='fixed_window'):
+        """
+        Omezení počtu požadavků na uživatele.
+
+        Args:
+            stats_file (str): Soubor snímku pro výchozí MemoryStore
+            store: Úložiště stavu (MemoryStore, SqliteStore), výchozí MemoryStore
+            algorithm (str): fixed_window | sliding_window | token_bucket
+        """
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Neznámý algoritmus omezení: {algorithm}")
+        self.store = store if store is not None else MemoryStore(stats_file)
+        self.algorithm = ALGORITHMS[algorithm]
+
+    def _state(self, state):
+        """Stav uložený jiným algoritmem (po změně konfigurace) se ignoruje"""
+        if state and all(key in state for key in self.algorithm.KEYS):
+            return state
+        return None
+
+    def is_allowed(self, user_email, max_requests, time_window):
+        current_time = int(time.time())
+        with STAGE_SECONDS.time(stage='rate_limit'):
+            allowed = self.store.update(
+                user_email,
+                lambda state: self.algorithm.hit(self._state(state), current_time, max_requests, time_window)
+            )
+        RATE_LIMIT_CHECKS.inc(result='allowed' if allowed else 'limited')
+        return allowed
 
     def get_time_until_reset(self, user_email, time_window):
         current_time = int(time.time())
-        user_stats = self.stats.get(user_email, {"window_start": current_time})
-        time_passed = current_time - user_stats['window_start']
-        return max(0, time_window - time_passed)
\ No newline at end of file
+        state = self._state(self.store.get(user_email))
+        return self.algorithm.time_until_reset(state, current_time, time_window)
+
+    def close(self):
+        """Uloží poslední stav a uvolní úložiště"""
+        self.store.close()
+
+def create_rate_limiter(config):
+    """Vytvoří RateLimiter podle sekce rate_limiter konfigurace"""
+    limiter_config = config.get('rate_limiter', {}) or {}
+    backend = limiter_config.get('backend', 'memory')
+    if backend == 'sqlite':
+        store = SqliteStore(limiter_config.get('sqlite_path', 'rate_limit_stats.sqlite'))
+    elif backend == 'memory':
+        store = MemoryStore(
+            limiter_config.get('stats_file', 'rate_limit_stats.json'),
+            limiter_config.get('snapshot_interval', 30)
+        )
+    else:
+        raise ValueError(f"Neznámé úložiště omezení: {backend}")
+    return RateLimiter(store=store, algorithm=limiter_config.get('algorithm', 'fixed_window'))
@@ -0,0 +1,301 @@
+# replay.py
+#
+# Přehrání záznamů průběhu (tracing) jako zátěžový test:
+#   python replay.py traces.jsonl --speed 5
+#
+# Emaily se předávají přímo do pipeline (prepare_email + extract_stage), bez
+# IMAP a SMTP. Nepřehrává se načítání (fetch_unseen_emails, download_email,
+# claim klíčová slova, IDLE) ani skutečné odesílání - EmailHandler se připojuje
+# jen přes TLS na výchozí porty serverů z konfigurace a lokální náhrada by
+# vyžadovala vlastní certifikát. Zaznamenaná doba stupně 'fetch' se proto do
+# výsledné latence nezapočítá, odesílání nahrazuje čekání ReplayMailbox.
+
+import io
+import json
+import time
+import logging
+import argparse
+import threading
+import statistics
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from docx import Document
+from config_loader import load_config, load_tasks
+from ai_agent import AIAgent
+from attachment_processor import configure_extractor
+from pdf_converter import configure_renderer
+from rate_limiter import create_rate_limiter
+from metrics import percentile
+from tracing import load_traces
+from main import build_pipeline, prepare_email, process_email
+
+# Prefix modelu, podle kterého náhradní poskytovatel pozná přehrávaný záznam
+MODEL_PREFIX = 'replay-'
+
+# Počet znaků textu na jednu stránku vygenerovaného PDF
+PDF_PAGE_CHARS = 3000
+
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do')
+
+def synthetic_text(chars):
+    """Náhradní text zadané délky"""
+    words = []
+    length = 0
+    index = 0
+    while length < chars:
+        word = WORDS[index % len(WORDS)]
+        words.append(word)
+        length += len(word) + 1
+        index += 1
+    return " ".join(words)[:chars]
+
+def synthetic_pdf(text):
+    """Minimální PDF s textem rozděleným na stránky"""
+    pages = [text[i:i + PDF_PAGE_CHARS] for i in range(0, len(text), PDF_PAGE_CHARS)] or ['']
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        stream = b"BT /F1 10 Tf 72 720 Td (" + page.encode('latin-1') + b") Tj ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 3 0 R >> >> >>" % len(objects)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return out
+
+def synthetic_docx(text):
+    document = Document()
+    for i in range(0, len(text), PDF_PAGE_CHARS):
+        document.add_paragraph(text[i:i + PDF_PAGE_CHARS])
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+def attachment_texts(trace, task):
+    """
+    Délky textu jednotlivých příloh.
+
+    Záznam obsahuje jen délku celého promptu, text příloh se mezi ně
+    rozdělí podle jejich velikosti. Bez délky promptu (email skončil
+    před extrakcí) se použije velikost přílohy.
+    """
+    attachments = trace.get('attachments', [])
+    if not trace.get('prompt_chars'):
+        return [attachment['size'] for attachment in attachments]
+    remaining = trace['prompt_chars'] - trace.get('body_chars', 0) - len(task['base_prompt'])
+    # Hlavička "[Obsah přílohy ...]" u každé přílohy
+    remaining -= sum(len(f"\n[Obsah přílohy priloha{i}.{a['type']}]:\n\n") for i, a in enumerate(attachments))
+    total_size = sum(attachment['size'] for attachment in attachments) or 1
+    return [max(0, remaining) * attachment['size'] // total_size for attachment in attachments]
+
+def build_message(trace, task):
+    """
+    Email odpovídající záznamu: stejný úkol, délka těla a typy příloh
+    se stejnou délkou textu. Model ve subjectu odkazuje na záznam.
+    """
+    msg = EmailMessage()
+    msg['From'] = sender_address(trace)
+    msg['To'] = 'taskmailer@replay.invalid'
+    msg['Subject'] = f"{task['subject']} (ollama:{MODEL_PREFIX}{trace['id']})"
+    msg.set_content(synthetic_text(trace.get('body_chars', 0)))
+    for index, (attachment, chars) in enumerate(zip(trace.get('attachments', []), attachment_texts(trace, task))):
+        text = synthetic_text(chars)
+        if attachment['type'] == 'pdf':
+            content, maintype, subtype = synthetic_pdf(text), 'application', 'pdf'
+        elif attachment['type'] == 'docx':
+            content, maintype, subtype = synthetic_docx(text), 'application', \
+                'vnd.openxmlformats-officedocument.wordprocessingml.document'
+        else:
+            content, maintype, subtype = text.encode('utf-8'), 'text', 'plain'
+        msg.add_attachment(content, maintype=maintype, subtype=subtype,
+                           filename=f"priloha{index}.{attachment['type']}")
+    return msg
+
+def sender_address(trace):
+    # Každý záznam má vlastního odesílatele, rate limit se tak neuplatní napříč záznamy
+    return f"{trace['id']}@replay.invalid"
+
+class _ProviderHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != '/api/generate':
+            self.send_error(404)
+            return
+        data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        trace = self.server.traces.get(str(data.get('model', ''))[len(MODEL_PREFIX):])
+        if trace is None:
+            self.send_error(404, 'Neznámý záznam')
+            return
+        delay = trace.get('stages', {}).get('ai', 0) / self.server.speed
+        text = synthetic_text(trace.get('response_chars', 0)) or '-'
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson' if data.get('stream') else 'application/json')
+        if not data.get('stream'):
+            time.sleep(delay)
+            body = json.dumps({'model': data['model'], 'response': text, 'done': True}).encode('utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        # Odpověď po částech rozložených do zaznamenané doby
+        self.end_headers()
+        parts = [text[i:i + 200] for i in range(0, len(text), 200)]
+        for part in parts:
+            time.sleep(delay / len(parts))
+            self.wfile.write(json.dumps({'response': part, 'done': False}).encode('utf-8') + b"\n")
+            self.wfile.flush()
+        self.wfile.write(json.dumps({'response': '', 'done': True}).encode('utf-8') + b"\n")
+
+    def log_message(self, format, *args):
+        logging.debug(f"Náhradní poskytovatel: {format % args}")
+
+def start_fake_provider(traces, speed):
+    """
+    Náhradní poskytovatel AI s rozhraním Ollama (/api/generate).
+
+    Odpovídá textem zaznamenané délky po zaznamenané době AI kroku
+    (vydělené rychlostí přehrávání). Při dělení vstupu na části
+    (map-reduce) se doba uplatní u každého volání zvlášť.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _ProviderHandler)
+    server.daemon_threads = True
+    server.traces = {trace['id']: trace for trace in traces}
+    server.speed = speed
+    threading.Thread(target=server.serve_forever, name='replay-provider', daemon=True).start()
+    return server
+
+class ReplayMailbox:
+    def __init__(self, traces, speed):
+        """
+        Náhrada EmailHandleru - odeslání odpovědi trvá zaznamenanou dobu
+        odesílání, čas dokončení se uloží pro výpočet latence. SMTP pool,
+        opakování odeslání ani načítání z IMAP se nepřehrává.
+        """
+        self.send_seconds = {
+            sender_address(trace): trace.get('stages', {}).get('send', 0) for trace in traces
+        }
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.sent = {}
+
+    def send_email(self, to_address, subject, body, attachment=None):
+        time.sleep(self.send_seconds.get(to_address, 0) / self.speed)
+        with self.lock:
+            self.sent.setdefault(to_address, time.monotonic())
+        return True
+
+def replay_config(config, traces, port):
+    """Konfigurace pro přehrávání - AI přes náhradního poskytovatele, bez cache a trvalých souborů"""
+    config = dict(config)
+    config['ollama'] = dict(config.get('ollama') or {}, enabled=True, host=f"http://127.0.0.1:{port}")
+    config['response_cache'] = {'enabled': False}
+    config['routing'] = {'enabled': False}
+    config['job_queue'] = {'enabled': False}
+    config['tracing'] = {'enabled': False}
+    config['rate_limiter'] = {'backend': 'memory', 'stats_file': None}
+    config['extraction'] = dict(config.get('extraction') or {}, cache={'enabled': False})
+    config['allowed_users'] = {
+        sender_address(trace): {
+            'email': sender_address(trace),
+            'rate_limit': {'max_requests': len(traces) + 1, 'time_window': 3600}
+        }
+        for trace in traces
+    }
+    return config
+
+def print_summary(traces, submitted, sent, elapsed):
+    latencies = [sent[address] - submitted[address] for address in submitted if address in sent]
+    recorded = [sum(trace.get('stages', {}).values()) for trace in traces
+                if trace.get('outcome') == 'processed']
+    print(f"Přehráno emailů: {len(submitted)}, odesláno odpovědí: {len(latencies)}")
+    print(f"Doba přehrávání: {elapsed:.2f} s, propustnost: {len(latencies) / elapsed if elapsed else 0:.2f} emailů/s")
+    if latencies:
+        print(f"Latence (s): průměr {statistics.mean(latencies):.3f}, p50 {percentile(latencies, 0.5):.3f}, "
+              f"p95 {percentile(latencies, 0.95):.3f}, max {max(latencies):.3f}")
+    if recorded:
+        print(f"Zaznamenaný součet stupňů (s): p50 {percentile(recorded, 0.5):.3f}, "
+              f"p95 {percentile(recorded, 0.95):.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='TaskMailer AI - přehrání záznamů průběhu jako zátěžový test')
+    parser.add_argument('traces', help='Soubor se záznamy (tracing.path)')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Rychlost přehrávání - 2 = dvakrát rychleji (rozestupy emailů i doby AI a odesílání)')
+    parser.add_argument('--limit', type=int, help='Přehrát jen prvních N záznamů')
+    parser.add_argument('--sequential', action='store_true',
+                        help='Zpracovat emaily postupně přes process_email místo paralelní pipeline')
+    parser.add_argument('--config', default='./config/config.yaml', help='Konfigurace aplikace')
+    parser.add_argument('--tasks', default='./config/tasks.yaml', help='Definice úkolů')
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error('--speed musí být kladné číslo')
+
+    tasks = load_tasks(args.tasks)
+    traces = []
+    for trace in load_traces(args.traces):
+        if tasks.get(trace['task']) is None:
+            logging.warning(f"Úkol {trace['task']} záznamu {trace['id']} není v {args.tasks}, přeskakuji")
+            continue
+        traces.append(trace)
+    traces = traces[:args.limit] if args.limit else traces
+    if not traces:
+        print("Žádné záznamy k přehrání.")
+        return
+
+    provider = start_fake_provider(traces, args.speed)
+    config = replay_config(load_config(args.config), traces, provider.server_address[1])
+    renderer = configure_renderer(config)
+    extractor = configure_extractor(config)
+    mailbox = ReplayMailbox(traces, args.speed)
+    ai_agent = AIAgent(config)
+    rate_limiter = create_rate_limiter(config)
+    pipeline = None if args.sequential else build_pipeline(mailbox, ai_agent, config)
+    submitted = {}
+
+    try:
+        if pipeline:
+            pipeline.start()
+        first = traces[0]['received']
+        start = time.monotonic()
+        for trace in traces:
+            msg = build_message(trace, tasks.get(trace['task']))
+            # Emaily přicházejí ve stejných rozestupech jako při záznamu
+            delay = start + (trace['received'] - first) / args.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            submitted[sender_address(trace)] = time.monotonic()
+            if pipeline:
+                job = prepare_email(msg, mailbox, config, tasks, rate_limiter)
+                if job:
+                    pipeline.submit(job)
+            else:
+                process_email(msg, mailbox, ai_agent, config, tasks, rate_limiter)
+        if pipeline:
+            pipeline.stop()
+        print_summary(traces, submitted, mailbox.sent, time.monotonic() - start)
+    except KeyboardInterrupt:
+        logging.info("Přehrávání přerušeno")
+        if pipeline:
+            pipeline.stop(wait=False)
+    finally:
+        rate_limiter.close()
+        renderer.close()
+        extractor.close()
+        provider.shutdown()
+
+if __name__ == "__main__":
+    main()
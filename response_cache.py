@@ -0,0 +1,136 @@
+# response_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+
+class ResponseCache:
+    def __init__(self, max_entries=500, ttl=86400, disk_path=None, disk_max_mb=200):
+        """
+        Cache odpovědí AI se dvěma úrovněmi - LRU v paměti a SQLite na disku.
+
+        Args:
+            max_entries (int): Maximální počet odpovědí v paměti
+            ttl (int): Platnost odpovědi v sekundách
+            disk_path (str, optional): Soubor diskové cache, None = jen paměť
+            disk_max_mb (int): Maximální velikost odpovědí na disku (MB)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_max_bytes = disk_max_mb * 1024 * 1024
+        self.memory = OrderedDict()  # klíč -> (čas uložení, odpověď)
+        self.lock = Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self.logger = logging.getLogger(__name__)
+
+        self.db = None
+        if disk_path:
+            directory = os.path.dirname(disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.db = sqlite3.connect(disk_path, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, response TEXT, created REAL, accessed REAL, size INTEGER)'
+            )
+            self.db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+            self.db.commit()
+
+    @staticmethod
+    def make_key(api, model, temperature, prompt):
+        """Klíč z poskytovatele, modelu, teploty a hashe normalizovaného promptu"""
+        normalized = re.sub(r'\s+', ' ', prompt).strip()
+        prompt_hash = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        return hashlib.sha256(
+            json.dumps([api, model, temperature, prompt_hash]).encode('utf-8')
+        ).hexdigest()
+
+    def get(self, key):
+        """Vrátí uloženou odpověď nebo None"""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry:
+                created, response = entry
+                if now - created < self.ttl:
+                    self.memory.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    return response
+                del self.memory[key]
+
+            if self.db:
+                row = self.db.execute(
+                    'SELECT response, created FROM responses WHERE key = ?', (key,)
+                ).fetchone()
+                if row and now - row[1] < self.ttl:
+                    self.db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+                    self.db.commit()
+                    self._remember(key, row[1], row[0])
+                    self.counters['disk_hits'] += 1
+                    return row[0]
+                if row:
+                    self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    self.db.commit()
+
+            self.counters['misses'] += 1
+            return None
+
+    def set(self, key, response):
+        """Uloží odpověď do paměti i na disk"""
+        now = time.time()
+        with self.lock:
+            self._remember(key, now, response)
+            if self.db:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO responses (key, response, created, accessed, size) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, response, now, now, len(response.encode('utf-8')))
+                )
+                self._evict_disk(now)
+                self.db.commit()
+
+    def stats(self):
+        """Vrátí kopii počítadel zásahů a výpadků cache"""
+        with self.lock:
+            return dict(self.counters)
+
+    def _remember(self, key, created, response):
+        self.memory[key] = (created, response)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def _evict_disk(self, now):
+        """Smaže expirované odpovědi a nejdéle nepoužité nad limit velikosti"""
+        self.db.execute('DELETE FROM responses WHERE created < ?', (now - self.ttl,))
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        for key, size in self.db.execute(
+            'SELECT key, size FROM responses ORDER BY accessed'
+        ).fetchall():
+            if total <= self.disk_max_bytes:
+                break
+            self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            self.counters['evictions'] += 1
+
+def create_response_cache(config):
+    """Vytvoří cache podle sekce response_cache konfigurace, nebo None pokud je vypnutá"""
+    cache_config = config.get('response_cache', {})
+    if not cache_config.get('enabled', False):
+        return None
+    return ResponseCache(
+        max_entries=cache_config.get('max_entries', 500),
+        ttl=cache_config.get('ttl', 86400),
+        disk_path=cache_config.get('disk_path', 'response_cache.sqlite'),
+        disk_max_mb=cache_config.get('disk_max_mb', 200)
+    )
@@ -0,0 +1,113 @@
+# task_registry.py
+
+import re
+import logging
+from types import MappingProxyType
+
+# Subject emailu: "Nazev", "Nazev (api)" nebo "Nazev (api:model)", volitelně s RE:/FW:
+SUBJECT_PATTERN = re.compile(r'^((?:RE:|FW:)\s*)?(\w*)(\s*\((\w*)(:(.*))?\))?$', re.IGNORECASE)
+
+# Název úkolu musí jít zapsat do subjectu (viz SUBJECT_PATTERN)
+TASK_NAME_PATTERN = re.compile(r'^\w+$')
+
+OUTPUT_FORMATS = ('text', 'pdf')
+
+# immediate = odpověď hned, batch = levnější dávkové zpracování s odpovědí později
+DELIVERY_MODES = ('immediate', 'batch')
+
+def parse_subject(subject):
+    """
+    Rozloží subject na název úkolu, API a model.
+
+    Returns:
+        tuple: (název úkolu, api nebo None, model nebo None)
+    """
+    match = SUBJECT_PATTERN.match(subject)
+    logging.debug(f"Parsuji subject: {subject}")
+    if match:
+        task_name = match.group(2).strip()
+        api = match.group(4).strip() if match.group(4) else None
+        model = match.group(6).strip() if match.group(6) else None
+        logging.debug(f"Identifikován úkol: {task_name}, API: {api}, Model: {model}")
+        return task_name, api, model
+    logging.debug(f"Nebyl nalezen žádný úkol v subjectu: {subject}")
+    return subject, None, None
+
+def _validate(task, number):
+    if not isinstance(task, dict):
+        raise ValueError(f"Úkol č. {number} není slovník")
+    subject = task.get('subject')
+    if not isinstance(subject, str) or not TASK_NAME_PATTERN.match(subject):
+        raise ValueError(f"Úkol č. {number}: subject '{subject}' musí být jedno slovo (písmena, číslice, _)")
+    if not isinstance(task.get('base_prompt'), str) or not task['base_prompt'].strip():
+        raise ValueError(f"Úkol {subject}: chybí base_prompt")
+    if task.get('output_format') not in OUTPUT_FORMATS:
+        raise ValueError(f"Úkol {subject}: output_format musí být jedno z {', '.join(OUTPUT_FORMATS)}")
+    if task.get('delivery', 'immediate') not in DELIVERY_MODES:
+        raise ValueError(f"Úkol {subject}: delivery musí být jedno z {', '.join(DELIVERY_MODES)}")
+    for key in ('map_prompt', 'reduce_prompt'):
+        if task.get(key) is not None and not isinstance(task[key], str):
+            raise ValueError(f"Úkol {subject}: {key} musí být text")
+    aliases = task.get('aliases') or []
+    if not isinstance(aliases, list) or not all(
+            isinstance(alias, str) and TASK_NAME_PATTERN.match(alias) for alias in aliases):
+        raise ValueError(f"Úkol {subject}: aliases musí být seznam jednoslovných názvů")
+
+class TaskRegistry:
+    def __init__(self, tasks):
+        """
+        Neměnná sada úkolů z tasks.yaml s indexem podle názvu a aliasů.
+
+        Definice úkolů jsou jen pro čtení a sdílí je všechna vlákna,
+        každý požadavek dostane vlastní kopii s doplněným api a modelem
+        (get, resolve). Názvy se porovnávají bez ohledu na velikost písmen.
+
+        Args:
+            tasks (list): Úkoly načtené z tasks.yaml
+
+        Raises:
+            ValueError: Neplatná definice úkolu nebo duplicitní název
+        """
+        if not isinstance(tasks, list) or not tasks:
+            raise ValueError("Úkoly musí být neprázdný seznam")
+        index = {}
+        frozen = []
+        for number, task in enumerate(tasks, 1):
+            _validate(task, number)
+            task = dict(task, aliases=tuple(task.get('aliases') or ()))
+            task.pop('api', None)
+            task.pop('model', None)
+            task = MappingProxyType(task)
+            for name in (task['subject'],) + task['aliases']:
+                key = name.casefold()
+                if key in index:
+                    raise ValueError(f"Název úkolu {name} je použit vícekrát")
+                index[key] = task
+            frozen.append(task)
+        self.tasks = tuple(frozen)
+        self.index = MappingProxyType(index)
+
+    def __iter__(self):
+        return iter(self.tasks)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def get(self, name, api=None, model=None):
+        """
+        Úkol podle názvu nebo aliasu.
+
+        Returns:
+            dict: Nová kopie úkolu s 'api' a 'model', nebo None
+        """
+        task = self.index.get(name.casefold())
+        if task is None:
+            return None
+        task = dict(task, api=api, model=model)
+        task['aliases'] = list(task['aliases'])
+        return task
+
+    def resolve(self, subject):
+        """Úkol podle subjectu emailu (viz parse_subject), nebo None"""
+        task_name, api, model = parse_subject(subject)
+        return self.get(task_name, api, model)
@@ -0,0 +1,167 @@
+# test_batch_queue.py
+
+import json
+import time
+import pytest
+from batch_queue import BatchQueue, GroupedBatchClient, OpenAIBatchClient
+
+class FakeClient:
+    def __init__(self):
+        self.batches = {}
+        self.results = {}
+
+    def submit(self, requests):
+        batch_id = f"batch-{len(self.batches)}"
+        self.batches[batch_id] = requests
+        return batch_id
+
+    def poll(self, batch_id):
+        return self.results.get(batch_id)
+
+    def answer(self, batch_id, skip=()):
+        self.results[batch_id] = {custom_id: f"odpověď na {prompt}"
+                                  for custom_id, _, prompt in self.batches[batch_id] if prompt not in skip}
+
+def make_job(prompt, job_id=None):
+    job = {'task': {'api': 'openai', 'model': None}, 'prompt': prompt, 'body': 'tělo', 'sender': 'a@example.com'}
+    if job_id is not None:
+        job['job_id'] = job_id
+    return job
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+@pytest.fixture
+def make_queue(client, tmp_path):
+    queues = []
+
+    def make_queue(**kwargs):
+        queue = BatchQueue({'openai': client}, lambda api: 'gpt-4o-mini',
+                           path=str(tmp_path / 'batch.sqlite'), **kwargs)
+        queues.append(queue)
+        return queue
+    yield make_queue
+    for queue in queues:
+        try:
+            queue.close()
+        except Exception:
+            pass
+
+def test_group_is_sent_when_full_or_old(client, make_queue):
+    queue = make_queue(max_batch_size=2, max_wait=3600)
+    queue.add(make_job('a'))
+    queue.flush()
+    assert client.batches == {}
+    queue.add(make_job('b'))
+    queue.add(make_job('c'))
+    queue.flush()
+    assert [prompt for _, model, prompt in client.batches['batch-0']] == ['a', 'b']
+    assert client.batches['batch-0'][0][1] == 'gpt-4o-mini'
+    assert queue.stats() == {'waiting': 1, 'submitted': 2, 'undelivered': 0}
+    queue.max_wait = 0
+    queue.flush()
+    assert [prompt for _, _, prompt in client.batches['batch-1']] == ['c']
+
+def test_replies_are_delivered_without_transient_fields(client, make_queue):
+    queue = make_queue()
+    delivered = []
+    queue.deliver = delivered.append
+    queue.add(make_job('a'))
+    queue.flush(force=True)
+    queue.poll()
+    assert delivered == []
+    client.answer('batch-0')
+    queue.poll()
+    [job] = delivered
+    assert job['ai_response'] == 'odpověď na a'
+    assert 'body' not in job and 'prompt' not in job
+    assert queue.stats() == {'waiting': 0, 'submitted': 0, 'undelivered': 0}
+
+def test_missing_reply_is_retried_then_failed(client, make_queue):
+    queue = make_queue(max_attempts=2)
+    failed = []
+    queue.deliver = lambda job: None
+    queue.fail = lambda job, error: failed.append(job['task'])
+    queue.add(make_job('a'))
+    queue.flush(force=True)
+    client.answer('batch-0', skip=['a'])
+    queue.poll()
+    assert queue.stats()['waiting'] == 1
+    queue.flush(force=True)
+    client.answer('batch-1', skip=['a'])
+    queue.poll()
+    assert len(failed) == 1
+    assert queue.stats() == {'waiting': 0, 'submitted': 0, 'undelivered': 0}
+
+def test_failed_delivery_keeps_reply_across_restart(client, make_queue):
+    queue = make_queue()
+
+    def broken(job):
+        raise OSError('SMTP nedostupné')
+    queue.deliver = broken
+    queue.add(make_job('a'))
+    queue.flush(force=True)
+    client.answer('batch-0')
+    queue.poll()
+    assert queue.stats()['undelivered'] == 1
+    # Dávka se znovu nedotazuje, odpověď je uložená
+    client.results.clear()
+    queue.close()
+
+    queue = make_queue()
+    delivered = []
+    queue.deliver = delivered.append
+    queue.poll()
+    assert delivered == []
+    queue.redeliver()
+    assert [job['ai_response'] for job in delivered] == ['odpověď na a']
+    assert queue.stats()['undelivered'] == 0
+
+def test_persistent_job_is_added_once(client, make_queue):
+    queue = make_queue()
+    queue.add(make_job('a', job_id=7))
+    queue.add(make_job('a', job_id=7))
+    assert queue.stats()['waiting'] == 1
+
+def test_grouped_client_runs_requests_in_background():
+    client = GroupedBatchClient(lambda model, prompt: None if prompt == 'b' else prompt.upper(), workers=2)
+    batch_id = client.submit([('1', 'm', 'a'), ('2', 'm', 'b')])
+    deadline = time.monotonic() + 2
+    results = None
+    while results is None and time.monotonic() < deadline:
+        results = client.poll(batch_id)
+        time.sleep(0.01)
+    assert results == {'1': 'A'}
+    # Neznámá skupina (před restartem) se zopakuje
+    assert client.poll('group-unknown') == {}
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+    @property
+    def text(self):
+        return self.data
+
+def test_openai_client_parses_results(monkeypatch):
+    client = OpenAIBatchClient('http://localhost:1/v1', 'k')
+    lines = [
+        {'custom_id': '1', 'response': {'status_code': 200,
+                                        'body': {'choices': [{'message': {'content': 'odpověď'}}]}}},
+        {'custom_id': '2', 'response': {'status_code': 500}, 'error': 'chyba'},
+    ]
+    responses = {
+        '/batches/b1': {'status': 'completed', 'output_file_id': 'f1'},
+        '/files/f1/content': "\n".join(json.dumps(line) for line in lines) + "\n",
+    }
+    monkeypatch.setattr(client, '_request', lambda method, path, **kwargs: FakeResponse(responses[path]))
+    assert client.poll('b1') == {'1': 'odpověď'}
+    responses['/batches/b1'] = {'status': 'in_progress'}
+    assert client.poll('b1') is None
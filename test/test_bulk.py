@@ -0,0 +1,81 @@
+# test_bulk.py
+
+import json
+import pytest
+from bulk import BulkRunner, find_inputs, output_path
+
+TASK = {'api': 'ollama', 'model': None, 'base_prompt': 'Shrň', 'output_format': 'text'}
+
+class FakeAgent:
+    def __init__(self, fail=()):
+        self.prompts = []
+        self.fail = fail
+
+    def complete(self, api, model, prompt, use_cache=True):
+        self.prompts.append(prompt)
+        if any(text in prompt for text in self.fail):
+            return None
+        return prompt.upper()
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+
+def test_directory_inputs_skip_output_dir_and_unsupported(tmp_path):
+    write(tmp_path / 'in' / 'a.txt', 'a')
+    write(tmp_path / 'in' / 'sub' / 'b.md', 'b')
+    write(tmp_path / 'in' / 'obrazek.png', 'x')
+    write(tmp_path / 'in' / 'out' / 'a.txt.txt', 'výsledek')
+    items = find_inputs(str(tmp_path / 'in'), output_dir=str(tmp_path / 'in' / 'out'))
+    assert [item['id'] for item in items] == ['a.txt', 'sub/b.md']
+
+def test_jsonl_and_glob_inputs(tmp_path):
+    write(tmp_path / 'doc.txt', 'soubor')
+    lines = [json.dumps({'id': 'x', 'text': 'text'}), 'neplatný', json.dumps({'file': 'doc.txt'})]
+    write(tmp_path / 'inputs.jsonl', "\n".join(lines))
+    items = find_inputs(str(tmp_path / 'inputs.jsonl'))
+    assert items == [{'id': '3', 'path': str(tmp_path / 'doc.txt')}, {'id': 'x', 'text': 'text'}]
+    write(tmp_path / 'd' / 'e.txt', 'e')
+    assert [item['id'] for item in find_inputs(str(tmp_path / '**' / '*.txt'))] == ['d/e.txt', 'doc.txt']
+
+def test_duplicate_ids_and_colliding_outputs_are_rejected(tmp_path):
+    write(tmp_path / 'inputs.jsonl', "\n".join(json.dumps({'id': i, 'text': 't'}) for i in ['a', 'a']))
+    with pytest.raises(ValueError):
+        find_inputs(str(tmp_path / 'inputs.jsonl'))
+    write(tmp_path / 'other.jsonl', "\n".join(json.dumps({'id': i, 'text': 't'}) for i in ['a b', 'a?b']))
+    assert len(find_inputs(str(tmp_path / 'other.jsonl'))) == 2
+    with pytest.raises(ValueError):
+        find_inputs(str(tmp_path / 'other.jsonl'), output_dir=str(tmp_path / 'out'))
+
+def test_output_path_stays_inside_output_dir(tmp_path):
+    out = str(tmp_path / 'out')
+    assert output_path(out, '../../etc/passwd', 'text') == str(tmp_path / 'out' / 'etc' / 'passwd.txt')
+    assert output_path(out, 'a/b.pdf', 'pdf') == str(tmp_path / 'out' / 'a' / 'b.pdf.pdf')
+
+def test_runner_writes_outputs_and_resumes(tmp_path):
+    write(tmp_path / 'in' / 'a.txt', 'prvni')
+    write(tmp_path / 'in' / 'b.txt', 'druhy')
+    out = str(tmp_path / 'out')
+    items = find_inputs(str(tmp_path / 'in'), output_dir=out)
+    agent = FakeAgent(fail=['druhy'])
+    summary = BulkRunner(TASK, {}, agent, output_dir=out, workers=2).run(items)
+    assert (summary['ok'], summary['failed'], summary['skipped']) == (1, 1, 0)
+    assert (tmp_path / 'out' / 'a.txt.txt').read_text(encoding='utf-8') == 'SHRŇ\nPRVNI'
+    assert not (tmp_path / 'out' / 'b.txt.txt').exists()
+
+    agent = FakeAgent()
+    summary = BulkRunner(TASK, {}, agent, output_dir=out).run(items)
+    assert (summary['ok'], summary['failed'], summary['skipped']) == (1, 0, 1)
+    assert agent.prompts == ['Shrň\ndruhy']
+
+def test_jsonl_output_resumes_failed_inputs(tmp_path):
+    items = [{'id': 'a', 'text': 'prvni'}, {'id': 'b', 'text': 'druhy'}]
+    output = str(tmp_path / 'results.jsonl')
+    BulkRunner(TASK, {}, FakeAgent(fail=['druhy']), output_jsonl=output).run(items)
+    agent = FakeAgent()
+    summary = BulkRunner(TASK, {}, agent, output_jsonl=output).run(items)
+    assert summary['skipped'] == 1 and agent.prompts == ['Shrň\ndruhy']
+    with open(output, encoding='utf-8') as file:
+        records = [json.loads(line) for line in file]
+    assert [(record['id'], record['status']) for record in records] == [('a', 'ok'), ('b', 'failed'), ('b', 'ok')]
+    assert records[-1]['output'] == 'SHRŇ\nDRUHY'
@@ -0,0 +1,88 @@
+# test_chunker.py
+
+import asyncio
+import threading
+import pytest
+import chunker
+from chunker import PARTIAL_SEPARATOR, estimate_tokens, map_reduce, map_reduce_async, split_text
+
+@pytest.fixture(autouse=True)
+def approximate_tokens(monkeypatch):
+    # Odhad ~4 znaky na token, aby výsledky nezávisely na tiktoken
+    monkeypatch.setattr(chunker, '_ENCODING', None)
+
+SETTINGS = {'max_prompt_tokens': 100, 'chunk_tokens': 50, 'workers': 2}
+
+def test_short_text_is_one_chunk():
+    assert split_text('krátký text', 50) == ['krátký text']
+    assert split_text('  \n ', 50) == []
+
+def test_split_prefers_pages_and_paragraphs():
+    pages = ['a' * 120, 'b' * 120, 'c' * 120]
+    assert split_text('\f'.join(pages), 50) == pages
+    paragraphs = ['x' * 80, 'y' * 80, 'z' * 80]
+    # Dva odstavce se vejdou do jedné části, třetí už ne
+    assert split_text('\n\n'.join(paragraphs), 50) == ['\n\n'.join(paragraphs[:2]), paragraphs[2]]
+
+def test_split_falls_back_to_sentences_and_length():
+    sentences = ' '.join(['Věta číslo jedna je docela dlouhá.'] * 20)
+    chunks = split_text(sentences, 20)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 20 for chunk in chunks)
+    assert all(chunk.endswith('.') for chunk in chunks)
+    chunks = split_text('x' * 1000, 20)
+    assert ''.join(chunks) == 'x' * 1000
+    assert all(estimate_tokens(chunk) <= 20 for chunk in chunks)
+
+def test_short_input_is_one_call():
+    prompts = []
+    result = map_reduce(lambda prompt: prompts.append(prompt) or 'ok', {'base_prompt': 'Shrň'}, 'text', SETTINGS)
+    assert result == 'ok' and prompts == ['Shrň\ntext']
+
+def test_map_reduce_combines_partial_results():
+    lock = threading.Lock()
+    prompts = []
+
+    def complete(prompt):
+        with lock:
+            prompts.append(prompt)
+        if prompt.startswith('MAP'):
+            return prompt[-3:]
+        return 'souhrn'
+    task = {'base_prompt': 'Shrň', 'map_prompt': 'MAP', 'reduce_prompt': 'REDUCE'}
+    content = '\f'.join(['a' * 150 + '001', 'b' * 150 + '002', 'c' * 150 + '003'])
+    assert map_reduce(complete, task, content, SETTINGS) == 'souhrn'
+    assert len(prompts) == 4
+    assert prompts[-1] == 'REDUCE\n' + PARTIAL_SEPARATOR.join(['001', '002', '003'])
+
+def test_reduce_runs_in_rounds_when_partials_do_not_fit():
+    reduce_calls = []
+
+    def complete(prompt):
+        if prompt.startswith('MAP'):
+            return 'p' * 120
+        reduce_calls.append(prompt)
+        return 'r' * 120 if len(reduce_calls) < 3 else 'hotovo'
+    task = {'base_prompt': 'Shrň', 'map_prompt': 'MAP', 'reduce_prompt': 'REDUCE'}
+    content = '\f'.join(['a' * 150] * 4)
+    assert map_reduce(complete, task, content, SETTINGS) == 'hotovo'
+    # Čtyři výsledky po dvou, pak spojení dvou mezivýsledků
+    assert len(reduce_calls) == 3
+
+def test_failed_part_fails_whole_input():
+    content = '\f'.join(['a' * 150, 'b' * 150])
+    complete = lambda prompt: None if 'b' * 150 in prompt else 'ok'
+    assert map_reduce(complete, {'base_prompt': 'Shrň'}, content, SETTINGS) is None
+
+def test_async_map_reduce_limits_concurrency():
+    running = [0, 0]
+
+    async def acomplete(prompt):
+        running[0] += 1
+        running[1] = max(running)
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return 'ok'
+    content = '\f'.join(['a' * 150] * 5)
+    assert asyncio.run(map_reduce_async(acomplete, {'base_prompt': 'Shrň'}, content, SETTINGS)) == 'ok'
+    assert running[1] == SETTINGS['workers']
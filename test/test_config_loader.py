@@ -0,0 +1,72 @@
+# test_config_loader.py
+
+import os
+import yaml
+from config_loader import ConfigWatcher, read_config, read_tasks
+
+CONFIG = {
+    'allowed_users': [{'email': 'a@example.com'}],
+    'imap': {'server': 'imap.example.com'},
+    'app_settings': {'max_attachments': 5, 'check_interval': 60, 'async_mode': False,
+                     'pipeline': {'ai_workers': 4}},
+}
+TASKS = [{'subject': 'Shrnuti', 'base_prompt': 'Shrň', 'output_format': 'text'}]
+
+def write(path, data):
+    # Změna se pozná podle mtime a velikosti, posun mtime zaručí změnu i při stejné velikosti
+    mtime = os.stat(path).st_mtime_ns + 10 ** 9 if os.path.exists(path) else None
+    with open(path, 'w', encoding='utf-8') as file:
+        yaml.safe_dump(data, file, allow_unicode=True)
+    if mtime:
+        os.utime(path, ns=(mtime, mtime))
+
+def make_watcher(tmp_path):
+    config_file, tasks_file = str(tmp_path / 'config.yaml'), str(tmp_path / 'tasks.yaml')
+    write(config_file, CONFIG)
+    write(tasks_file, TASKS)
+    watcher = ConfigWatcher(read_config(config_file), read_tasks(tasks_file), config_file, tasks_file, interval=0)
+    return watcher, config_file, tasks_file
+
+def test_unchanged_files_are_not_reloaded(tmp_path):
+    watcher, _, _ = make_watcher(tmp_path)
+    current = watcher.current
+    assert not watcher.check()
+    assert watcher.current is current
+
+def test_reloadable_settings_apply_and_others_wait_for_restart(tmp_path, caplog):
+    watcher, config_file, _ = make_watcher(tmp_path)
+    old_config, tasks = watcher.current
+    changed = dict(CONFIG, allowed_users=[{'email': 'b@example.com'}], imap={'server': 'jiny.example.com'},
+                   app_settings={'max_attachments': 2, 'chunking': {'chunk_tokens': 100},
+                                 'async_mode': True, 'pipeline': {'ai_workers': 8}})
+    write(config_file, changed)
+    assert watcher.check()
+    config, new_tasks = watcher.current
+    assert list(config['allowed_users']) == ['b@example.com']
+    assert config['imap'] == {'server': 'imap.example.com'}
+    assert config['app_settings'] == {'max_attachments': 2, 'chunking': {'chunk_tokens': 100},
+                                      'async_mode': False, 'pipeline': {'ai_workers': 4}}
+    assert new_tasks is tasks
+    # Rozpracované emaily drží předchozí verzi
+    assert list(old_config['allowed_users']) == ['a@example.com']
+    assert old_config['app_settings']['max_attachments'] == 5
+    assert 'Změna sekce imap' in caplog.text
+    assert 'Změna app_settings.async_mode' in caplog.text
+    assert 'Změna app_settings.pipeline' in caplog.text
+    assert 'check_interval' not in caplog.text
+
+def test_invalid_file_keeps_previous_version(tmp_path):
+    watcher, config_file, tasks_file = make_watcher(tmp_path)
+    current = watcher.current
+    write(tasks_file, [{'subject': 'dvě slova', 'base_prompt': 'x', 'output_format': 'text'}])
+    assert not watcher.check()
+    write(config_file, dict(CONFIG, allowed_users=[{'name': 'bez emailu'}]))
+    assert not watcher.check()
+    assert watcher.current is current
+
+def test_tasks_are_reloaded(tmp_path):
+    watcher, _, tasks_file = make_watcher(tmp_path)
+    write(tasks_file, TASKS + [{'subject': 'Preklad', 'base_prompt': 'Přelož', 'output_format': 'pdf'}])
+    assert watcher.check()
+    _, tasks = watcher.current
+    assert tasks.resolve('Preklad')['output_format'] == 'pdf'
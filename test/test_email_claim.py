@@ -0,0 +1,130 @@
+# test_email_claim.py
+#
+# Zabírání zpráv více instancemi nad jednou schránkou (EmailHandler._claim)
+
+import imaplib
+import pytest
+from email_handler import EmailHandler
+
+class Mailbox:
+    """Příznaky zpráv sdílené instancemi"""
+    def __init__(self, uids):
+        self.flags = {uid: set() for uid in uids}
+
+class FakeIMAP:
+    """Odpovídá na UID FETCH (FLAGS) a UID STORE ve tvaru, v jakém je vrací imaplib"""
+    def __init__(self, mailbox, permanent_flags=b'(\\Answered \\Seen \\Deleted \\*)'):
+        self.mailbox = mailbox
+        self.untagged_responses = {'PERMANENTFLAGS': [permanent_flags]} if permanent_flags else {}
+
+    def response(self, code):
+        return code, self.untagged_responses.pop(code, [None])
+
+    def uid(self, command, uids, *args):
+        uids = [int(uid) for uid in uids.split(',')]
+        if command == 'FETCH':
+            return 'OK', [f"{number} (UID {uid} FLAGS ({' '.join(sorted(self.mailbox.flags[uid]))}))".encode()
+                          for number, uid in enumerate(uids, 1)]
+        operation, flags = args
+        flags = set(flags.strip('()').split())
+        for uid in uids:
+            if operation.startswith('+'):
+                self.mailbox.flags[uid] |= flags
+            else:
+                self.mailbox.flags[uid] -= flags
+        return 'OK', [None]
+
+def make_handler(instance, mailbox):
+    handler = EmailHandler({'email': {
+        'imap_server': 'imap.example.com', 'smtp_server': 'smtp.example.com',
+        'email_address': 'tasks@example.com', 'password': 'secret',
+        'claim': {'enabled': True, 'instance': instance},
+    }})
+    handler.imap = FakeIMAP(mailbox)
+    return handler
+
+def stale_view(handler):
+    """První čtení příznaků vrátí stav před zabráním jinou instancí (souběh)"""
+    fetch = handler._fetch_flags
+    calls = []
+
+    def fetch_flags(uids):
+        calls.append(uids)
+        return {uid: [] for uid in uids} if len(calls) == 1 else fetch(uids)
+    handler._fetch_flags = fetch_flags
+
+@pytest.fixture
+def mailbox():
+    return Mailbox([1, 2])
+
+def test_claimed_message_is_skipped_by_other_instance(mailbox):
+    alpha, beta = make_handler('alpha', mailbox), make_handler('beta', mailbox)
+    assert alpha._claim([1, 2]) == [1, 2]
+    assert beta._claim([1, 2]) == []
+    assert mailbox.flags[1] == {alpha._claim_keyword()}
+
+def test_seen_message_is_not_claimed(mailbox):
+    mailbox.flags[1].add('\\Seen')
+    assert make_handler('alpha', mailbox)._claim([1, 2]) == [2]
+
+def test_race_is_won_by_lowest_instance(mailbox):
+    alpha, beta = make_handler('alpha', mailbox), make_handler('beta', mailbox)
+    # Obě instance přečtou příznaky dřív, než druhá zapíše své zabrání
+    stale_view(alpha)
+    stale_view(beta)
+    mailbox.flags[1].add(beta._claim_keyword())
+    mailbox.flags[2].add(beta._claim_keyword())
+    # alpha vidí zabrání instance s vyšším názvem - ponechá své a počká na další cyklus
+    assert alpha._claim([1, 2]) == []
+    # beta vidí zabrání instance s nižším názvem a ustoupí
+    assert beta._claim([1, 2]) == []
+    assert mailbox.flags[1] == {alpha._claim_keyword()}
+    assert alpha._claim([1, 2]) == [1, 2]
+    assert beta._claim([1, 2]) == []
+
+def test_lower_instance_yields_to_earlier_claim(mailbox):
+    alpha, beta = make_handler('alpha', mailbox), make_handler('beta', mailbox)
+    stale_view(alpha)
+    # beta zprávu zabrala a ověřila dřív, než alpha zapsala své zabrání
+    assert beta._claim([1]) == [1]
+    assert alpha._claim([1]) == []
+    # Cizí zabrání zůstalo, alpha proto své odebere
+    assert alpha._claim([1]) == []
+    assert mailbox.flags[1] == {beta._claim_keyword()}
+
+@pytest.mark.parametrize('age', [2, 4, 100])
+def test_stale_claim_is_taken_over(mailbox, age):
+    alpha = make_handler('alpha', mailbox)
+    mailbox.flags[1].add(f'TaskMailer_beta_{alpha._claim_lease_number() - age}')
+    assert alpha._claim([1]) == [1]
+    assert mailbox.flags[1] == {alpha._claim_keyword()}
+
+def test_claim_from_previous_lease_is_valid(mailbox):
+    alpha = make_handler('alpha', mailbox)
+    mailbox.flags[1].add(f'TaskMailer_beta_{alpha._claim_lease_number() - 1}')
+    assert alpha._claim([1]) == []
+
+def test_claim_error_is_reported(mailbox, caplog):
+    alpha = make_handler('alpha', mailbox)
+    alpha.imap.status = lambda mailbox, items: ('OK', [b'INBOX (UIDVALIDITY 1)'])
+    uid = alpha.imap.uid
+
+    def failing_uid(command, *args):
+        if command == 'SEARCH':
+            return 'OK', [b'1 2']
+        if command == 'FETCH':
+            raise imaplib.IMAP4.abort('spojení přerušeno')
+        return uid(command, *args)
+    alpha.imap.uid = failing_uid
+    with pytest.raises(imaplib.IMAP4.abort):
+        list(alpha.fetch_unseen_emails())
+    assert 'Chyba při načítání emailů 1,2: spojení přerušeno' in caplog.text
+
+def test_keywords_allowed():
+    handler = make_handler('alpha', Mailbox([1]))
+    assert handler._keywords_allowed()
+    handler.imap = FakeIMAP(Mailbox([1]), b'(\\Answered \\Seen \\Deleted)')
+    assert not handler._keywords_allowed()
+    # Server bez PERMANENTFLAGS dovoluje měnit všechny příznaky
+    handler.imap = FakeIMAP(Mailbox([1]), None)
+    assert handler._keywords_allowed()
@@ -0,0 +1,97 @@
+# test_email_idle.py
+#
+# IMAP IDLE (EmailHandler.idle) proti lokálnímu serveru přes TLS
+
+import imaplib
+import logging
+import os
+import socket
+import ssl
+import threading
+import time
+import pytest
+from email_handler import EmailHandler
+
+# Certifikát a klíč pro localhost (self-signed, jen pro testy)
+CERTIFICATE = os.path.join(os.path.dirname(__file__), 'localhost.pem')
+
+def serve(listener, script):
+    """Jedno spojení - po přihlášení odpovídá na IDLE podle scénáře"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(CERTIFICATE)
+    connection, _ = listener.accept()
+    with context.wrap_socket(connection, server_side=True) as conn:
+        reader = conn.makefile('rb')
+        conn.sendall(b'* OK ready\r\n')
+        line = reader.readline()
+        # imaplib se po připojení ptá na CAPABILITY
+        conn.sendall(b'* CAPABILITY IMAP4rev1 IDLE\r\n' + line.split()[0] + b' OK done\r\n')
+        for mode in script:
+            line = reader.readline()
+            tag = line.split()[0]
+            if mode == 'close':
+                return
+            if mode == 'burst':
+                # Notifikace ve stejném TLS záznamu jako pokračování
+                conn.sendall(b'+ idling\r\n* 7 EXISTS\r\n')
+            elif mode == 'late':
+                conn.sendall(b'+ idling\r\n')
+                time.sleep(0.3)
+                conn.sendall(b'* 8 EXISTS\r\n')
+            else:
+                conn.sendall(b'+ idling\r\n')
+            assert reader.readline() == b'DONE\r\n'
+            conn.sendall(tag + b' OK IDLE terminated\r\n')
+        reader.readline()
+
+@pytest.fixture
+def connect():
+    threads = []
+
+    def connect(script):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        thread = threading.Thread(target=serve, args=(listener, script), daemon=True)
+        thread.start()
+        threads.append(thread)
+        context = ssl.create_default_context(cafile=CERTIFICATE)
+        handler = EmailHandler.__new__(EmailHandler)
+        handler.logger = logging.getLogger(__name__)
+        handler.imap = imaplib.IMAP4_SSL('127.0.0.1', listener.getsockname()[1], ssl_context=context)
+        return handler
+
+    yield connect
+    for thread in threads:
+        thread.join(timeout=5)
+
+def timed(func, *args):
+    start = time.monotonic()
+    return func(*args), time.monotonic() - start
+
+def test_idle_times_out_without_dropping_connection(connect):
+    handler = connect(['quiet', 'quiet'])
+    assert timed(handler.idle, 0.5)[0] is False
+    assert handler.imap is not None
+    assert handler.idle(0.2) is False
+    handler.imap.shutdown()
+
+def test_idle_returns_on_exists(connect):
+    handler = connect(['burst', 'late'])
+    new_mail, seconds = timed(handler.idle, 5)
+    assert new_mail and seconds < 1
+    new_mail, seconds = timed(handler.idle, 5)
+    assert new_mail and seconds < 2
+    handler.imap.shutdown()
+
+def test_exists_from_previous_command_skips_idle(connect):
+    handler = connect([])
+    handler.imap.untagged_responses['EXISTS'] = [b'3']
+    assert handler.idle(5) is True
+    handler.imap.shutdown()
+
+def test_connection_error_is_raised(connect):
+    handler = connect(['close'])
+    with pytest.raises(Exception):
+        handler.idle(5)
+    assert handler.imap is None
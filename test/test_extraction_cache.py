@@ -0,0 +1,65 @@
+# test_extraction_cache.py
+
+import attachment_processor
+from attachment_processor import AttachmentExtractor
+from extraction_cache import ExtractionCache
+
+def attachment(filename, content):
+    return {'filename': filename, 'content_type': 'text/plain', 'size': len(content), 'content': content}
+
+def make_extractor(tmp_path, monkeypatch, max_chars=1000):
+    calls = []
+    extract = attachment_processor.extract_attachment
+
+    def counting(attachment, *args):
+        calls.append(attachment['filename'])
+        return extract(attachment, *args)
+    monkeypatch.setattr(attachment_processor, 'extract_attachment', counting)
+    cache = ExtractionCache(str(tmp_path / 'extraction.sqlite'))
+    return AttachmentExtractor(workers=0, max_chars=max_chars, cache=cache), calls
+
+def test_key_depends_on_content_and_parameters():
+    key = ExtractionCache.make_key(b'obsah', 1, '.txt', 1000)
+    assert key == ExtractionCache.make_key(b'obsah', 1, '.txt', 1000)
+    assert key != ExtractionCache.make_key(b'obsah', 2, '.txt', 1000)
+    assert key != ExtractionCache.make_key(b'obsah', 1, '.pdf', 1000)
+    assert key != ExtractionCache.make_key(b'obsah', 1, '.txt', 500)
+    assert key != ExtractionCache.make_key(b'jiny obsah', 1, '.txt', 1000)
+
+def test_same_content_under_other_name_is_not_parsed_again(tmp_path, monkeypatch):
+    extractor, calls = make_extractor(tmp_path, monkeypatch)
+    [first] = extractor.extract_all([attachment('a.txt', b'text prilohy')])
+    [second] = extractor.extract_all([attachment('kopie.txt', b'text prilohy')])
+    assert calls == ['a.txt']
+    assert second == {'filename': 'kopie.txt', 'text': 'text prilohy', 'truncated': None}
+    assert first['text'] == second['text']
+    assert extractor.cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0}
+    extractor.close()
+
+def test_truncated_by_size_is_cached_but_errors_are_not(tmp_path, monkeypatch):
+    extractor, calls = make_extractor(tmp_path, monkeypatch, max_chars=4)
+    extractor.extract_all([attachment('a.txt', b'dlouhy text')])
+    [result] = extractor.extract_all([attachment('a.txt', b'dlouhy text')])
+    assert result['text'] == 'dlou' and result['truncated'] == 'size'
+    assert calls == ['a.txt']
+
+    def failing(attachment, *args):
+        calls.append(attachment['filename'])
+        return {'filename': attachment['filename'], 'text': '', 'truncated': 'time'}
+    monkeypatch.setattr(attachment_processor, 'extract_attachment', failing)
+    extractor.extract_all([attachment('b.txt', b'jiny text')])
+    extractor.extract_all([attachment('b.txt', b'jiny text')])
+    assert calls == ['a.txt', 'b.txt', 'b.txt']
+    extractor.close()
+
+def test_cache_survives_restart_and_keeps_size_limit(tmp_path):
+    path = str(tmp_path / 'extraction.sqlite')
+    cache = ExtractionCache(path)
+    cache.set('a', 'text', 'size')
+    cache.close()
+    cache = ExtractionCache(path, max_mb=0)
+    assert cache.get('a') == ('text', 'size')
+    cache.set('b', 'jiny text')
+    assert cache.get('a') is None
+    assert cache.stats()['evictions'] == 2
+    cache.close()
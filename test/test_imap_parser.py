@@ -0,0 +1,79 @@
+# test_imap_parser.py
+#
+# Odpovědi ve tvaru, v jakém je vrací imaplib (řádky a dvojice s literály)
+
+from imap_parser import parse_fetch_response, find_section, flatten_bodystructure
+
+# Dovecot - multipart/mixed s alternativním textem a PDF přílohou (RFC 2231)
+DOVECOT_RESPONSE = [
+    (b'1 (UID 4821 RFC822.SIZE 8731 BODYSTRUCTURE ((("text" "plain" ("charset" "utf-8") NIL NIL '
+     b'"quoted-printable" 120 5 NIL NIL NIL NIL)("text" "html" ("charset" "utf-8") NIL NIL "base64" 400 6 '
+     b'NIL NIL NIL NIL) "alternative" ("boundary" "b2") NIL NIL NIL)("application" "pdf" ("name" "report.pdf") '
+     b'NIL NIL "base64" 5000 NIL ("attachment" ("filename*" "utf-8\'\'zpr%C3%A1va.pdf")) NIL NIL) "mixed" '
+     b'("boundary" "b1") NIL NIL NIL) BODY[HEADER.FIELDS (FROM SUBJECT)] {58}',
+     b'From: Jan Novak <jan@example.com>\r\nSubject: Shrnuti\r\n\r\n'),
+    b')',
+]
+
+# Gmail - jednoduchá zpráva, velká písmena, dvě zprávy v jedné odpovědi
+GMAIL_RESPONSE = [
+    (b'3 (UID 17 RFC822.SIZE 512 BODYSTRUCTURE ("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL "7BIT" 12 1 NIL NIL '
+     b'NIL) BODY[HEADER.FIELDS (FROM SUBJECT)] {20}', b'Subject: Preklad\r\n\r\n'),
+    b')',
+    (b'4 (UID 18 RFC822.SIZE 2048 BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL "7BIT" 10 1 NIL NIL '
+     b'NIL)("APPLICATION" "VND.OPENXMLFORMATS-OFFICEDOCUMENT.WORDPROCESSINGML.DOCUMENT" '
+     b'("NAME" "=?UTF-8?B?xb5hZG9zdC5kb2N4?=") NIL NIL "BASE64" 1500 NIL ("ATTACHMENT" '
+     b'("FILENAME" "=?UTF-8?B?xb5hZG9zdC5kb2N4?=")) NIL) "MIXED" ("BOUNDARY" "000") NIL NIL) '
+     b'BODY[HEADER.FIELDS (FROM SUBJECT)] {20}', b'Subject: Shrnuti\r\n\r\n'),
+    b')',
+]
+
+# Název souboru poslaný jako literál uprostřed BODYSTRUCTURE
+LITERAL_RESPONSE = [
+    (b'1 (UID 9 BODYSTRUCTURE ("application" "pdf" ("name" {11}', b'faktura.pdf'),
+    b') NIL NIL "base64" 300 NIL NIL NIL NIL))',
+]
+
+def test_parse_dovecot_response():
+    [items] = parse_fetch_response(DOVECOT_RESPONSE)
+    assert items['UID'] == 4821
+    assert items['RFC822.SIZE'] == 8731
+    header = find_section(items, 'BODY[HEADER')
+    assert bytes(header).startswith(b'From: Jan Novak')
+
+def test_flatten_nested_multipart():
+    [items] = parse_fetch_response(DOVECOT_RESPONSE)
+    parts = flatten_bodystructure(items['BODYSTRUCTURE'])
+    assert [part['part'] for part in parts] == ['1.1', '1.2', '2']
+    plain, html, pdf = parts
+    assert plain['content_type'] == 'text/plain'
+    assert plain['charset'] == 'utf-8'
+    assert plain['encoding'] == 'quoted-printable'
+    assert plain['disposition'] is None
+    assert html['encoding'] == 'base64' and html['size'] == 400
+    assert pdf['content_type'] == 'application/pdf'
+    assert pdf['disposition'] == 'attachment'
+    # filename* z Content-Disposition má přednost před name
+    assert pdf['filename'] == 'zpráva.pdf'
+
+def test_parse_several_messages():
+    first, second = parse_fetch_response(GMAIL_RESPONSE)
+    assert (first['UID'], second['UID']) == (17, 18)
+    [part] = flatten_bodystructure(first['BODYSTRUCTURE'])
+    assert part == {'part': '1', 'content_type': 'text/plain', 'charset': 'UTF-8', 'encoding': '7bit',
+                    'size': 12, 'disposition': None, 'filename': None}
+    text, document = flatten_bodystructure(second['BODYSTRUCTURE'])
+    assert text['part'] == '1'
+    assert document['part'] == '2'
+    assert document['disposition'] == 'attachment'
+    assert document['filename'] == 'žadost.docx'
+
+def test_literal_inside_bodystructure():
+    [items] = parse_fetch_response(LITERAL_RESPONSE)
+    [part] = flatten_bodystructure(items['BODYSTRUCTURE'])
+    assert part['filename'] == 'faktura.pdf'
+    assert part['size'] == 300
+
+def test_flatten_ignores_missing_structure():
+    assert flatten_bodystructure(None) == []
+    assert flatten_bodystructure([]) == []
@@ -0,0 +1,86 @@
+# test_job_queue.py
+
+from job_queue import JobQueue
+from attachment_processor import read_content
+
+def make_job(subject='Shrnuti'):
+    return {
+        'uid': 7,
+        'sender': 'user@example.com',
+        'task': {'subject': subject},
+        'body': 'text emailu',
+        'msg': object(),
+        'attachments': [{'filename': 'a.txt', 'content_type': 'text/plain', 'size': 5, 'content': b'hello'}],
+    }
+
+def test_duplicate_source_is_rejected(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite'))
+    job = make_job()
+    assert queue.add(job, 'INBOX:1:7')
+    assert queue.contains('INBOX:1:7')
+    assert not queue.add(make_job(), 'INBOX:1:7')
+    assert queue.stats() == {'fetched': 1}
+    queue.close()
+
+def test_sent_job_still_blocks_duplicate(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite'))
+    job = make_job()
+    queue.add(job, 'INBOX:1:7')
+    queue.advance(job, 'sent')
+    assert not queue.add(make_job(), 'INBOX:1:7')
+    assert queue.pending() == []
+    queue.close()
+
+def test_resume_fetched_job_restores_attachments(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite')
+    queue = JobQueue(path)
+    job = make_job()
+    queue.add(job, 'INBOX:1:7')
+    queue.close()
+
+    # Po restartu
+    queue = JobQueue(path)
+    [(stage, resumed)] = queue.pending()
+    assert stage == 'fetched'
+    assert resumed['job_id'] == job['job_id']
+    assert resumed['body'] == 'text emailu'
+    assert 'msg' not in resumed
+    [attachment] = resumed['attachments']
+    assert attachment['filename'] == 'a.txt'
+    assert attachment['size'] == 5
+    assert read_content(attachment) == b'hello'
+    queue.close()
+
+def test_resume_from_stored_stage_drops_consumed_fields(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite')
+    queue = JobQueue(path)
+    extracted, answered = make_job('A'), make_job('B')
+    queue.add(extracted, 'INBOX:1:1')
+    queue.add(answered, 'INBOX:1:2')
+    extracted.update(content='obsah', prompt='dotaz')
+    queue.advance(extracted, 'extracted')
+    answered.update(content='obsah', prompt='dotaz', ai_response='odpověď')
+    queue.advance(answered, 'answered')
+    queue.close()
+
+    queue = JobQueue(path)
+    jobs = dict((job['task']['subject'], (stage, job)) for stage, job in queue.pending())
+    stage, job = jobs['A']
+    assert stage == 'extracted'
+    assert job['prompt'] == 'dotaz' and 'body' not in job
+    stage, job = jobs['B']
+    assert stage == 'answered'
+    assert job['ai_response'] == 'odpověď'
+    assert not {'body', 'content', 'prompt'} & set(job)
+    queue.close()
+
+def test_job_fails_after_max_attempts(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite'), max_attempts=2)
+    job = make_job()
+    queue.add(job, 'INBOX:1:7')
+    queue.fail(job, 'timeout')
+    assert [stage for stage, _ in queue.pending()] == ['fetched']
+    queue.fail(job, 'timeout')
+    assert queue.pending() == []
+    assert queue.stats() == {'failed': 1}
+    queue.close()
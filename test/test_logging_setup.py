@@ -0,0 +1,30 @@
+# test_logging_setup.py
+
+import logging
+import logging_setup
+from logging_setup import PayloadFilter, describe_payload
+
+def record(level, message):
+    return logging.LogRecord('test', level, __file__, 1, message, None, None)
+
+def test_describe_payload_hides_text():
+    description = describe_payload('tajný prompt')
+    assert 'tajný' not in description
+    assert description.startswith('12 znaků, sha256 ')
+    assert describe_payload('tajný prompt') == description
+    assert describe_payload(None) == 'bez obsahu'
+
+def test_only_debug_records_are_sampled(monkeypatch):
+    monkeypatch.setattr(logging_setup.random, 'random', lambda: 0.9)
+    payload_filter = PayloadFilter(max_chars=10, sample_rate=0.5)
+    assert not payload_filter.filter(record(logging.DEBUG, 'podrobnosti'))
+    long_warning = record(logging.WARNING, 'x' * 50)
+    assert payload_filter.filter(long_warning)
+    assert long_warning.getMessage().startswith('x' * 10 + '… [zkráceno, 50 znaků')
+    assert payload_filter.filter(record(logging.ERROR, 'chyba'))
+
+def test_hash_mode_keeps_only_prefix():
+    payload_filter = PayloadFilter(max_chars=1000, mode='hash')
+    message = record(logging.WARNING, 'y' * 2000)
+    assert payload_filter.filter(message)
+    assert message.getMessage().startswith('y' * logging_setup.HASH_MODE_PREFIX + '…')
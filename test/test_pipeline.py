@@ -0,0 +1,118 @@
+# test_pipeline.py
+
+import threading
+import time
+from pipeline import InflightBudget, Pipeline, Stage
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_jobs_pass_through_stages_in_order():
+    done = []
+    pipeline = Pipeline([
+        Stage('double', lambda job: dict(job, value=job['value'] * 2), workers=2),
+        Stage('collect', lambda job: done.append(job['value'])),
+    ])
+    pipeline.start()
+    for value in range(5):
+        pipeline.submit({'value': value})
+    pipeline.stop()
+    assert sorted(done) == [0, 2, 4, 6, 8]
+
+def test_dropped_and_failed_jobs_do_not_stop_pipeline():
+    done = []
+
+    def check(job):
+        if job['value'] == 1:
+            raise ValueError('chyba')
+        return job if job['value'] != 2 else None
+    pipeline = Pipeline([Stage('check', check), Stage('collect', lambda job: done.append(job['value']))])
+    pipeline.start()
+    for value in range(4):
+        pipeline.submit({'value': value})
+    pipeline.stop()
+    assert done == [0, 3]
+
+def test_full_queue_blocks_submit():
+    gate = threading.Event()
+    pipeline = Pipeline([Stage('slow', lambda job: gate.wait())], queue_size=1)
+    pipeline.start()
+    submitted = []
+
+    def producer():
+        for value in range(3):
+            pipeline.submit({'value': value})
+            submitted.append(value)
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    # První job zpracovává worker, druhý čeká ve frontě, třetí musí čekat
+    assert wait_until(lambda: len(submitted) == 2)
+    time.sleep(0.1)
+    assert len(submitted) == 2
+    assert pipeline.queue_depths() == {'slow': 1}
+    gate.set()
+    thread.join(timeout=2)
+    assert submitted == [0, 1, 2]
+    pipeline.stop()
+
+def test_submit_from_named_stage():
+    seen = []
+    pipeline = Pipeline([
+        Stage('first', lambda job: seen.append('first') or job),
+        Stage('second', lambda job: seen.append('second')),
+    ])
+    pipeline.start()
+    pipeline.submit({}, stage='second')
+    pipeline.stop()
+    assert seen == ['second']
+
+def test_budget_blocks_submit_until_job_finishes():
+    gate = threading.Event()
+    pipeline = Pipeline([Stage('slow', lambda job: gate.wait())], queue_size=10, max_inflight_bytes=100)
+    pipeline.start()
+    pipeline.submit({'size': 60})
+    assert pipeline.inflight_bytes == 60
+    submitted = threading.Event()
+    thread = threading.Thread(target=lambda: (pipeline.submit({'size': 60}), submitted.set()), daemon=True)
+    thread.start()
+    assert not submitted.wait(0.2)
+    gate.set()
+    assert submitted.wait(2)
+    pipeline.stop()
+    assert pipeline.inflight_bytes == 0
+
+def test_oversized_job_passes_when_nothing_runs():
+    pipeline = Pipeline([Stage('noop', lambda job: None)], max_inflight_bytes=100)
+    pipeline.start()
+    pipeline.submit({'size': 500})
+    pipeline.stop()
+    assert pipeline.inflight_bytes == 0
+
+def test_budget_is_released_by_last_stage_and_on_error():
+    def fail(job):
+        raise RuntimeError('chyba')
+    pipeline = Pipeline([Stage('pass', lambda job: job), Stage('fail', fail)], max_inflight_bytes=100)
+    pipeline.start()
+    for _ in range(5):
+        pipeline.submit({'size': 50})
+    pipeline.stop()
+    assert pipeline.inflight_bytes == 0
+
+def test_wait_for_capacity():
+    budget = InflightBudget(100)
+    budget.acquire(100)
+    freed = threading.Event()
+    thread = threading.Thread(target=lambda: (budget.wait_for_capacity(), freed.set()), daemon=True)
+    thread.start()
+    assert not freed.wait(0.2)
+    budget.release(30)
+    assert freed.wait(2)
+    # Bez limitu se nikdy nečeká
+    unlimited = InflightBudget()
+    unlimited.acquire(10 ** 9)
+    unlimited.wait_for_capacity()
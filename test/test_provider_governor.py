@@ -0,0 +1,97 @@
+# test_provider_governor.py
+
+import asyncio
+import threading
+import pytest
+import provider_governor
+from provider_governor import ProviderGovernor, RateLimited, parse_duration, report, retry_delay
+
+def test_parse_duration():
+    assert parse_duration('1.5') == 1.5
+    assert parse_duration('20ms') == 0.02
+    assert parse_duration('6m0s') == 360
+    assert parse_duration('1h2m3s') == 3723
+    assert parse_duration('brzy') is None
+
+def test_retry_delay_from_headers():
+    assert retry_delay({'retry-after-ms': '250'}) == 0.25
+    assert retry_delay({'retry-after': '3'}) == 3
+    assert retry_delay({'x-ratelimit-reset-requests': '1s', 'x-ratelimit-reset-tokens': '6m0s'}) == 360
+    # OpenRouter - sekundy nebo milisekundy od epochy
+    assert retry_delay({'x-ratelimit-reset': '1000000005'}, now=1000000000) == 5
+    assert retry_delay({'x-ratelimit-reset': '1000000005000'}, now=1000000000) == 5
+    assert retry_delay({}) is None
+
+def test_concurrency_limit_blocks_until_release():
+    governor = ProviderGovernor({'providers': {'openai': {'max_concurrency': 1}}, 'completion_tokens': 0})
+    first = governor.acquire('openai', 'm', 10)
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (governor.acquire('openai', 'other', 10), acquired.set()), daemon=True)
+    thread.start()
+    assert not acquired.wait(0.2)
+    governor.release(first)
+    assert acquired.wait(2)
+
+def test_acquire_gives_up_after_max_wait():
+    governor = ProviderGovernor({'models': {'openai:m': {'max_concurrency': 1}}, 'max_wait': 0.1})
+    assert governor.acquire('openai', 'm', 10)
+    assert governor.acquire('openai', 'm', 10) is None
+    # Limit modelu neplatí pro jiný model
+    assert governor.acquire('openai', 'other', 10)
+
+def test_token_limit_counts_prompt_and_completion(monkeypatch):
+    monkeypatch.setattr(provider_governor.time, 'monotonic', lambda: 100.0)
+    governor = ProviderGovernor({'providers': {'openai': {'tpm': 1000}}, 'completion_tokens': 300})
+    assert governor._try_acquire('openai', 'm', 600)[0]
+    permit, wait = governor._try_acquire('openai', 'm', 600)
+    # Zbývá 400 tokenů z 1000 za minutu, na 600 se čeká 12 s
+    assert permit is None and wait == pytest.approx(12)
+
+def test_rate_limited_call_is_retried(monkeypatch):
+    monkeypatch.setattr(provider_governor.random, 'uniform', lambda a, b: 0)
+    governor = ProviderGovernor({'max_retries': 2})
+    attempts = []
+
+    def func():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RateLimited('429', {'Retry-After-Ms': '50'})
+        return 'odpověď'
+    assert governor.call('openai', 'm', 10, func) == 'odpověď'
+    assert len(attempts) == 2
+    assert governor.snapshot()['openai:m']['active'] == 0
+
+def test_retries_are_limited(monkeypatch):
+    monkeypatch.setattr(provider_governor.random, 'uniform', lambda a, b: 0)
+    governor = ProviderGovernor({'max_retries': 1})
+
+    def func():
+        raise RateLimited('429', {'retry-after-ms': '10'})
+    assert governor.call('openai', 'm', 10, func) is None
+
+def test_headers_reported_during_call_update_limits():
+    governor = ProviderGovernor({'completion_tokens': 0})
+
+    def func():
+        report({'x-ratelimit-remaining-requests': '0', 'x-ratelimit-limit-requests': '60',
+                'retry-after': '30'})
+        return 'odpověď'
+    governor.call('openai', 'm', 10, func)
+    state = governor.snapshot()['openai:m']
+    assert state['requests_left'] == 0
+    assert state['backoff'] > 25
+
+def test_async_call_waits_for_slot():
+    governor = ProviderGovernor({'providers': {'ollama': {'max_concurrency': 1}}})
+    running = []
+
+    async def func():
+        running.append(1)
+        assert len(running) == 1
+        await asyncio.sleep(0.05)
+        running.pop()
+        return 'odpověď'
+
+    async def main():
+        return await asyncio.gather(*(governor.acall('ollama', 'm', 10, func) for _ in range(3)))
+    assert asyncio.run(main()) == ['odpověď'] * 3
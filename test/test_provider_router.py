@@ -0,0 +1,105 @@
+# test_provider_router.py
+
+import pytest
+import provider_router
+from provider_router import CircuitBreaker, ProviderRouter
+from ai_agent import AIAgent
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(provider_router.time, 'monotonic', clock)
+    return clock
+
+def test_breaker_opens_after_threshold_and_recovers(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record(False)
+    assert breaker.state == 'closed'
+    breaker.record(False)
+    assert breaker.state == 'open' and not breaker.allow()
+    clock.now += 60
+    assert breaker.state == 'half_open'
+    # V half_open projde jen jeden zkušební požadavek
+    assert breaker.allow() and not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == 'closed' and breaker.allow()
+
+def test_failed_trial_keeps_breaker_open(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record(False)
+    clock.now += 60
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == 'open'
+    clock.now += 30
+    assert not breaker.allow()
+
+def make_router(**routing):
+    routing.setdefault('equivalent_models', [['openai:gpt-4o-mini', 'openrouter:openai/gpt-4o-mini']])
+    return ProviderRouter(routing, ['openai', 'openrouter', 'ollama'])
+
+def default_model(api):
+    return {'ollama': 'llama3'}.get(api, 'default')
+
+def test_least_latency_prefers_faster_equivalent():
+    router = make_router()
+    router.record('openai', 'gpt-4o-mini', 2.0, True)
+    router.record('openrouter', 'openai/gpt-4o-mini', 0.5, True)
+    assert router.candidates('openai', 'gpt-4o-mini', default_model) == [
+        ('openrouter', 'openai/gpt-4o-mini'), ('openai', 'gpt-4o-mini')]
+
+def test_errors_are_penalized():
+    router = make_router()
+    router.record('openai', 'gpt-4o-mini', 1.0, True)
+    router.record('openrouter', 'openai/gpt-4o-mini', 0.5, True)
+    router.record('openrouter', 'openai/gpt-4o-mini', 0.5, False)
+    assert router.candidates('openai', 'gpt-4o-mini', default_model)[0] == ('openai', 'gpt-4o-mini')
+
+def test_failover_appends_default_model_of_fallback_api():
+    router = make_router(strategy='ordered', failover={'openai': ['ollama', 'azure']})
+    # azure není dostupné, openrouter už je mezi ekvivalenty
+    assert router.candidates('openai', 'gpt-4o-mini', default_model) == [
+        ('openai', 'gpt-4o-mini'), ('openrouter', 'openai/gpt-4o-mini'), ('ollama', 'llama3')]
+
+def test_open_breaker_is_skipped_unless_nothing_remains(clock):
+    router = make_router(strategy='ordered', failure_threshold=1)
+    router.record('openai', 'gpt-4o-mini', 1.0, False)
+    assert router.candidates('openai', 'gpt-4o-mini', default_model) == [('openrouter', 'openai/gpt-4o-mini')]
+    router.record('openrouter', 'openai/gpt-4o-mini', 1.0, False)
+    assert router.candidates('openai', 'gpt-4o-mini', default_model) == [('openai', 'gpt-4o-mini')]
+    assert router.snapshot()['openai:gpt-4o-mini']['breaker'] == 'open'
+
+def test_release_frees_unused_trial(clock):
+    router = make_router(strategy='ordered', failure_threshold=1, reset_timeout=10)
+    router.record('openai', 'gpt-4o-mini', 1.0, False)
+    clock.now += 10
+    assert ('openai', 'gpt-4o-mini') in router.candidates('openai', 'gpt-4o-mini', default_model)
+    assert ('openai', 'gpt-4o-mini') not in router.candidates('openai', 'gpt-4o-mini', default_model)
+    router.release('openai', 'gpt-4o-mini')
+    assert ('openai', 'gpt-4o-mini') in router.candidates('openai', 'gpt-4o-mini', default_model)
+
+def test_agent_fails_over_to_next_provider(clock):
+    agent = AIAgent({
+        'openrouter': {'enabled': True, 'api_key': 'k'},
+        'ollama': {'enabled': True, 'default_model': 'llama3'},
+        'routing': {'enabled': True, 'strategy': 'ordered', 'failure_threshold': 1,
+                    'failover': {'openrouter': ['ollama']}},
+    })
+    calls = []
+
+    def call_api(api, model, prompt):
+        calls.append(api)
+        return None if api == 'openrouter' else 'odpověď'
+    agent.call_api = call_api
+    assert agent.complete('openrouter', 'm', 'dotaz') == 'odpověď'
+    assert calls == ['openrouter', 'ollama']
+    # Jistič openrouteru je po chybě rozpojený, volá se rovnou záloha
+    assert agent.complete('openrouter', 'm', 'dotaz') == 'odpověď'
+    assert calls == ['openrouter', 'ollama', 'ollama']
@@ -0,0 +1,74 @@
+# test_rate_limiter.py
+
+import rate_limiter
+from rate_limiter import FixedWindow, SlidingWindow, TokenBucket, MemoryStore, SqliteStore, RateLimiter
+
+def run(algorithm, times, max_requests, time_window):
+    """Výsledky hit() pro požadavky v zadaných časech a výsledný stav"""
+    state, results = None, []
+    for now in times:
+        state, allowed = algorithm.hit(state, now, max_requests, time_window)
+        results.append(allowed)
+    return results, state
+
+def test_fixed_window_resets_after_window():
+    results, state = run(FixedWindow, [0, 1, 2, 59, 60], 2, 60)
+    assert results == [True, True, False, False, True]
+    assert FixedWindow.time_until_reset(state, 70, 60) == 50
+
+def test_fixed_window_allows_burst_at_boundary():
+    # Slabina pevného okna, kterou klouzavé okno řeší
+    results, _ = run(FixedWindow, [59, 59, 119, 119], 2, 60)
+    assert results == [True, True, True, True]
+
+def test_sliding_window_counts_previous_window():
+    results, state = run(SlidingWindow, [50, 55, 60, 61], 2, 60)
+    assert results == [True, True, False, False]
+    _, allowed = SlidingWindow.hit(state, 89, 2, 60)
+    assert not allowed
+    # V polovině okna se z předchozího počítá jen polovina
+    results, _ = run(SlidingWindow, [50, 55, 90], 2, 60)
+    assert results == [True, True, True]
+
+def test_sliding_window_time_until_reset():
+    _, state = run(SlidingWindow, [10, 20], 2, 60)
+    # Aktuální okno je plné, uvolní se až s dalším
+    assert SlidingWindow.time_until_reset(state, 30, 60) == 30
+    # V dalším okně se požadavek vejde, až podíl předchozího klesne pod 1
+    assert SlidingWindow.time_until_reset(state, 60, 60) == 30
+    assert SlidingWindow.time_until_reset(state, 100, 60) == 0
+
+def test_sliding_window_forgets_older_windows():
+    results, _ = run(SlidingWindow, [0, 1, 150], 2, 60)
+    assert results == [True, True, True]
+
+def test_token_bucket_refills_evenly():
+    results, state = run(TokenBucket, [0, 0, 0], 2, 10)
+    assert results == [True, True, False]
+    assert TokenBucket.time_until_reset(state, 0, 10) == 5
+    assert TokenBucket.time_until_reset(state, 5, 10) == 0
+    results, _ = run(TokenBucket, [0, 0, 5, 5, 20, 20, 20], 2, 10)
+    assert results == [True, True, True, False, True, True, False]
+
+def test_limiter_ignores_state_of_other_algorithm(monkeypatch):
+    store = MemoryStore(None)
+    monkeypatch.setattr(rate_limiter.time, 'time', lambda: 1000.0)
+    fixed = RateLimiter(store=store, algorithm='fixed_window')
+    assert fixed.is_allowed('a@example.com', 1, 60)
+    assert not fixed.is_allowed('a@example.com', 1, 60)
+    # Po změně algoritmu se stav pevného okna nepoužije
+    bucket = RateLimiter(store=store, algorithm='token_bucket')
+    assert bucket.is_allowed('a@example.com', 1, 60)
+    assert bucket.get_time_until_reset('a@example.com', 60) == 60
+
+def test_sqlite_store_is_shared(tmp_path, monkeypatch):
+    path = str(tmp_path / 'limits.sqlite')
+    monkeypatch.setattr(rate_limiter.time, 'time', lambda: 1000.0)
+    first = RateLimiter(store=SqliteStore(path), algorithm='sliding_window')
+    second = RateLimiter(store=SqliteStore(path), algorithm='sliding_window')
+    assert first.is_allowed('a@example.com', 2, 60)
+    assert second.is_allowed('a@example.com', 2, 60)
+    assert not first.is_allowed('a@example.com', 2, 60)
+    assert first.is_allowed('b@example.com', 2, 60)
+    first.close()
+    second.close()
@@ -0,0 +1,65 @@
+# test_response_cache.py
+
+import response_cache
+from response_cache import ResponseCache
+from ai_agent import AIAgent
+
+def test_key_ignores_whitespace_but_not_model_or_temperature():
+    key = ResponseCache.make_key('openai', 'gpt-4o-mini', 0.7, 'Shrň  text\n emailu ')
+    assert key == ResponseCache.make_key('openai', 'gpt-4o-mini', 0.7, 'Shrň text emailu')
+    assert key != ResponseCache.make_key('openai', 'gpt-4o', 0.7, 'Shrň text emailu')
+    assert key != ResponseCache.make_key('openai', 'gpt-4o-mini', 0.2, 'Shrň text emailu')
+    assert key != ResponseCache.make_key('openrouter', 'gpt-4o-mini', 0.7, 'Shrň text emailu')
+    assert key != ResponseCache.make_key('openai', 'gpt-4o-mini', 0.7, 'shrň text emailu')
+
+def test_memory_lru_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A' and cache.get('c') == 'C'
+    assert cache.stats() == {'memory_hits': 3, 'disk_hits': 0, 'misses': 1, 'evictions': 1}
+
+def test_expired_response_is_not_returned(monkeypatch, tmp_path):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    cache = ResponseCache(ttl=60, disk_path=str(tmp_path / 'cache.sqlite'))
+    cache.set('a', 'A')
+    now[0] += 60
+    assert cache.get('a') is None
+    assert cache.db.execute('SELECT COUNT(*) FROM responses').fetchone()[0] == 0
+
+def test_disk_survives_restart(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    ResponseCache(disk_path=path).set('a', 'odpověď')
+    cache = ResponseCache(disk_path=path)
+    assert cache.get('a') == 'odpověď'
+    assert cache.get('a') == 'odpověď'
+    assert cache.stats()['disk_hits'] == 1 and cache.stats()['memory_hits'] == 1
+
+def test_disk_size_limit_evicts_oldest(monkeypatch, tmp_path):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    cache = ResponseCache(disk_path=str(tmp_path / 'cache.sqlite'), disk_max_mb=1)
+    for key in 'abc':
+        now[0] += 1
+        cache.set(key, 'x' * 400 * 1024)
+    keys = [row[0] for row in cache.db.execute('SELECT key FROM responses ORDER BY key')]
+    assert keys == ['b', 'c']
+
+def test_agent_uses_cache_per_task_setting(tmp_path):
+    agent = AIAgent({
+        'ollama': {'enabled': True},
+        'response_cache': {'enabled': True, 'disk_path': str(tmp_path / 'cache.sqlite')},
+    })
+    calls = []
+    agent.call_api = lambda api, model, prompt: calls.append(prompt) or 'odpověď'
+    assert agent.complete('ollama', 'llama3', 'dotaz') == 'odpověď'
+    assert agent.complete('ollama', 'llama3', ' dotaz ') == 'odpověď'
+    assert len(calls) == 1
+    # Úkol s vypnutou cache volá poskytovatele vždy
+    agent.complete('ollama', 'llama3', 'dotaz', use_cache=False)
+    assert len(calls) == 2
+    assert AIAgent({'response_cache': {'enabled': True}}, use_cache=False).cache is None
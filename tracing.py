@@ -0,0 +1,175 @@
+# tracing.py
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from attachment_processor import read_content
+from chunker import estimate_tokens
+
+def _digest(value):
+    if isinstance(value, str):
+        value = value.encode('utf-8', 'surrogateescape')
+    return hashlib.sha256(value).hexdigest()
+
+class TraceRecorder:
+    def __init__(self, path='traces.jsonl', hash_content=True):
+        """
+        Záznam průběhu zpracování emailů pro offline přehrání (replay.py).
+
+        Každý zpracovaný email se zapíše jako jeden řádek JSON: úkol, API a
+        model, velikost promptu a odpovědi, typy a velikosti příloh a doba
+        jednotlivých stupňů. Obsah emailu se neukládá - odesílatel, tělo a
+        přílohy jsou jen jako SHA-256 (nebo vůbec, pokud hash_content=False).
+
+        Args:
+            path (str): Soubor se záznamy (JSON Lines, připisuje se na konec)
+            hash_content (bool): Ukládat hashe obsahu (pro rozpoznání opakovaných vstupů)
+        """
+        self.path = path
+        self.hash_content = hash_content
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def _hash(self, value):
+        return _digest(value) if self.hash_content else None
+
+    def start(self, job, fetch_seconds=None):
+        """
+        Založí záznam jobu (job['trace']) po stažení emailu.
+
+        Záznam je čistý JSON, takže se s jobem ukládá i do trvalé fronty
+        a po restartu se v něm pokračuje.
+        """
+        task = job['task']
+        job['trace'] = {
+            # Stejné id jako v logu, záznam lze dohledat k řádkům logu
+            'id': job.get('email_id') or uuid.uuid4().hex[:16],
+            'received': round(time.time(), 3),
+            'sender': self._hash(job['from_email'].lower()),
+            'task': task['subject'],
+            'api': task['api'],
+            'model': task['model'],
+            'output_format': task['output_format'],
+            'body_chars': len(job['body']),
+            'body_sha256': self._hash(job['body']),
+            'attachments': [
+                {
+                    'type': os.path.splitext(attachment['filename'])[1].lower().lstrip('.'),
+                    'content_type': attachment['content_type'],
+                    'size': attachment['size'],
+                    'sha256': self._hash(read_content(attachment)) if self.hash_content else None,
+                }
+                for attachment in job['attachments']
+            ],
+            'stages': {} if fetch_seconds is None else {'fetch': round(fetch_seconds, 4)},
+        }
+        return job
+
+    def _finish_stage(self, trace, name, start, result):
+        stages = trace.setdefault('stages', {})
+        stages[name] = round(stages.get(name, 0) + time.monotonic() - start, 4)
+        if result is None:
+            return
+        if name == 'extract' and result.get('prompt') is not None:
+            trace['prompt_chars'] = len(result['prompt'])
+            trace['prompt_tokens'] = estimate_tokens(result['prompt'])
+        elif name == 'ai' and result.get('ai_response') is not None:
+            trace['response_chars'] = len(result['ai_response'])
+
+    def stage(self, name, func, final=False):
+        """
+        Obalí stupeň zpracování měřením doby do job['trace'].
+
+        Zahozený nebo chybou ukončený job se zapíše jako 'failed',
+        po posledním stupni (final=True) jako 'processed'.
+        Joby bez záznamu (process_email, CLI) se jen předají dál.
+        """
+        def run(job):
+            trace = job.get('trace')
+            if trace is None:
+                return func(job)
+            start = time.monotonic()
+            try:
+                result = func(job)
+            except Exception:
+                self._finish_stage(trace, name, start, None)
+                self.record(trace, 'failed')
+                raise
+            self._finish_stage(trace, name, start, result)
+            if result is None:
+                self.record(trace, 'failed')
+            elif final:
+                self.record(trace, 'processed')
+            return result
+        return run
+
+    def stage_async(self, name, func):
+        """Obdoba stage pro asynchronní stupeň"""
+        async def run(job):
+            trace = job.get('trace')
+            if trace is None:
+                return await func(job)
+            start = time.monotonic()
+            try:
+                result = await func(job)
+            except Exception:
+                self._finish_stage(trace, name, start, None)
+                self.record(trace, 'failed')
+                raise
+            self._finish_stage(trace, name, start, result)
+            if result is None:
+                self.record(trace, 'failed')
+            return result
+        return run
+
+    def record(self, trace, outcome):
+        """Zapíše záznam jako jeden řádek JSON"""
+        line = json.dumps(dict(trace, outcome=outcome, finished=round(time.time(), 3)), ensure_ascii=False)
+        with self.lock:
+            try:
+                self.file.write(line + "\n")
+                self.file.flush()
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Nelze zapsat záznam průběhu do {self.path}: {e}")
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def load_traces(path):
+    """
+    Načte záznamy ze souboru v pořadí přijetí emailů.
+
+    Job zkoušený znovu (po chybě a restartu) má více záznamů se stejným id,
+    použije se poslední.
+    """
+    traces = {}
+    with open(path, 'r', encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                trace = json.loads(line)
+            except ValueError as e:
+                logging.warning(f"Přeskakuji neplatný záznam na řádku {number}: {e}")
+                continue
+            traces[trace['id']] = trace
+    return sorted(traces.values(), key=lambda trace: trace['received'])
+
+def create_trace_recorder(config):
+    """Vytvoří TraceRecorder podle sekce tracing konfigurace, nebo None pokud je vypnutý"""
+    tracing_config = config.get('tracing', {}) or {}
+    if not tracing_config.get('enabled', False):
+        return None
+    return TraceRecorder(
+        path=tracing_config.get('path', 'traces.jsonl'),
+        hash_content=tracing_config.get('hash_content', True)
+    )